@@ -1,25 +1,47 @@
+import asyncio
+import json
 import os
+import re
+from collections import Counter
+from datetime import datetime
 from dotenv import load_dotenv
 import pathlib
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 from google.adk.agents import Agent, SequentialAgent
-from google.adk.models.google_llm import Gemini
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.plugins.base_plugin import BasePlugin
 from google.adk.tools import google_search, AgentTool
 from google.adk.runners import InMemoryRunner
 from google.genai import types
 from database import (
-    save_transaction_tool, 
-    add_debt_tool, 
-    read_sql_query_tool, 
-    record_group_debts,
-    execute_sql_update_tool
+    save_transaction_tool,
+    save_transaction_tool_async,
+    read_sql_query_tool_async,
+    record_group_debts_async,
+    execute_sql_update_tool_async,
+    settle_up_tool_async,
+    search_records_tool_async,
+    run_in_db_thread,
+    lookup_merchant_category,
+    find_category,
+    get_open_debts,
+    get_category_spend,
+    get_category_budget,
+    journal_writes
 )
+from sessions import store as chat_sessions
+from classifier import classify_descriptions, classifier_stats
+from model_backend import get_model_backend_stats, make_model, needs_api_key
+from telemetry import Span, collect_trace
 
 # Load .env
 env_path = pathlib.Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
+# Replayed and scripted models (MODEL_BACKEND) run without one.
+if not api_key and needs_api_key():
     raise ValueError("GOOGLE_API_KEY not found in environment variables.")
 
 # Retry Config
@@ -30,12 +52,122 @@ retry_config = types.HttpRetryOptions(
     http_status_codes=[429, 500, 503, 504]
 )
 
+# --- FAST PATHS ---
+
+# Expenses for merchants we have categorised before skip the classifier and
+# saver LLM calls and go straight to save_transaction_tool. Messages listing
+# several expenses are categorised together by one batched classifier call.
+
+_AMOUNT = re.compile(
+    r"(?<![\w.])(?:rs\.?\s*|inr\s*|usd\s*|\$|₹)?(\d+(?:\.\d{1,2})?)"
+    r"(?:\s*(?:/-|rs\b\.?|inr\b|usd\b|dollars?\b|rupees?\b|bucks\b))?",
+    re.IGNORECASE,
+)
+_SPLIT_WORDS = re.compile(r"\b(split|owes?|lent|borrow(ed)?|shared?|settle[ds]?|each|for me)\b", re.IGNORECASE)
+_LEADING_VERB = re.compile(r"^(?:(?:i\s+)?(?:just\s+)?(?:spent|paid|bought|got|log|add)\b\s*)?(?:(?:on|at|for)\b)?\s*", re.IGNORECASE)
+_DANGLING_WORD = re.compile(r"\s+(?:on|at|for|of)$", re.IGNORECASE)
+_ITEM_SEPARATOR = re.compile(r"\s*(?:[,;\n]|\band\b|\bplus\b)\s*", re.IGNORECASE)
+
+expense_fast_path_stats = {"hits": 0, "misses": 0, "skipped": 0, "batched": 0, "batched_items": 0,
+                           "unclassified_items": 0}
+
+def _content_text(content) -> str:
+    if not content or not getattr(content, "parts", None):
+        return ""
+    return " ".join(part.text for part in content.parts if getattr(part, "text", None)).strip()
+
+def parse_expense(text: str) -> Optional[Tuple[str, float]]:
+    """
+    Extracts (description, amount) from a single, unsplit expense such as
+    "Starbucks $5" or "I spent 250/- on Lunch at Subway". Returns None when the
+    text is ambiguous (no amount, several amounts, or a split).
+    """
+    if not text or _SPLIT_WORDS.search(text):
+        return None
+    amounts = list(_AMOUNT.finditer(text))
+    if len(amounts) != 1:
+        return None
+    amount = float(amounts[0].group(1))
+    description = (text[:amounts[0].start()] + " " + text[amounts[0].end():]).strip(" .,!-:")
+    description = re.sub(r"\s+", " ", description)
+    description = _LEADING_VERB.sub("", description)
+    description = _DANGLING_WORD.sub("", description).strip(" .,!-:")
+    if amount <= 0 or not description:
+        return None
+    return description, amount
+
+def parse_expenses(text: str) -> Optional[List[Tuple[str, float]]]:
+    """
+    Splits a message listing several unsplit expenses, such as
+    "Coffee $4, Uber 12 and lunch 250/-", into (description, amount) pairs.
+    Returns None unless every part parses on its own.
+    """
+    if not text or _SPLIT_WORDS.search(text):
+        return None
+    parts = [part for part in _ITEM_SEPARATOR.split(text) if part and part.strip()]
+    if len(parts) < 2:
+        return None
+    items = [parse_expense(part) for part in parts]
+    if any(item is None for item in items):
+        return None
+    return items
+
+def _log_expenses_batch(items: List[Tuple[str, float]]) -> Optional[types.Content]:
+    """
+    Saves the items the batch classifier categorised. Items it could not
+    categorise are not guessed at: the reply lists them for the orchestrator
+    to send back through LogExpensePipeline one by one.
+    """
+    try:
+        categories = classify_descriptions([description for description, _ in items])
+    except Exception:
+        # Model unavailable: let the regular pipeline try.
+        return None
+    if not any(categories):
+        return None
+    results, unclassified = [], []
+    for (description, amount), category in zip(items, categories):
+        if category:
+            results.append(save_transaction_tool(description=description, amount=amount, category=category))
+        else:
+            unclassified.append(f"{description} {amount:g}")
+    expense_fast_path_stats["batched"] += 1
+    expense_fast_path_stats["batched_items"] += len(items) - len(unclassified)
+    if unclassified:
+        expense_fast_path_stats["unclassified_items"] += len(unclassified)
+        results.append(f"NOT SAVED, could not categorise: {'; '.join(unclassified)}. "
+                       "Call LogExpensePipeline again for each of these on its own.")
+    return types.Content(role="model", parts=[types.Part(text="\n".join(results))])
+
+async def log_expense_fast_path(callback_context) -> Optional[types.Content]:
+    """before_agent_callback for LogExpensePipeline: saves cache hits and multi-item lists directly."""
+    # Database and classifier calls block; keep them off the event loop.
+    return await asyncio.to_thread(_log_expense_fast_path, _content_text(callback_context.user_content))
+
+def _log_expense_fast_path(text: str) -> Optional[types.Content]:
+    parsed = parse_expense(text)
+    if not parsed:
+        items = parse_expenses(text)
+        if items:
+            return _log_expenses_batch(items)
+        expense_fast_path_stats["skipped"] += 1
+        return None
+    description, amount = parsed
+    known = lookup_merchant_category(description)
+    if not known:
+        expense_fast_path_stats["misses"] += 1
+        return None
+    expense_fast_path_stats["hits"] += 1
+    result = save_transaction_tool(description=description, amount=amount, category=known["category"])
+    return types.Content(role="model", parts=[types.Part(text=result)])
+
 # --- AGENTS ---
 
 # 1. Category Classifier
 root_agent = Agent(
     name="CategoryClassifier",
-    model=Gemini(
+    model=make_model(
+        "CategoryClassifier",
         model="gemini-2.5-flash-lite",
         api_key=api_key,
         retry_options=retry_config
@@ -59,7 +191,8 @@ root_agent = Agent(
 # 2. Transaction Saver
 saver_agent = Agent(
     name="TransactionSaver",
-    model=Gemini(
+    model=make_model(
+        "TransactionSaver",
         model="gemini-2.5-flash-lite",
         api_key=api_key,
         retry_options=retry_config
@@ -78,13 +211,14 @@ saver_agent = Agent(
         
         **Critical:** Do not hallucinate a successful save. Only report success if the tool returns it.
         """,
-    tools=[save_transaction_tool]
+    tools=[save_transaction_tool_async]
 )
 
 # 3. Splitwise Manager
 splitwise_agent = Agent(
     name="SplitwiseManager",
-    model=Gemini(
+    model=make_model(
+        "SplitwiseManager",
         model="gemini-2.5-flash-lite",
         api_key=api_key,
         retry_options=retry_config
@@ -100,6 +234,9 @@ splitwise_agent = Agent(
         Tools:
         - Use 'record_group_debts' to RECORD new debts from natural-language descriptions.
         - Use 'read_sql_query_tool' to READ existing debts from the 'debts' table.
+        - Use 'settle_up_tool' for NET balances ("who owes whom overall", "how do we settle up");
+          it returns each person's net and the fewest transfers, so never sum debts rows yourself.
+          Pass mark_settled=true ONLY when the user says everyone has settled up.
         
         Recording debts (record_group_debts):
         - This tool handles one-to-one, one-to-many, many-to-one, and many-to-many.
@@ -134,24 +271,26 @@ splitwise_agent = Agent(
         - Call read_sql_query_tool with a single SELECT statement.
         - Then summarize the result for the user in clear natural language.
         """,
-    tools=[record_group_debts, read_sql_query_tool]
+    tools=[record_group_debts_async, read_sql_query_tool_async, settle_up_tool_async]
 )
 
 # 4. Update Manager
 update_agent = Agent(
     name="UpdateManager",
-    model=Gemini(
+    model=make_model(
+        "UpdateManager",
         model="gemini-2.5-flash-lite",
         api_key=api_key,
         generation_config={"temperature": 0.2}
     ),
-    tools=[read_sql_query_tool, execute_sql_update_tool],
+    tools=[search_records_tool_async, read_sql_query_tool_async, execute_sql_update_tool_async],
     description="Updates categories, budgets, transactions, and debts in the database.",
     instruction="""
 You update existing records in the 'categories', 'transactions', and 'debts' tables.
 
 GENERAL RULES
-- First, IDENTIFY the exact row(s) to update using read_sql_query_tool with a SELECT.
+- First, IDENTIFY the exact row(s) to update: by keywords with search_records_tool, otherwise
+  using read_sql_query_tool with a SELECT.
 - Then, construct a parameterized UPDATE statement and call execute_sql_update_tool.
 - Always confirm back to the user what was changed.
 - Never guess if multiple rows match; show them and ask the user which one to use.
@@ -164,22 +303,19 @@ CATEGORIES / BUDGETS (table: categories)
   - UPDATE categories SET name = <new_name> WHERE name = <old_name>.
 
 TRANSACTIONS (table: transactions)
-- To locate transactions, you can filter by:
-  - description (using WHERE description LIKE '%keyword%'),
+- To locate transactions by description or category keywords, call
+  search_records_tool(keywords=<keywords>, kind="transactions"). Never use LIKE '%keyword%':
+  it reads every row. Results come best match first; pass order="recent" to get the newest first.
+- With read_sql_query_tool you can also filter by:
   - timestamp (WHERE timestamp = 'YYYY-MM-DD' or BETWEEN ...),
   - amount,
-  - category (using WHERE category LIKE '%keyword%'),
+  - category (WHERE category = '<name>'),
   - or id if the user mentions it.
 
 - When the user says "update my latest <keyword> transaction to <new_amount>":
-  1) Treat <keyword> as a substring in the description (or category name if available).
-  2) Call read_sql_query_tool with a query like:
-     SELECT id, timestamp, description, amount, category
-     FROM transactions
-     WHERE description LIKE '%' || <keyword> || '%'
-     ORDER BY date DESC, id DESC
-     LIMIT 1;
-  3) If this returns exactly 1 row, construct an UPDATE:
+  1) Call search_records_tool(keywords=<keyword>, kind="transactions", order="recent").
+  2) The first row is the latest match; the default order="relevance" would not put it first.
+  3) Construct an UPDATE for that row:
      UPDATE transactions
      SET amount = <new_amount>
      WHERE id = <that row's id>;
@@ -189,18 +325,20 @@ TRANSACTIONS (table: transactions)
      and ask the user to pick one.
 
 - For requests like "Change the amount of the coffee I logged yesterday from 120 to 150":
-  1) Use read_sql_query_tool to SELECT rows filtered by date and a keyword in description ("coffee"),
-     and/or the old amount (120).
+  1) Call search_records_tool(keywords="coffee", kind="transactions") and keep the rows from
+     that date and/or with the old amount (120).
   2) If you find exactly one row, UPDATE that row's amount to 150.
   3) If multiple rows match, show them and ask which one to update.
 
 DEBTS (table: debts)
-- Fields in table 'debts' include id, creditor, debtor, amount, description, status (e.g., 'settled' / 'unsettled').
-- To locate debts, you can filter by:
-  - description (using WHERE description LIKE '%keyword%'),
+- Fields in table 'debts' include id, creditor, debtor, amount, description, status (e.g., 'settled' / 'unsettled'),
+  and split_id (shared by all debts recorded for one group expense; to settle a whole split,
+  update WHERE split_id = '...').
+- To locate debts by description keywords, call search_records_tool(keywords=<keywords>, kind="debts").
+- With read_sql_query_tool you can also filter by:
   - timestamp (WHERE timestamp = 'YYYY-MM-DD' or BETWEEN ...),
   - amount,
-  - category (using WHERE category LIKE '%keyword%'),
+  - creditor / debtor,
   - status,
   - or id if the user mentions it.
 - "Mark my debt to John for 200 as settled":
@@ -213,7 +351,8 @@ DEBTS (table: debts)
 
 AMBIGUITY HANDLING
 - If you are not sure which row the user refers to (no rows or multiple rows):
-  - Use read_sql_query_tool to show a small list of candidate rows (id, date, description, amount, etc.).
+  - Show a small list of candidate rows (id, date, description, amount, etc.) from search_records_tool
+    or read_sql_query_tool.
   - Ask the user to clarify (for example, by giving a date, id, or description snippet).
 - Never update multiple rows at once unless the user explicitly asks for a bulk change.
 """
@@ -227,6 +366,7 @@ log_expense_pipeline = SequentialAgent(
         "1) classify, 2) save transaction"
     ),
     sub_agents=[root_agent, saver_agent],
+    before_agent_callback=log_expense_fast_path,
 )
 
 # --- WRAP SUB-AGENTS AS TOOLS ---
@@ -237,12 +377,14 @@ update_tool = AgentTool(agent=update_agent)
 # 6. Orchestrator
 orchestrator_agent = Agent(
     name="ExpenseOrchestrator",
-    model=Gemini(
+    model=make_model(
+        "ExpenseOrchestrator",
         model="gemini-2.5-flash-lite",
         api_key=api_key,
         generation_config={"temperature": 0.4}
     ),
-    tools=[log_expense_tool, splitwise_tool, read_sql_query_tool, record_group_debts, update_tool],
+    tools=[log_expense_tool, splitwise_tool, read_sql_query_tool_async, search_records_tool_async,
+           record_group_debts_async, update_tool, settle_up_tool_async],
     description="Coordinates expense categorization, saving, querying, and debt management for the user.",
     instruction="""
     You are the Chief Financial Coordinator.
@@ -251,6 +393,9 @@ orchestrator_agent = Agent(
     1. Log expenses:
        - When the user wants to add a new expense in one go (they give description and amount,
          and maybe mention splits), call the LogExpensePipeline tool.
+       - If the user lists several expenses in one message, call LogExpensePipeline ONCE
+         with the whole list; it categorises them together. If its reply lists items as
+         NOT SAVED, call LogExpensePipeline again once per listed item.
        - LogExpensePipeline will:
          1) classify the expense,
          2) save the transaction,
@@ -279,6 +424,10 @@ orchestrator_agent = Agent(
       - call SplitwiseManager for complex/adjustment-only scenarios.
     - If the user asks "Whom do I have to pay?", "Who has to pay me?", or "Who has settled?",
       call read_sql_query_tool with queries on the 'debts' table and then summarize the result.
+    - If the user asks for net balances or how to settle up ("who owes whom overall?"),
+      call settle_up_tool and summarize its transfers.
+    - If the user asks to find transactions or debts by what they were for ("show my Uber rides",
+      "what was the rent debt?"), call search_records_tool with those keywords.
 
     Always:
     - Use tools for calculations and database access.
@@ -286,33 +435,251 @@ orchestrator_agent = Agent(
     """
 )
 
+# --- INTENT ROUTER ---
+
+# High-frequency questions answered locally from parameterised queries instead
+# of an orchestrator -> AgentTool -> sub-agent round trip. Anything that does
+# not match exactly (including unknown category names) goes to the LLM.
+
+_GREETING = re.compile(
+    r"^(?:hi+|hello+|hey+|hiya|yo|good (?:morning|afternoon|evening)|thanks?(?: you)?|thank you)"
+    r"(?: there)?[\s!.]*$", re.IGNORECASE)
+_I_OWE = re.compile(
+    r"^(?:whom?|who all) (?:do|should|must) i (?:have to |need to )?(?:pay|owe)"
+    r"(?: money)?(?: to)?\??$|^what do i owe\??$", re.IGNORECASE)
+_OWED_TO_ME = re.compile(
+    r"^who (?:all )?(?:has to|have to|needs to|need to|should|must) pay me(?: back)?\??$"
+    r"|^who (?:all )?owes? me(?: money)?\??$", re.IGNORECASE)
+_CATEGORY_SPEND = re.compile(
+    r"^how much (?:did|have) i (?:spend|spent) on (?P<category>[a-z &]+?)"
+    r"(?P<this_month> this month)?\??$", re.IGNORECASE)
+_CATEGORY_BUDGET = re.compile(
+    r"^(?:what(?:'s| is) )?my (?P<category>[a-z &]+?) budget"
+    r"(?: and how much is left)?\??$"
+    r"|^how much is left (?:in|of) my (?P<category2>[a-z &]+?) budget\??$", re.IGNORECASE)
+
+router_stats: Dict[str, Any] = {"messages": 0, "routed": 0, "fallback": 0, "by_intent": Counter()}
+
+def _money(amount: float) -> str:
+    return f"${amount:,.2f}"
+
+def _answer_greeting(match) -> str:
+    return ("Hello! I can log expenses, split bills, track who owes whom, and answer "
+            "questions about your spending and budgets. What would you like to do?")
+
+def _answer_i_owe(match) -> str:
+    debts = get_open_debts("owed_by")
+    if not debts:
+        return "You don't owe anyone right now."
+    lines = [f"- {d['counterparty']}: {_money(d['amount'])} for {d['description']}" for d in debts]
+    total = sum(d["amount"] for d in debts)
+    return "You have to pay:\n" + "\n".join(lines) + f"\n\nTotal: {_money(total)}"
+
+def _answer_owed_to_me(match) -> str:
+    debts = get_open_debts("owed_to")
+    if not debts:
+        return "Nobody owes you anything right now."
+    lines = [f"- {d['counterparty']}: {_money(d['amount'])} for {d['description']}" for d in debts]
+    total = sum(d["amount"] for d in debts)
+    return "These people have to pay you:\n" + "\n".join(lines) + f"\n\nTotal: {_money(total)}"
+
+def _answer_category_spend(match) -> Optional[str]:
+    category = find_category(match.group("category"))
+    if not category:
+        return None
+    if match.group("this_month"):
+        month = int(datetime.now().strftime("%Y%m"))
+        return f"You have spent {_money(get_category_spend(category, month))} on {category} this month."
+    return f"You have spent {_money(get_category_spend(category))} on {category} in total."
+
+def _answer_category_budget(match) -> Optional[str]:
+    category = find_category(match.group("category") or match.group("category2"))
+    month = int(datetime.now().strftime("%Y%m"))
+    budget = get_category_budget(category, month) if category else None
+    if not budget:
+        return None
+    if budget["remaining"] < 0:
+        left = f"you are {_money(-budget['remaining'])} over budget"
+    else:
+        left = f"{_money(budget['remaining'])} is left"
+    return (f"Your monthly {budget['category']} budget is {_money(budget['budget'])}. "
+            f"You have spent {_money(budget['spent'])} this month, so {left}.")
+
+INTENTS: Tuple[Tuple[str, "re.Pattern", Callable], ...] = (
+    ("greeting", _GREETING, _answer_greeting),
+    ("debts_i_owe", _I_OWE, _answer_i_owe),
+    ("debts_owed_to_me", _OWED_TO_ME, _answer_owed_to_me),
+    ("category_spend", _CATEGORY_SPEND, _answer_category_spend),
+    ("category_budget", _CATEGORY_BUDGET, _answer_category_budget),
+)
+
+def route_message(message: str) -> Optional[str]:
+    """Answer for a recognised intent, or None to fall back to the orchestrator."""
+    router_stats["messages"] += 1
+    text = re.sub(r"\s+", " ", message or "").strip()
+    for name, pattern, answer in INTENTS:
+        match = pattern.match(text)
+        if match:
+            reply = answer(match)
+            if reply is not None:
+                router_stats["routed"] += 1
+                router_stats["by_intent"][name] += 1
+                return reply
+    router_stats["fallback"] += 1
+    return None
+
+def get_router_stats() -> Dict[str, Any]:
+    messages = router_stats["messages"]
+    return {
+        "messages": messages,
+        "routed": router_stats["routed"],
+        "fallback": router_stats["fallback"],
+        "hit_rate": round(router_stats["routed"] / messages, 4) if messages else 0.0,
+        "by_intent": dict(router_stats["by_intent"]),
+        "expense_fast_path": dict(expense_fast_path_stats),
+        "batch_classifier": dict(classifier_stats),
+        "model_backend": get_model_backend_stats(),
+    }
+
+# --- Tracing ---
+# Agent runs and tool calls become "agent" and "tool" spans (model calls are
+# timed in model_backend, SQL statements in database). AgentTool hands the
+# runner's plugins to the sub-agent's runner, so nested agents are traced too.
+
+class TracingPlugin(BasePlugin):
+    def __init__(self):
+        super().__init__(name="tracing")
+        self._agents: Dict[Tuple[str, str], Span] = {}
+        self._tools: Dict[str, Span] = {}
+
+    async def before_agent_callback(self, *, agent, callback_context):
+        self._agents[(callback_context.invocation_id, agent.name)] = Span("agent", agent.name)
+
+    async def after_agent_callback(self, *, agent, callback_context):
+        started = self._agents.pop((callback_context.invocation_id, agent.name), None)
+        if started:
+            started.end()
+
+    async def after_run_callback(self, *, invocation_context):
+        # Agents cut short by a before_agent_callback (the expense fast path)
+        # never reach after_agent_callback; close them with the invocation.
+        for key in [key for key in self._agents if key[0] == invocation_context.invocation_id]:
+            self._agents.pop(key).end()
+
+    async def before_tool_callback(self, *, tool, tool_args, tool_context):
+        self._tools[tool_context.function_call_id] = Span("tool", tool.name)
+
+    async def after_tool_callback(self, *, tool, tool_args, tool_context, result):
+        started = self._tools.pop(tool_context.function_call_id, None)
+        if started:
+            started.end()
+
+    async def on_tool_error_callback(self, *, tool, tool_args, tool_context, error):
+        started = self._tools.pop(tool_context.function_call_id, None)
+        if started:
+            started.end(error)
+
 # --- RUNNER ---
-runner = InMemoryRunner(agent=orchestrator_agent, app_name="agents")
-
-async def process_chat(message: str) -> str:
-    # run_debug returns a list of events
-    events = await runner.run_debug(message)
-    
-    # Extract text from the last event that has it
-    for event in reversed(events):
-        # Check for 'text' attribute directly
-        if hasattr(event, "text") and event.text:
-            return event.text
-        
-        # Check for 'parts' in 'content' (common in Gemini response events)
-        if hasattr(event, "parts"):
-             # event.parts is likely a list of Part objects
-             for part in event.parts:
-                 if hasattr(part, "text") and part.text:
-                     return part.text
-        
-        # Fallback: check content attribute
-        if hasattr(event, "content") and event.content:
-            # If content is a ModelResponse or similar object with parts
-            if hasattr(event.content, "parts"):
-                for part in event.content.parts:
-                    if hasattr(part, "text") and part.text:
-                        return part.text
-            return str(event.content)
-            
-    return "No response from agent."
+runner = InMemoryRunner(agent=orchestrator_agent, app_name="agents", plugins=[TracingPlugin()])
+
+# --- Chat turns ---
+# Each turn runs in a throwaway ADK session; continuity comes from the bounded
+# per-user history in sessions.py, replayed as a short preamble.
+TOOL_RESULT_PREVIEW_CHARS = 500
+
+def _event_text(event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(part.text for part in event.content.parts if part.text and not part.thought)
+
+def _preview(value: Any) -> str:
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    if len(text) > TOOL_RESULT_PREVIEW_CHARS:
+        text = text[:TOOL_RESULT_PREVIEW_CHARS] + "..."
+    return text
+
+async def stream_chat(message: str, session_id: Optional[str] = None,
+                      trace: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs one chat turn for `session_id` and yields progress events as they happen.
+    Without a session_id the turn starts a new session; its id is on the final event.
+
+    Event shapes:
+        {"type": "text", "author": ..., "text": ...}          partial model text
+        {"type": "tool_call", "id": ..., "name": ..., "args": {...}}
+        {"type": "tool_result", "id": ..., "name": ..., "result": "..."}
+        {"type": "final", "text": ..., "session_id": ...}      always last
+
+    With trace=True the final event also carries "trace": every span of the
+    turn (chat, agent, model, tool, sql) with its start offset and duration.
+    """
+    final = None
+    with (collect_trace() if trace else nullcontext()) as collected:
+        turn = Span("chat", "agents")
+        try:
+            async for event in _chat_turn(message, session_id, turn):
+                if event["type"] == "final":
+                    final = event
+                else:
+                    yield event
+        except GeneratorExit:
+            turn.end()
+            raise
+        except BaseException as e:
+            turn.end(e)
+            raise
+        turn.end()
+    if collected is not None:
+        final["trace"] = collected.to_list()
+    yield final
+
+async def _chat_turn(message: str, session_id: Optional[str], turn: Span) -> AsyncIterator[Dict[str, Any]]:
+    session = chat_sessions.get(session_id)
+
+    reply = await run_in_db_thread(route_message, message)
+    if reply is not None:
+        turn.name = "router"
+        chat_sessions.record_turn(session, message, reply)
+        yield {"type": "final", "text": reply, "session_id": session.session_id}
+        return
+
+    service = runner.session_service
+    adk_session = await service.create_session(app_name=runner.app_name, user_id=session.session_id)
+    prompt = chat_sessions.build_prompt(session, message)
+    content = types.Content(role="user", parts=[types.Part(text=prompt)])
+    run_config = RunConfig(streaming_mode=StreamingMode.SSE)
+
+    final_text = None
+    with journal_writes() as saved:
+        try:
+            async for event in runner.run_async(
+                user_id=session.session_id, session_id=adk_session.id, new_message=content, run_config=run_config
+            ):
+                for call in event.get_function_calls():
+                    yield {"type": "tool_call", "id": call.id, "name": call.name, "args": call.args or {}}
+                for response in event.get_function_responses():
+                    yield {"type": "tool_result", "id": response.id, "name": response.name,
+                           "result": _preview(response.response)}
+
+                text = _event_text(event)
+                if not text:
+                    continue
+                if event.partial:
+                    yield {"type": "text", "author": event.author, "text": text}
+                elif event.is_final_response():
+                    # With SSE the closing non-partial event carries the full text again.
+                    final_text = text
+        finally:
+            await service.delete_session(app_name=runner.app_name, user_id=session.session_id, session_id=adk_session.id)
+
+    final_text = final_text or "No response from agent."
+    chat_sessions.record_turn(session, message, final_text, saved)
+    yield {"type": "final", "text": final_text, "session_id": session.session_id}
+
+async def process_chat(message: str, session_id: Optional[str] = None, trace: bool = False) -> Dict[str, Any]:
+    """Runs one chat turn to completion; returns its final event (see stream_chat)."""
+    final = {"type": "final", "text": "No response from agent.", "session_id": session_id}
+    async for event in stream_chat(message, session_id, trace):
+        if event["type"] == "final":
+            final = event
+    return final
@@ -0,0 +1,80 @@
+"""
+Benchmarks for the database layer and the HTTP API.
+
+    cd backend
+    python -m benchmarks --size 10k --out results.json
+
+`generate` builds seeded synthetic databases, `bench_db` times the functions
+in database.py, `bench_api` times the endpoints through the ASGI app and
+`bench_chat` times whole chat turns through the agents. All results are plain
+JSON so runs can be diffed across commits.
+
+Benchmarks never reach the live model: MODEL_BACKEND defaults to "scripted"
+here. Set MODEL_BACKEND=replay (and MODEL_CASSETTE) to replay recorded
+Gemini answers instead, and MODEL_LATENCY_MS to simulate provider latency.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Read by model_backend when agents is first imported.
+os.environ.setdefault("MODEL_BACKEND", "scripted")
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    ordered = sorted(samples)
+    ms = lambda seconds: round(seconds * 1000, 4)
+    return {
+        "runs": len(ordered),
+        "min_ms": ms(ordered[0]),
+        "median_ms": ms(statistics.median(ordered)),
+        "p95_ms": ms(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]),
+        "max_ms": ms(ordered[-1]),
+        "mean_ms": ms(statistics.fmean(ordered)),
+        "ops_per_sec": round(len(ordered) / sum(ordered), 2) if sum(ordered) else None,
+    }
+
+def measure(func: Callable[[], Any], repeat: int, warmup: int = 1,
+            before_each: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """Runs `func` warmup + repeat times and summarizes the timed runs."""
+    samples = []
+    for i in range(warmup + repeat):
+        if before_each:
+            before_each()
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            samples.append(elapsed)
+    return summarize(samples)
+
+def environment() -> Dict[str, Any]:
+    """What the numbers were measured on, so runs can be compared fairly."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    import sqlite3
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def write_results(results: Dict[str, Any], path: Optional[str]):
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,46 @@
+import argparse
+import os
+import time
+
+from benchmarks import DATA_DIR, SIZES, environment, write_results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmark database.py and the API on synthetic data.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="10k",
+                        help="Transactions in the generated database (debts are a tenth of that).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per benchmark.")
+    parser.add_argument("--concurrency", type=int, default=8, help="In-flight requests for API throughput.")
+    parser.add_argument("--only", choices=["db", "api", "chat"], help="Run a single suite.")
+    parser.add_argument("--regenerate", action="store_true", help="Rebuild the database even if it exists.")
+    parser.add_argument("--out", help="Write results to this JSON file instead of stdout.")
+    args = parser.parse_args()
+
+    from benchmarks import bench_api, bench_chat, bench_db, generate
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    db_path = os.path.join(DATA_DIR, f"{args.size}-seed{args.seed}.db")
+    results = {"environment": environment(), "size": args.size, "transactions": SIZES[args.size],
+               "seed": args.seed, "repeat": args.repeat}
+    if args.regenerate or not os.path.exists(db_path):
+        print(f"Generating {db_path} ...")
+        results["generate"] = generate.generate(db_path, SIZES[args.size], seed=args.seed)
+
+    started = time.perf_counter()
+    if args.only in (None, "db"):
+        print("Running database benchmarks ...")
+        results["db"] = bench_db.run(db_path, args.repeat)
+    if args.only in (None, "api"):
+        print("Running API benchmarks ...")
+        results["api"] = bench_api.run(db_path, args.repeat, args.concurrency)
+    if args.only in (None, "chat"):
+        print("Running chat benchmarks ...")
+        results["chat"] = bench_chat.run(db_path, args.repeat)
+    results["seconds"] = round(time.perf_counter() - started, 2)
+    write_results(results, args.out)
+
+
+if __name__ == "__main__":
+    main()
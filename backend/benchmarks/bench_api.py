@@ -0,0 +1,112 @@
+"""
+Endpoint latency and throughput, in process through the ASGI app.
+
+No server or network is involved, so the numbers cover routing, validation,
+middleware, serialisation and the database work behind each endpoint. Chat
+turns are timed separately, in bench_chat.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Tuple
+
+import database
+from benchmarks import summarize
+
+ENDPOINTS: List[Tuple[str, Dict[str, Any]]] = [
+    ("/transactions", {}),
+    ("/transactions", {"q": "coffee"}),
+    ("/transactions", {"category": "Dining", "limit": 200}),
+    ("/insights", {}),
+    ("/insights", {"period": "all"}),
+    ("/stats", {}),
+    ("/stats", {"from": "2023-02-10", "to": "2024-08-20"}),
+    ("/timeseries", {"granularity": "day", "by_category": "true"}),
+    ("/timeseries", {"granularity": "month", "period": "all", "by_category": "true"}),
+    ("/debts/settle-plan", {}),
+    ("/cache/stats", {}),
+]
+
+def _label(path: str, params: Dict[str, Any]) -> str:
+    query = "&".join(f"{k}={v}" for k, v in params.items())
+    return f"{path}?{query}" if query else path
+
+async def _latency(client, path: str, params: Dict[str, Any], repeat: int, cold: bool) -> Dict[str, Any]:
+    samples = []
+    for i in range(repeat + 1):
+        if cold:
+            database._query_results.clear()
+        started = time.perf_counter()
+        response = await client.get(path, params=params)
+        elapsed = time.perf_counter() - started
+        response.raise_for_status()
+        if i:
+            samples.append(elapsed)
+    return summarize(samples)
+
+async def _throughput(client, path: str, params: Dict[str, Any], requests: int,
+                      concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: List[float] = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(path, params=params)
+            samples.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - started
+    return {**summarize(samples), "concurrency": concurrency,
+            "requests_per_sec": round(requests / wall, 2)}
+
+async def _run(repeat: int, concurrency: int) -> Dict[str, Any]:
+    import httpx
+    from main import app
+
+    results: Dict[str, Any] = {"latency": {}, "throughput": {}}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path, params in ENDPOINTS:
+            label = _label(path, params)
+            results["latency"][label] = {
+                "cold": await _latency(client, path, params, repeat, cold=True),
+                "warm": await _latency(client, path, params, repeat, cold=False),
+            }
+            results["throughput"][label] = await _throughput(client, path, params,
+                                                             repeat * concurrency, concurrency)
+
+        # Revalidation: a client holding the current ETag gets a bodiless 304.
+        etag = (await client.get("/stats")).headers["etag"]
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = await client.get("/stats", headers={"If-None-Match": etag})
+            samples.append(time.perf_counter() - started)
+            assert response.status_code == 304, response.status_code
+        results["latency"]["/stats (If-None-Match)"] = {"warm": summarize(samples)}
+    return results
+
+def run(db_path: str, repeat: int = 20, concurrency: int = 8) -> Dict[str, Any]:
+    """
+    Times the read endpoints against `db_path`.
+
+    Args:
+        db_path: A database created by benchmarks.generate. Only read from.
+        repeat: Sequential requests per endpoint and mode.
+        concurrency: In-flight requests for the throughput runs.
+
+    Returns:
+        {"latency": {endpoint: {"cold": summary, "warm": summary}},
+         "throughput": {endpoint: summary + requests_per_sec}}
+    """
+    previous = database.DB_FILE
+    database.DB_FILE = db_path
+    try:
+        database.init_db()
+        return asyncio.run(_run(repeat, concurrency))
+    finally:
+        database.close_pool()
+        database.DB_FILE = previous
+        database._query_results.clear()
@@ -0,0 +1,69 @@
+"""
+Whole chat turns through the agents, with the model replaced by MODEL_BACKEND.
+
+What is left is our own overhead: routing, the agent hops (AgentTool,
+SequentialAgent), tool dispatch to the database thread pool and the writes
+themselves. Add MODEL_LATENCY_MS to see how that overhead compares with a
+realistic provider.
+"""
+import asyncio
+import os
+import shutil
+import time
+from typing import Any, Dict, List
+
+import database
+from benchmarks import summarize
+
+# One message per agent path.
+MESSAGES: List[str] = [
+    "Dunder Mifflin paper 40",              # orchestrator -> pipeline -> classifier -> saver
+    "Coffee $4, Uber 12 and lunch 25",      # pipeline fast path, batch classifier
+    "Dinner 90 with John and Sarah",        # orchestrator -> SplitwiseManager -> record_group_debts
+    "how much did I spend on each category?",  # orchestrator -> read_sql_query_tool
+    "settle up",                            # orchestrator -> settle_up_tool
+    "change my latest coffee to 5",         # orchestrator -> UpdateManager -> read_sql_query_tool
+]
+
+async def _run(repeat: int) -> Dict[str, Any]:
+    import agents
+
+    samples: Dict[str, List[float]] = {message: [] for message in MESSAGES}
+    tool_calls: Dict[str, int] = {}
+    for round_ in range(repeat + 1):
+        for message in MESSAGES:
+            started = time.perf_counter()
+            calls = 0
+            async for event in agents.stream_chat(message, session_id=f"bench-{round_}"):
+                calls += event["type"] == "tool_call"
+            if round_:
+                samples[message].append(time.perf_counter() - started)
+                tool_calls[message] = calls
+    return {
+        "model_backend": agents.get_router_stats()["model_backend"],
+        "latency_ms_setting": os.getenv("MODEL_LATENCY_MS", "0"),
+        "turns": {message: {**summarize(samples[message]), "tool_calls": tool_calls[message]}
+                  for message in MESSAGES},
+    }
+
+def run(db_path: str, repeat: int = 20) -> Dict[str, Any]:
+    """
+    Times each message in MESSAGES as a full chat turn, on a scratch copy of `db_path`.
+
+    Returns:
+        {"model_backend": {...}, "turns": {message: summary + tool_calls}}
+    """
+    scratch = db_path + ".chat"
+    shutil.copyfile(db_path, scratch)
+    previous = database.DB_FILE
+    database.DB_FILE = scratch
+    try:
+        database.init_db()
+        return asyncio.run(_run(repeat))
+    finally:
+        database.close_pool()
+        database.DB_FILE = previous
+        database._query_results.clear()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(scratch + suffix):
+                os.remove(scratch + suffix)
@@ -0,0 +1,98 @@
+"""
+Micro-benchmarks for database.py.
+
+Reads are timed twice: "cold" clears the result cache before every run so the
+query itself is measured, "warm" measures what repeat requests see. Writes run
+against a scratch copy of the generated database so it can be reused.
+"""
+import os
+import shutil
+from typing import Any, Callable, Dict, List, Tuple
+
+import database
+from benchmarks import measure
+
+# name -> call. Each is timed cold and warm.
+READS: List[Tuple[str, Callable[[], Any]]] = [
+    ("get_all_transactions", database.get_all_transactions),
+    ("get_transactions", lambda: database.get_transactions()),
+    ("get_transactions.search", lambda: database.get_transactions(q="coffee")),
+    ("get_transactions.category", lambda: database.get_transactions(category="Dining")),
+    ("search_records", lambda: database.search_records("uber")),
+    ("search_records.recent", lambda: database.search_records("uber", order="recent")),
+    ("search_records.debts", lambda: database.search_records("rent", kind="debts")),
+    ("get_category_totals", lambda: database.get_category_totals()),
+    ("get_category_totals.year", lambda: database.get_category_totals(period="year")),
+    ("get_category_totals.range", lambda: database.get_category_totals(date_from="2023-02-10",
+                                                                        date_to="2024-08-20")),
+    ("get_dashboard_stats", lambda: database.get_dashboard_stats()),
+    ("get_dashboard_stats.all", lambda: database.get_dashboard_stats(period="all")),
+    ("get_spend_timeseries.day", lambda: database.get_spend_timeseries("day", by_category=True)),
+    ("get_spend_timeseries.week", lambda: database.get_spend_timeseries("week", period="all")),
+    ("get_spend_timeseries.month", lambda: database.get_spend_timeseries("month", by_category=True,
+                                                                          period="all")),
+    ("get_settle_plan", database.get_settle_plan),
+    ("get_open_debts", lambda: database.get_open_debts("owed_to")),
+    ("get_category_spend", lambda: database.get_category_spend("Dining")),
+    ("get_category_budget", lambda: database.get_category_budget("Groceries", 202412)),
+    ("find_category", lambda: database.find_category("dining")),
+    ("read_sql_query_tool", lambda: database.read_sql_query_tool(
+        "SELECT category, SUM(amount) FROM transactions GROUP BY category")),
+]
+
+def _clear_caches():
+    database._query_results.clear()
+    database._forget_merchant_lookups()
+
+def _writes() -> List[Tuple[str, Callable[[], Any]]]:
+    return [
+        ("save_transaction_tool", lambda: database.save_transaction_tool("Bench coffee", 4.5, "Dining")),
+        ("add_debt_tool", lambda: database.add_debt_tool("John", "Me", 12.0, "Bench lunch", "unsettled")),
+        ("record_group_debts", lambda: database.record_group_debts(
+            "Me", "Me, John, Sarah", 90.0, "Bench dinner")),
+        ("execute_sql_update_tool", lambda: database.execute_sql_update_tool(
+            "UPDATE categories SET budget = budget WHERE name = :name", {"name": "Dining"})),
+        ("lookup_merchant_category", lambda: (database._forget_merchant_lookups(),
+                                              database.lookup_merchant_category("Starbucks latte"))),
+    ]
+
+def run(db_path: str, repeat: int = 20) -> Dict[str, Any]:
+    """
+    Times every benchmark against `db_path`.
+
+    Args:
+        db_path: A database created by benchmarks.generate.
+        repeat: Timed runs per benchmark (after one warm-up run).
+
+    Returns:
+        {"reads": {name: {"cold": summary, "warm": summary}}, "writes": {name: summary}}
+    """
+    scratch = db_path + ".scratch"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(scratch + suffix):
+            os.remove(scratch + suffix)
+    shutil.copyfile(db_path, scratch)
+
+    previous = database.DB_FILE
+    database.DB_FILE = scratch
+    try:
+        database.init_db()
+        reads = {}
+        for name, call in READS:
+            reads[name] = {
+                "cold": measure(call, repeat, before_each=_clear_caches),
+                "warm": measure(call, repeat),
+            }
+        writes = {name: measure(call, repeat) for name, call in _writes()}
+        # Reads right after a write pay for the cache being dropped.
+        writes["save_then_dashboard"] = measure(
+            lambda: (database.save_transaction_tool("Bench bagel", 3.0, "Dining"),
+                     database.get_dashboard_stats()), repeat)
+    finally:
+        database.close_pool()
+        database.DB_FILE = previous
+        _clear_caches()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(scratch + suffix):
+                os.remove(scratch + suffix)
+    return {"reads": reads, "writes": writes}
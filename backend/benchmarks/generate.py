@@ -0,0 +1,132 @@
+"""
+Seeded synthetic data in the expense.db schema.
+
+    python -m benchmarks.generate --transactions 1000000 --out benchmarks/data/1m.db
+
+The same seed and sizes always produce the same rows.
+"""
+import argparse
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import database
+from migrations import run_migrations
+
+# Category -> (share of transactions, typical amount, merchants).
+CATEGORY_PROFILES: Dict[str, Tuple[float, float, List[str]]] = {
+    "Groceries": (0.24, 45.0, ["Walmart", "Whole Foods", "Trader Joe's", "Costco", "Kroger", "Aldi", "Safeway"]),
+    "Dining": (0.22, 18.0, ["Starbucks", "McDonald's", "Chipotle", "Subway", "Domino's Pizza", "Local Cafe",
+                            "Sushi Place", "Taco Bell", "Panera Bread"]),
+    "Transport": (0.16, 22.0, ["Uber", "Lyft", "Shell", "Chevron", "Metro Card", "Parking Garage"]),
+    "Shopping": (0.13, 60.0, ["Amazon", "Target", "Best Buy", "IKEA", "Zara", "Nike"]),
+    "Entertainment": (0.08, 25.0, ["Netflix", "Spotify", "AMC Theatres", "Steam", "Concert Tickets"]),
+    "Bills": (0.07, 120.0, ["Electricity", "Water Utility", "Internet Provider", "Phone Bill", "Rent"]),
+    "Health": (0.05, 40.0, ["CVS Pharmacy", "Walgreens", "Dentist", "Gym Membership"]),
+    "Others": (0.05, 30.0, ["Gift", "Donation", "Misc Store"]),
+}
+PEOPLE = ["John", "Sarah", "Bob", "Rafael", "Priya", "Chen", "Amara", "Lukas", "Sofia", "Omar"]
+HISTORY_DAYS = 3 * 365
+INSERT_CHUNK = 50_000
+# Schema version the rows are inserted at; init_db() applies the rest.
+BULK_LOAD_SCHEMA = 6
+# Weekend days get more spending than weekdays.
+WEEKDAY_WEIGHTS = [0.8, 0.8, 0.9, 0.9, 1.1, 1.4, 1.3]
+
+def _amount(rng: random.Random, typical: float) -> int:
+    """Log-normal around `typical`, in minor units: mostly small, occasionally large."""
+    return max(50, int(rng.lognormvariate(math.log(typical), 0.6) * 100))
+
+def _timestamps(rng: random.Random, end: datetime, days: int) -> Iterator[int]:
+    start = end - timedelta(days=days)
+    day_weights = [WEEKDAY_WEIGHTS[(start + timedelta(days=d)).weekday()] for d in range(days)]
+    base = database.to_epoch(start)
+    while True:
+        day = rng.choices(range(days), weights=day_weights)[0]
+        # Daytime-heavy: centred on early afternoon.
+        seconds = int(min(86399, max(0, rng.gauss(13.5 * 3600, 4 * 3600))))
+        yield base + day * 86400 + seconds
+
+def transaction_rows(count: int, seed: int, end: Optional[datetime] = None) -> Iterator[tuple]:
+    rng = random.Random(seed)
+    categories = list(CATEGORY_PROFILES)
+    weights = [CATEGORY_PROFILES[c][0] for c in categories]
+    stamps = _timestamps(rng, end or datetime(2025, 1, 1), HISTORY_DAYS)
+    for _ in range(count):
+        category = rng.choices(categories, weights=weights)[0]
+        _, typical, merchants = CATEGORY_PROFILES[category]
+        # A few favourite merchants take most of the spend.
+        merchant = merchants[min(len(merchants) - 1, int(rng.expovariate(0.7)))]
+        yield (next(stamps), merchant, _amount(rng, typical), category, "None")
+
+def debt_rows(count: int, seed: int, end: Optional[datetime] = None) -> Iterator[tuple]:
+    rng = random.Random(seed + 1)
+    stamps = _timestamps(rng, end or datetime(2025, 1, 1), HISTORY_DAYS)
+    descriptions = ["Dinner", "Cab", "Groceries", "Movie", "Trip", "Rent share", "Concert"]
+    for i in range(count):
+        other = rng.choice(PEOPLE)
+        debtor, creditor = (other, "Me") if rng.random() < 0.6 else ("Me", other)
+        status = "settled" if rng.random() < 0.6 else "unsettled"
+        yield (debtor, creditor, _amount(rng, 25.0), rng.choice(descriptions), next(stamps), status,
+               f"bench-{i // 3}")
+
+def _chunks(rows: Iterator[tuple], size: int) -> Iterator[List[tuple]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def generate(path: str, transactions: int, debts: Optional[int] = None, seed: int = 42) -> Dict[str, float]:
+    """
+    Creates a fresh database at `path` with the current schema and synthetic
+    rows. Debts default to a tenth of the transactions.
+    """
+    debts = transactions // 10 if debts is None else debts
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    previous = database.DB_FILE
+    database.DB_FILE = path
+    started = time.perf_counter()
+    try:
+        with database.write_transaction() as conn:
+            # Load before the full-text index exists: migration 7 then indexes
+            # every row in one pass, several times faster than its triggers do
+            # row by row.
+            run_migrations(conn, target=BULK_LOAD_SCHEMA)
+            for chunk in _chunks(transaction_rows(transactions, seed), INSERT_CHUNK):
+                conn.executemany("INSERT INTO transactions_store (ts, description, amount_minor, category, "
+                                 "split_details) VALUES (?, ?, ?, ?, ?)", chunk)
+            for chunk in _chunks(debt_rows(debts, seed), INSERT_CHUNK):
+                conn.executemany("INSERT INTO debts_store (debtor, creditor, amount_minor, description, ts, "
+                                 "status, split_id) VALUES (?, ?, ?, ?, ?, ?, ?)", chunk)
+        database.init_db()
+        with database.write_transaction() as conn:
+            conn.execute("DELETE FROM merchant_categories")
+            database._seed_merchant_categories(conn)
+            conn.execute("ANALYZE")
+        database.close_pool()
+    finally:
+        database.DB_FILE = previous
+    return {"transactions": transactions, "debts": debts, "seed": seed,
+            "seconds": round(time.perf_counter() - started, 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=10_000)
+    parser.add_argument("--debts", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    print(generate(args.out, args.transactions, args.debts, args.seed))
+
+if __name__ == "__main__":
+    main()
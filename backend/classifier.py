@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from database import lookup_merchant_category
+
+# --- Batch classification ---
+#
+# Categorises many descriptions with one model request instead of one
+# CategoryClassifier run per item. Known merchants are answered from the
+# merchant cache first; the rest go to the model in batches of up to
+# CLASSIFY_BATCH_SIZE, and only items the batch got wrong (missing, or not a
+# standard category) are retried one at a time.
+
+STANDARD_CATEGORIES = [
+    "Groceries", "Dining", "Transport", "Bills", "Shopping",
+    "Entertainment", "Health", "Investment", "Others",
+]
+CLASSIFIER_MODEL = os.getenv("CLASSIFIER_MODEL", "gemini-2.5-flash-lite")
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "50"))
+
+classifier_stats: Dict[str, int] = {
+    "items": 0, "cache_hits": 0, "batch_calls": 0, "fallback_calls": 0, "unclassified": 0,
+}
+
+class ClassifiedItem(BaseModel):
+    description: str
+    category: str
+
+_client = None
+_client_lock = threading.Lock()
+
+def _get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from google.genai import Client, types
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise ValueError("GOOGLE_API_KEY not found in environment variables.")
+            retry = types.HttpRetryOptions(attempts=5, exp_base=7, initial_delay=1,
+                                           http_status_codes=[429, 500, 503, 504])
+            _client = Client(api_key=api_key, http_options=types.HttpOptions(retry_options=retry))
+        return _client
+
+def _generate(prompt: str, schema: Any, descriptions: List[str]) -> Any:
+    from google.genai import types
+    from model_backend import complete, guess_category
+
+    def live() -> str:
+        response = _get_client().models.generate_content(
+            model=CLASSIFIER_MODEL,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                temperature=0,
+                response_mime_type="application/json",
+                response_schema=schema,
+            ),
+        )
+        return response.text or "null"
+
+    def script() -> str:
+        items = [{"description": d, "category": guess_category(d)} for d in descriptions]
+        return json.dumps(items if schema is not ClassifiedItem else items[0])
+
+    return json.loads(complete("BatchClassifier", [CLASSIFIER_MODEL, prompt, str(schema)], live, script))
+
+def standard_category(name: Optional[str]) -> Optional[str]:
+    """The standard spelling of `name`, or None if it is not a standard category."""
+    if not name:
+        return None
+    lowered = name.strip().lower()
+    for category in STANDARD_CATEGORIES:
+        if category.lower() == lowered:
+            return category
+    return None
+
+def _prompt(descriptions: List[str]) -> str:
+    items = "\n".join(f"- {d}" for d in descriptions)
+    return (
+        "Classify each expense description into exactly one of these categories: "
+        f"{', '.join(STANDARD_CATEGORIES)}.\n"
+        "Return a JSON array with one {\"description\", \"category\"} object per input, "
+        "in the same order, copying each description exactly.\n\n"
+        f"Descriptions:\n{items}"
+    )
+
+def _classify_batch(descriptions: List[str]) -> Dict[str, str]:
+    """One model call for up to CLASSIFY_BATCH_SIZE descriptions; valid answers only."""
+    classifier_stats["batch_calls"] += 1
+    try:
+        answer = _generate(_prompt(descriptions), list[ClassifiedItem], descriptions)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(answer, list):
+        return {}
+    wanted = set(descriptions)
+    result = {}
+    for position, item in enumerate(answer):
+        if not isinstance(item, dict):
+            continue
+        category = standard_category(item.get("category"))
+        description = item.get("description")
+        if description not in wanted and position < len(descriptions) and len(answer) == len(descriptions):
+            # The model paraphrased the description; trust the order instead.
+            description = descriptions[position]
+        if category and description in wanted:
+            result[description] = category
+    return result
+
+def _classify_one(description: str) -> Optional[str]:
+    classifier_stats["fallback_calls"] += 1
+    try:
+        answer = _generate(_prompt([description]), ClassifiedItem, [description])
+    except json.JSONDecodeError:
+        return None
+    return standard_category(answer.get("category")) if isinstance(answer, dict) else None
+
+def classify_descriptions(descriptions: List[str], use_cache: bool = True) -> List[Optional[str]]:
+    """
+    Categorises each description, in order.
+
+    Args:
+        descriptions: Expense descriptions, e.g. ["Uber to airport", "Starbucks"].
+        use_cache: Answer known merchants from the merchant cache first.
+
+    Returns:
+        A standard category per description, or None where even the per-item
+        retry gave no valid category. Model client errors (network, auth)
+        propagate, so bulk callers can fall back for the whole batch.
+    """
+    classifier_stats["items"] += len(descriptions)
+    found: Dict[str, Optional[str]] = {}
+    pending: List[str] = []
+    for description in dict.fromkeys(descriptions):
+        known = lookup_merchant_category(description) if use_cache else None
+        if known:
+            classifier_stats["cache_hits"] += 1
+            found[description] = known["category"]
+        else:
+            pending.append(description)
+
+    for start in range(0, len(pending), CLASSIFY_BATCH_SIZE):
+        batch = pending[start:start + CLASSIFY_BATCH_SIZE]
+        found.update(_classify_batch(batch))
+        for description in batch:
+            if description not in found:
+                found[description] = _classify_one(description)
+                if found[description] is None:
+                    classifier_stats["unclassified"] += 1
+
+    return [found.get(description) for description in descriptions]
@@ -1,10 +1,57 @@
+import asyncio
+import base64
+import calendar
+import contextvars
+import functools
+import heapq
+import json
+import os
+import pathlib
+import queue
+import re
 import sqlite3
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+import time
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
 from pydantic import BaseModel
 from collections import defaultdict
+from cache import LRUCache
+from migrations import run_migrations
+from telemetry import TracedConnection
 
 DB_FILE = "expense.db"
+READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", "4"))
+
+_NOT_CACHED = object()
+
+# --- Storage conversions ---
+#
+# Amounts are stored as integer minor units (cents) and timestamps as epoch
+# seconds of the local wall-clock time (treated as UTC, so a stored value
+# always formats back to the exact string that was written). The `transactions`
+# and `debts` views, and the models below, expose the original shape.
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def to_minor_units(amount: float) -> int:
+    return int(Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+
+def from_minor_units(minor: Optional[int]) -> float:
+    return (minor or 0) / 100
+
+def to_epoch(value: datetime) -> int:
+    return calendar.timegm(value.timetuple())
+
+def format_epoch(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+def now_epoch() -> int:
+    return to_epoch(datetime.now())
 
 class Transaction(BaseModel):
     id: int
@@ -14,6 +61,18 @@ class Transaction(BaseModel):
     category: str
     split_details: Optional[str] = None
 
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Transaction":
+        """Builds a Transaction from a transactions_store row."""
+        return cls(
+            id=row["id"],
+            timestamp=format_epoch(row["ts"]),
+            description=row["description"] or "",
+            amount=from_minor_units(row["amount_minor"]),
+            category=row["category"] or "",
+            split_details=row["split_details"],
+        )
+
 class Category(BaseModel):
     id: int
     name: str
@@ -27,45 +86,754 @@ class Debt(BaseModel):
     description: str
     timestamp: str
     status: str
+    split_id: Optional[str] = None
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS transactions
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  timestamp TEXT,
-                  description TEXT,
-                  amount REAL,
-                  category TEXT,
-                  split_details TEXT)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS categories
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT UNIQUE,
-                  budget REAL)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS debts
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  debtor TEXT,
-                  creditor TEXT,
-                  amount REAL,
-                  description TEXT,
-                  timestamp TEXT,
-                  status TEXT)''')
-    
-    c.execute("SELECT count(*) FROM categories")
-    if c.fetchone()[0] == 0:
-        defaults = [('Dining', 200), ('Groceries', 300), ('Transport', 100), 
-                    ('Entertainment', 150), ('Shopping', 200), ('Bills', 500), ('Others', 100)]
-        c.executemany("INSERT INTO categories (name, budget) VALUES (?, ?)", defaults)
-        
-    conn.commit()
-    conn.close()
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Debt":
+        """Builds a Debt from a debts_store row."""
+        return cls(
+            id=row["id"],
+            debtor=row["debtor"] or "",
+            creditor=row["creditor"] or "",
+            amount=from_minor_units(row["amount_minor"]),
+            description=row["description"] or "",
+            timestamp=format_epoch(row["ts"]),
+            status=row["status"] or "",
+            split_id=row["split_id"],
+        )
+
+# --- Connection pool ---
+
+# Applied to every pooled connection. WAL lets readers run while the writer
+# commits; NORMAL sync is durable across app crashes in WAL mode and avoids an
+# fsync per transaction.
+CONNECTION_PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",      # ~16 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+)
+
+class ConnectionPool:
+    """
+    One long-lived writer connection plus up to `readers` reader connections.
+
+    SQLite allows a single writer at a time, so writes are serialised on a lock
+    instead of failing with "database is locked"; readers never wait for it
+    because the database runs in WAL mode.
+    """
+
+    def __init__(self, path: str, readers: int = READER_POOL_SIZE,
+                 on_writer_open: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.path = path
+        self.on_writer_open = on_writer_open
+        self._write_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._idle_readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(max(1, readers))
+        self._closed = False
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        # isolation_level=None: no implicit BEGIN, transactions are explicit.
+        if readonly:
+            # Readers open the file with mode=ro, so even a statement that slips
+            # past a SELECT check (e.g. LLM-written SQL) cannot modify data.
+            uri = pathlib.Path(self.path).absolute().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False,
+                                   factory=TracedConnection)
+        else:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                   factory=TracedConnection)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _get_writer(self) -> sqlite3.Connection:
+        if self._writer is None:
+            self._writer = self._connect()
+            self._writer.execute("PRAGMA journal_mode = WAL")
+            if self.on_writer_open:
+                self.on_writer_open(self._writer)
+        return self._writer
+
+    @contextmanager
+    def writer(self):
+        """Yields the writer connection inside a BEGIN IMMEDIATE transaction."""
+        with self._write_lock:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed.")
+            conn = self._get_writer()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    @contextmanager
+    def reader(self):
+        """Yields a read-only, autocommit reader connection from the pool."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed.")
+        # Make sure the file is in WAL mode before the first reader opens it.
+        if self._writer is None:
+            with self._write_lock:
+                self._get_writer()
+        self._reader_slots.acquire()
+        try:
+            try:
+                conn = self._idle_readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect(readonly=True)
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                if self._closed:
+                    conn.close()
+                else:
+                    self._idle_readers.put(conn)
+        finally:
+            self._reader_slots.release()
+
+    def close(self):
+        self._closed = True
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._idle_readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Returns the process-wide pool for DB_FILE, creating it on first use."""
+    global _pool
+    if _pool is None or _pool.path != DB_FILE:
+        with _pool_lock:
+            if _pool is None or _pool.path != DB_FILE:
+                if _pool is not None:
+                    _pool.close()
+                _pool = ConnectionPool(DB_FILE, on_writer_open=_prepare_writer)
+    return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+@contextmanager
+def read_connection():
+    """Context manager for read-only work: `with read_connection() as conn: ...`"""
+    with get_pool().reader() as conn:
+        yield conn
+
+@contextmanager
+def write_transaction():
+    """Context manager for writes; commits on success, rolls back on error."""
+    with get_pool().writer() as conn:
+        changes_before = conn.total_changes
+        yield conn
+        changed = conn.total_changes != changes_before
+    # Bumped only after the commit, so a reader that sees the new generation
+    # also sees the new data.
+    if changed:
+        _bump_data_generation()
+
+# --- Async access ---
+
+# sqlite3 blocks, so async callers (chat turns, agent tools) hand work to a
+# thread pool sized like the connection pool: concurrent turns then wait on
+# pooled connections instead of on the event loop.
+_db_executor = ThreadPoolExecutor(max_workers=READER_POOL_SIZE + 1, thread_name_prefix="db")
+
+async def run_in_db_thread(func: Callable, *args, **kwargs) -> Any:
+    """Runs `func` on the database thread pool, keeping the caller's context variables."""
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, call)
+
+def async_tool(func: Callable) -> Callable:
+    """
+    Async variant of a blocking tool. functools.wraps keeps the name,
+    signature and docstring, so agents see the same tool declaration.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_in_db_thread(func, *args, **kwargs)
+    return wrapper
+
+# --- Read result cache ---
+
+# Results of read-only queries are cached under the data generation that was
+# current when the query started. Every committed write bumps the generation,
+# so stale entries can never be served; they are dropped on the bump.
+# The counter is per process: run a single worker, or accept that writes made
+# by other processes are not seen until this one writes too.
+
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+_data_generation = 0
+_generation_lock = threading.Lock()
+# Distinguishes generation N of this process from generation N of a previous one.
+_boot_id = uuid.uuid4().hex[:8]
+
+def _result_size(value: Any) -> int:
+    return len(value) if isinstance(value, str) else len(repr(value))
+
+_query_results = LRUCache(max_entries=1024, max_bytes=QUERY_CACHE_MAX_BYTES, sizeof=_result_size)
+
+def data_generation() -> int:
+    return _data_generation
+
+def data_version() -> str:
+    """Opaque version of the stored data, changed by every committed write."""
+    return f"{_boot_id}-{_data_generation}"
+
+def _bump_data_generation():
+    global _data_generation
+    with _generation_lock:
+        _data_generation += 1
+    _query_results.clear()
+
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+def normalize_sql(query: str) -> str:
+    """
+    Cache key form of a statement: whitespace collapsed and case folded outside
+    of quoted literals (which SQLite compares case-sensitively), trailing ';' removed.
+    """
+    parts = _QUOTED.split(query.strip().rstrip(";").strip())
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i]).lower()
+    return "".join(parts)
+
+# Statements whose result depends on the clock or a random source, not just on
+# the stored data; read_sql_query_tool does not cache them.
+_VOLATILE_SQL = re.compile(
+    r"'now'|\bcurrent_(?:date|time|timestamp)\b|\blocaltime\b|\brandom(?:blob)?\s*\("
+    r"|\b(?:date|time|datetime|julianday|unixepoch)\s*\(\s*\)", re.IGNORECASE)
+
+def cached_read(func: Callable) -> Callable:
+    """
+    Caches a read-only helper's result per (arguments, data generation).
+    Callers must treat the returned objects as read-only.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        generation = _data_generation
+        key = (func.__name__, args, tuple(sorted(kwargs.items())), generation)
+        result = _query_results.get(key, _NOT_CACHED)
+        if result is _NOT_CACHED:
+            result = func(*args, **kwargs)
+            _query_results.set(key, result)
+        return result
+    return wrapper
+
+def query_cache_stats() -> Dict[str, Any]:
+    return {"data_generation": _data_generation, **_query_results.stats()}
+
+# --- Write journal ---
+# Ids of rows created by the tools inside a journal_writes() block (one chat
+# turn), so the conversation can remember what it saved without re-reading
+# tool output.
+_write_journal: contextvars.ContextVar[Optional[Dict[str, List[int]]]] = contextvars.ContextVar(
+    "write_journal", default=None)
+
+@contextmanager
+def journal_writes():
+    journal: Dict[str, List[int]] = {"transactions": [], "debts": []}
+    token = _write_journal.set(journal)
+    try:
+        yield journal
+    finally:
+        try:
+            _write_journal.reset(token)
+        except ValueError:
+            # Closed from another context (abandoned stream); nothing to undo there.
+            pass
+
+def _journal_write(kind: str, row_id: int):
+    journal = _write_journal.get()
+    if journal is not None:
+        journal[kind].append(row_id)
+
+def init_db() -> List[int]:
+    """Brings the schema up to date. Returns the migration versions applied."""
+    with write_transaction() as conn:
+        applied = run_migrations(conn)
+    # A separate transaction: after a write to an FTS5 table SQLite refuses
+    # create_function() until the transaction commits.
+    with write_transaction() as conn:
+        _prepare_writer(conn)
+        _seed_merchant_categories(conn)
+        # Cheap when nothing changed; refreshes planner stats when needed.
+        conn.execute("PRAGMA optimize")
+    return applied
+
+def _prepare_writer(conn: sqlite3.Connection):
+    """Per-connection setup for the writer: SQL functions and TEMP triggers."""
+    conn.create_function("merchant_key", 1, _merchant_key, deterministic=True)
+    conn.create_function("forget_merchant_lookup", 1, _forget_merchant_lookup)
+    has_store = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'transactions_store'").fetchone()
+    if has_store:
+        # A TEMP trigger because it calls Python functions that only exist on
+        # this connection. Category edits (UpdateManager) are user corrections,
+        # filed under the description's most specific merchant key.
+        conn.execute("""
+            CREATE TEMP TRIGGER IF NOT EXISTS merchant_category_correction
+            AFTER UPDATE OF category ON transactions_store
+            WHEN NEW.category IS NOT OLD.category AND merchant_key(NEW.description) != ''
+            BEGIN
+                INSERT INTO merchant_categories (merchant, category, source, hits, updated_ts)
+                VALUES (merchant_key(NEW.description), NEW.category, 'user', 1,
+                        CAST(strftime('%s', 'now', 'localtime') AS INTEGER))
+                ON CONFLICT (merchant) DO UPDATE SET
+                    category = excluded.category,
+                    source = 'user',
+                    updated_ts = excluded.updated_ts;
+                SELECT forget_merchant_lookup(merchant_key(NEW.description));
+            END""")
+
+# --- Spend rollups ---
+
+# Running totals, in minor units, per category and per (category, YYYYMM month)
+# live in category_totals / category_month_totals. Triggers on
+# transactions_store keep them in step with every write, in the same transaction.
+
+def _rebuild_spend_rollups(c: sqlite3.Cursor):
+    c.execute("DELETE FROM category_totals")
+    c.execute("DELETE FROM category_month_totals")
+    c.execute("""INSERT INTO category_totals (category, total_minor, txn_count)
+                 SELECT IFNULL(category, ''), SUM(amount_minor), COUNT(*)
+                 FROM transactions_store GROUP BY 1""")
+    c.execute("""INSERT INTO category_month_totals (category, month, total_minor, txn_count)
+                 SELECT IFNULL(category, ''), month, SUM(amount_minor), COUNT(*)
+                 FROM transactions_store GROUP BY 1, 2""")
+
+def check_spend_rollups(repair: bool = True) -> Dict[str, Any]:
+    """
+    Consistency check: recomputes the rollups from transactions_store and
+    compares them with the stored ones.
+
+    Args:
+        repair: Rebuild both rollup tables from scratch when they disagree.
+
+    Returns:
+        {"mismatches": [...], "category_totals_mismatched": int, "repaired": bool}
+    """
+    compare_sql = """
+        WITH fresh AS (
+            SELECT IFNULL(category, '') AS category, month,
+                   SUM(amount_minor) AS total_minor, COUNT(*) AS txn_count
+            FROM transactions_store GROUP BY 1, 2
+        ),
+        stored AS (
+            SELECT category, month, total_minor, txn_count FROM category_month_totals WHERE txn_count != 0
+        ),
+        keys AS (SELECT category, month FROM fresh UNION SELECT category, month FROM stored)
+        SELECT k.category, k.month,
+               f.total_minor AS expected_total_minor, s.total_minor AS stored_total_minor,
+               IFNULL(f.txn_count, 0) AS expected_count, IFNULL(s.txn_count, 0) AS stored_count
+        FROM keys k
+        LEFT JOIN fresh f ON f.category = k.category AND f.month IS k.month
+        LEFT JOIN stored s ON s.category = k.category AND s.month IS k.month
+        WHERE IFNULL(f.txn_count, 0) != IFNULL(s.txn_count, 0)
+           OR IFNULL(f.total_minor, 0) != IFNULL(s.total_minor, 0)
+    """
+    totals_sql = """
+        SELECT COUNT(*) FROM category_totals t
+        LEFT JOIN (SELECT category, SUM(total_minor) AS total_minor, SUM(txn_count) AS txn_count
+                   FROM category_month_totals GROUP BY category) m ON m.category = t.category
+        WHERE t.txn_count != IFNULL(m.txn_count, 0) OR t.total_minor != IFNULL(m.total_minor, 0)
+    """
+    with write_transaction() as conn:
+        mismatches = [dict(row) for row in conn.execute(compare_sql)]
+        totals_off = conn.execute(totals_sql).fetchone()[0]
+        repaired = bool(repair and (mismatches or totals_off))
+        if repaired:
+            _rebuild_spend_rollups(conn.cursor())
+    return {"mismatches": mismatches, "category_totals_mismatched": totals_off, "repaired": repaired}
+
+# --- Merchant -> category cache ---
+
+# Category lookups for merchants seen before, so repeat expenses can skip the
+# CategoryClassifier. Entries persist in merchant_categories (seeded from
+# transaction history, updated by every save, overridden by user corrections)
+# with an in-memory LRU in front of the table.
+#
+# A description is filed under its leading MERCHANT_KEY_WORDS words. A
+# multi-word description only falls back to its one-word key ("starbucks" for
+# "Starbucks latte") once MERCHANT_PREFIX_MIN_VARIANTS different two-word keys
+# under it agreed on one category, so "Uber Eats burger" is not sent to
+# Transport just because "Uber" rides were.
+
+MERCHANT_LOOKUP_TTL = int(os.getenv("MERCHANT_LOOKUP_TTL", "3600"))
+MERCHANT_ENTRY_MAX_AGE = int(os.getenv("MERCHANT_ENTRY_MAX_AGE", str(180 * 86400)))
+MERCHANT_PREFIX_MIN_VARIANTS = int(os.getenv("MERCHANT_PREFIX_MIN_VARIANTS", "2"))
+MERCHANT_KEY_WORDS = 2
+
+_merchant_lookups = LRUCache(max_entries=4096, ttl=MERCHANT_LOOKUP_TTL)
+
+_NON_WORD = re.compile(r"[^a-z0-9&' ]+")
+_NUMBER = re.compile(r"\b\d+(?:[.,]\d+)?\b")
+_FILLER_WORDS = {
+    "i", "me", "my", "we", "spent", "spend", "paid", "pay", "bought", "buy", "got",
+    "on", "at", "for", "from", "to", "in", "of", "with", "a", "an", "the", "some",
+    "rs", "inr", "usd", "dollar", "dollars", "rupee", "rupees", "bucks",
+    "today", "yesterday", "just",
+}
+
+def normalize_merchant(text: Optional[str]) -> str:
+    """
+    Canonical merchant key: lower-case words with amounts, punctuation and
+    filler removed, e.g. "I spent $5 at Starbucks!" -> "starbucks".
+    """
+    if not text:
+        return ""
+    text = _NON_WORD.sub(" ", _NUMBER.sub(" ", text.lower()))
+    words = [w.strip("'") for w in text.split()]
+    return " ".join(w for w in words if w and w not in _FILLER_WORDS)
+
+def merchant_keys(text: Optional[str]) -> List[str]:
+    """
+    Keys a description is filed under, most specific first: its leading
+    MERCHANT_KEY_WORDS normalized words, then its first word, e.g.
+    "Starbucks latte" -> ["starbucks latte", "starbucks"], "Uber" -> ["uber"].
+    """
+    words = normalize_merchant(text).split()[:MERCHANT_KEY_WORDS]
+    return [" ".join(words[:size]) for size in range(len(words), 0, -1)]
+
+def _merchant_key(text: Optional[str]) -> str:
+    """SQL function merchant_key(description): the most specific of merchant_keys(), or ''."""
+    keys = merchant_keys(text)
+    return keys[0] if keys else ""
+
+def _forget_merchant_lookups():
+    _merchant_lookups.clear()
+
+def _forget_merchant_lookup(key: str):
+    _merchant_lookups.pop(key)
+
+def _generalises(entry: Dict[str, Any]) -> bool:
+    """Whether a one-word entry may answer for a multi-word description it is a prefix of."""
+    return not entry["mixed"] and entry["variants"] >= MERCHANT_PREFIX_MIN_VARIANTS
+
+def lookup_merchant_category(text: str) -> Optional[Dict[str, str]]:
+    """
+    Known category for the merchant mentioned in `text`, or None.
+
+    Returns:
+        {"merchant": ..., "category": ..., "source": "user"|"classifier"|"history"}
+    """
+    keys = merchant_keys(text)
+    if not keys:
+        return None
+    # The LRU holds one entry per key (None for a known miss), so a learned
+    # key only invalidates itself.
+    found = {}
+    for key in keys:
+        cached = _merchant_lookups.get(key, _NOT_CACHED)
+        if cached is not _NOT_CACHED:
+            found[key] = cached
+    missing = [key for key in keys if key not in found]
+    if missing:
+        placeholders = ", ".join("?" * len(missing))
+        with read_connection() as conn:
+            rows = conn.execute(
+                f"SELECT merchant, category, source, variants, mixed, updated_ts "
+                f"FROM merchant_categories WHERE merchant IN ({placeholders})", missing).fetchall()
+        oldest = now_epoch() - MERCHANT_ENTRY_MAX_AGE
+        stored = {row["merchant"]: {"merchant": row["merchant"], "category": row["category"],
+                                    "source": row["source"], "variants": row["variants"],
+                                    "mixed": row["mixed"]}
+                  for row in rows if row["source"] == "user" or row["updated_ts"] >= oldest}
+        for key in missing:
+            found[key] = stored.get(key)
+            _merchant_lookups.set(key, found[key])
+    entry = found[keys[0]]
+    if entry is None and len(keys) > 1 and found[keys[-1]] and _generalises(found[keys[-1]]):
+        entry = found[keys[-1]]
+    if entry is None:
+        return None
+    return {"merchant": entry["merchant"], "category": entry["category"], "source": entry["source"]}
+
+def learn_merchant_category(c: sqlite3.Cursor, description: str, category: str,
+                             source: str = "classifier"):
+    """
+    Records description -> category under its most specific merchant key,
+    inside the caller's write transaction. For a multi-word description the
+    one-word key only gains a variant (or is marked mixed); its own category
+    is set by single-word descriptions or the first variant seen.
+    """
+    if not category:
+        return
+    keys = merchant_keys(description)
+    if not keys:
+        return
+    key = keys[0]
+    c.execute("SELECT category, source FROM merchant_categories WHERE merchant = ?", (key,))
+    existing = c.fetchone()
+    if existing and existing["source"] == "user" and source != "user":
+        # A user correction wins over what the classifier says later.
+        c.execute("UPDATE merchant_categories SET hits = hits + 1 WHERE merchant = ?", (key,))
+    else:
+        c.execute("""INSERT INTO merchant_categories (merchant, category, source, hits, updated_ts)
+                     VALUES (?, ?, ?, 1, ?)
+                     ON CONFLICT (merchant) DO UPDATE SET
+                         category = excluded.category,
+                         source = excluded.source,
+                         hits = hits + 1,
+                         mixed = mixed OR category != excluded.category,
+                         updated_ts = excluded.updated_ts""", (key, category, source, now_epoch()))
+        if existing is None or existing["category"] != category:
+            _forget_merchant_lookup(key)
+    if len(keys) == 1:
+        return
+    prefix = keys[-1]
+    c.execute("SELECT category, variants, mixed FROM merchant_categories WHERE merchant = ?", (prefix,))
+    before = c.fetchone()
+    c.execute("""INSERT INTO merchant_categories (merchant, category, source, hits, variants, updated_ts)
+                 VALUES (?, ?, ?, 1, 1, ?)
+                 ON CONFLICT (merchant) DO UPDATE SET
+                     hits = hits + 1,
+                     variants = variants + ?,
+                     mixed = mixed OR category != excluded.category,
+                     updated_ts = excluded.updated_ts""",
+              (prefix, category, source, now_epoch(), int(existing is None)))
+    if before is None or existing is None or (before["category"] != category and not before["mixed"]):
+        _forget_merchant_lookup(prefix)
+
+def _seed_merchant_categories(conn: sqlite3.Connection):
+    """
+    Fills merchant_categories from the most common category per merchant key,
+    unless it already holds learned entries. User corrections are kept.
+    """
+    if conn.execute("SELECT EXISTS (SELECT 1 FROM merchant_categories WHERE source != 'user')").fetchone()[0]:
+        return
+    counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    variants: Dict[str, Set[str]] = defaultdict(set)
+    rows = conn.execute("""SELECT description, category, COUNT(*) AS n FROM transactions_store
+                           WHERE category IS NOT NULL AND category != ''
+                           GROUP BY description, category""")
+    for row in rows:
+        keys = merchant_keys(row["description"])
+        for key in keys:
+            counts[key][row["category"]] += row["n"]
+        if len(keys) > 1:
+            variants[keys[-1]].add(keys[0])
+    now = now_epoch()
+    conn.executemany(
+        "INSERT INTO merchant_categories (merchant, category, source, hits, variants, mixed, updated_ts) "
+        "VALUES (?, ?, 'history', ?, ?, ?, ?) ON CONFLICT (merchant) DO NOTHING",
+        [(key, max(by_cat, key=by_cat.get), sum(by_cat.values()), len(variants.get(key, ())),
+          int(len(by_cat) > 1), now)
+         for key, by_cat in counts.items()])
+    _forget_merchant_lookups()
+
+def merchant_cache_stats() -> Dict[str, Any]:
+    return _merchant_lookups.stats()
+
+# --- Guarded execution of model-written SQL ---
+
+# Limits for read_sql_query_tool. The query runs on a read-only connection
+# under a wall-clock and VM-instruction budget (enforced by a progress
+# handler), rows are streamed with fetchmany up to a cap, and an optional
+# EXPLAIN QUERY PLAN pre-check refuses full scans of large tables.
+SQL_QUERY_TIMEOUT = float(os.getenv("SQL_QUERY_TIMEOUT", "2.0"))
+SQL_QUERY_MAX_STEPS = int(os.getenv("SQL_QUERY_MAX_STEPS", "50000000"))
+SQL_QUERY_MAX_ROWS = int(os.getenv("SQL_QUERY_MAX_ROWS", "200"))
+SQL_QUERY_MAX_CHARS = int(os.getenv("SQL_QUERY_MAX_CHARS", "20000"))
+SQL_QUERY_PLAN_CHECK = os.getenv("SQL_QUERY_PLAN_CHECK", "1") != "0"
+SQL_FULL_SCAN_MAX_ROWS = int(os.getenv("SQL_FULL_SCAN_MAX_ROWS", "100000"))
+
+_PROGRESS_INTERVAL = 1000  # VM instructions between progress-handler calls
+_FETCH_BATCH = 50
+
+# Model-facing names -> tables whose size matters for the scan check.
+_SCAN_TABLES = {"transactions": "transactions_store", "debts": "debts_store",
+                "transactions_store": "transactions_store", "debts_store": "debts_store"}
+_TABLE_REF = re.compile(r"\b(?:from|join)\s+([a-z_][a-z0-9_]*)(?:\s+(?:as\s+)?([a-z_][a-z0-9_]*))?", re.IGNORECASE)
+_FULL_SCAN = re.compile(r"^SCAN ([a-z_][a-z0-9_]*)$", re.IGNORECASE)
+_NOT_ALIASES = {"where", "join", "on", "group", "order", "limit", "left", "right", "inner",
+                "outer", "cross", "natural", "union", "except", "intersect", "using", "having", "window"}
+
+class QueryRejected(Exception):
+    """A model-written query was refused or aborted; `hint` says how to retry."""
+
+    def __init__(self, code: str, message: str, hint: str = ""):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.hint = hint
+
+    def to_tool_error(self) -> str:
+        return "ERROR: " + json.dumps({"code": self.code, "message": self.message, "hint": self.hint})
+
+def _scanned_tables(query: str) -> Dict[str, str]:
+    """Alias or table name as EXPLAIN reports it -> underlying large table."""
+    names = {}
+    for table, alias in _TABLE_REF.findall(query):
+        target = _SCAN_TABLES.get(table.lower())
+        if target:
+            names[target] = target
+            if alias and alias.lower() not in _NOT_ALIASES:
+                names[alias.lower()] = target
+    return names
+
+def _check_query_plan(conn: sqlite3.Connection, query: str, params: tuple):
+    tables = _scanned_tables(query)
+    if not tables:
+        return
+    for row in conn.execute("EXPLAIN QUERY PLAN " + query, params):
+        match = _FULL_SCAN.match(row[3].strip())
+        if not match:
+            continue
+        table = tables.get(match.group(1).lower())
+        if not table:
+            continue
+        size = conn.execute(f"SELECT IFNULL(max(rowid), 0) FROM {table}").fetchone()[0]
+        if size > SQL_FULL_SCAN_MAX_ROWS:
+            raise QueryRejected(
+                "full_scan",
+                f"The query reads every row of {table} (~{size:,} rows).",
+                "Filter on an indexed column: transactions.category, transactions.timestamp "
+                "(date range), or debts.creditor/debtor together with status; or add a tighter WHERE.",
+            )
+
+def run_guarded_query(query: str, params: tuple = ()) -> Dict[str, Any]:
+    """
+    Runs a model-written SELECT within the SQL_QUERY_* limits.
+
+    Returns:
+        {"columns": [...], "rows": [tuple, ...], "truncated": bool}
+
+    Raises:
+        QueryRejected: with code "not_select", "full_scan", "timeout",
+            "step_budget" or "sql_error".
+    """
+    head = query.lstrip().split(None, 1)[0].upper() if query.strip() else ""
+    if head not in ("SELECT", "WITH"):
+        raise QueryRejected("not_select", "Only SELECT queries are allowed.",
+                            "Send a single SELECT statement.")
+
+    deadline = time.monotonic() + SQL_QUERY_TIMEOUT
+    budget = {"steps": 0, "reason": None}
+
+    def progress() -> int:
+        budget["steps"] += _PROGRESS_INTERVAL
+        if budget["steps"] > SQL_QUERY_MAX_STEPS:
+            budget["reason"] = "step_budget"
+            return 1
+        if time.monotonic() > deadline:
+            budget["reason"] = "timeout"
+            return 1
+        return 0
+
+    with read_connection() as conn:
+        conn.set_progress_handler(progress, _PROGRESS_INTERVAL)
+        try:
+            if SQL_QUERY_PLAN_CHECK:
+                _check_query_plan(conn, query, params)
+            cursor = conn.execute(query, params)
+            columns = [d[0] for d in cursor.description or ()]
+            rows: List[tuple] = []
+            truncated = False
+            while True:
+                batch = cursor.fetchmany(_FETCH_BATCH)
+                if not batch:
+                    break
+                rows.extend(tuple(row) for row in batch)
+                if len(rows) > SQL_QUERY_MAX_ROWS:
+                    rows = rows[:SQL_QUERY_MAX_ROWS]
+                    truncated = True
+                    break
+            cursor.close()
+        except sqlite3.OperationalError as e:
+            if budget["reason"] == "timeout":
+                raise QueryRejected("timeout", f"The query ran longer than {SQL_QUERY_TIMEOUT}s and was stopped.",
+                                    "Add a WHERE filter or LIMIT, avoid joins without ON conditions, "
+                                    "or aggregate with SUM/COUNT instead of listing rows.")
+            if budget["reason"] == "step_budget":
+                raise QueryRejected("step_budget", "The query exceeded its work budget and was stopped.",
+                                    "Add a WHERE filter or LIMIT, avoid joins without ON conditions, "
+                                    "or aggregate with SUM/COUNT instead of listing rows.")
+            raise QueryRejected("sql_error", str(e), "Check table and column names against the schema.")
+        except sqlite3.DatabaseError as e:
+            raise QueryRejected("sql_error", str(e), "Check table and column names against the schema.")
+        finally:
+            conn.set_progress_handler(None, 0)
+    return {"columns": columns, "rows": rows, "truncated": truncated}
+
+# --- Full-text search ---
+# transactions_fts and debts_fts (migration 7) index transaction descriptions
+# and categories and debt descriptions. Every word of a search must match the
+# start of a token, so "star cof" finds "Starbucks coffee"; results are ranked
+# with bm25, a description hit outranking a category hit, newest first on ties.
+
+SEARCH_KINDS = ("transactions", "debts")
+SEARCH_ORDERS = ("relevance", "recent")
+SEARCH_MAX_RESULTS = 50
+_SEARCH_WORD = re.compile(r"\w+")
+_SEARCH_RANK = {"transactions": "bm25(transactions_fts, 2.0, 1.0)", "debts": "bm25(debts_fts)"}
+
+def fts_query(text: Optional[str]) -> Optional[str]:
+    """
+    An FTS5 MATCH expression requiring every word of `text` as a prefix, or None
+    if `text` has no words. Words are quoted, so FTS5 syntax in user input
+    (AND, NEAR, column filters) is searched for literally.
+    """
+    words = _SEARCH_WORD.findall(text or "")
+    return " ".join(f'"{word}"*' for word in words) if words else None
+
+@cached_read
+def search_records(text: str, kind: str = "transactions", limit: int = 10,
+                   order: str = "relevance") -> List[Dict[str, Any]]:
+    """
+    Transactions or debts matching every word of `text`.
+
+    Args:
+        text: Keywords; each is matched as a word prefix, case- and accent-insensitive.
+        kind: "transactions" (description and category) or "debts" (description).
+        limit: Maximum rows, capped at SEARCH_MAX_RESULTS.
+        order: "relevance" (bm25, newest first on ties) or "recent" (newest
+               first, for "my latest ..." lookups).
+
+    Returns:
+        Transaction or Debt dicts.
+    """
+    if kind not in SEARCH_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(SEARCH_KINDS)}.")
+    if order not in SEARCH_ORDERS:
+        raise ValueError(f"order must be one of {', '.join(SEARCH_ORDERS)}.")
+    match = fts_query(text)
+    if match is None:
+        return []
+    limit = max(1, min(int(limit), SEARCH_MAX_RESULTS))
+    # Ids grow with time, so "recent" walks the index in rowid order and stops at `limit`.
+    ordering = f"{kind}_fts.rowid DESC" if order == "recent" else f"{_SEARCH_RANK[kind]}, s.id DESC"
+    with read_connection() as conn:
+        rows = conn.execute(
+            f"""SELECT s.* FROM {kind}_fts CROSS JOIN {kind}_store s ON s.id = {kind}_fts.rowid
+                WHERE {kind}_fts MATCH ?
+                ORDER BY {ordering} LIMIT ?""", (match, limit)).fetchall()
+    model = Transaction if kind == "transactions" else Debt
+    return [model.from_row(row).model_dump() for row in rows]
 
 # --- Tools from Notebook ---
 
@@ -85,35 +853,71 @@ def read_sql_query_tool(query: str) -> str:
     on debtor and creditor and status. where for user ALWAYS use 'Me' in creditor or debtor according to question and for status
     use 'unsettled' for open or unsettled debts/transcations and 'settled' for settled debts/transactions
     
+    Queries run read-only with a time and row budget. A result starting with "ERROR:" is
+    followed by JSON {"code", "message", "hint"}; follow the hint and retry with a cheaper query
+    (e.g. add filters, a LIMIT, or aggregate with SUM/COUNT).
+
     Args: 
         query: A valid SQL SELECT statement.
     """
     try:
-        if not query.strip().upper().startswith("SELECT"):
-            return "ERROR: Only SELECT queries are allowed."
-            
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute(query)
-        rows = c.fetchall()
-        columns = [description[0] for description in c.description]
-        conn.close()
-        
+        normalized = normalize_sql(query)
+        key = None if _VOLATILE_SQL.search(normalized) else ("read_sql_query_tool", normalized, _data_generation)
+        cached = _query_results.get(key, _NOT_CACHED) if key else _NOT_CACHED
+        if cached is not _NOT_CACHED:
+            return cached
+
+        found = run_guarded_query(query)
+        rows, columns = found["rows"], found["columns"]
+
         if not rows:
-            return "No results found."
-            
-        result = [dict(zip(columns, row)) for row in rows]
-        return str(result)
+            result = "No results found."
+        else:
+            result = str([dict(zip(columns, row)) for row in rows])
+            if len(result) > SQL_QUERY_MAX_CHARS:
+                result = result[:SQL_QUERY_MAX_CHARS] + " ..."
+                found["truncated"] = True
+            if found["truncated"]:
+                result += (f" NOTE: Output truncated (at most {SQL_QUERY_MAX_ROWS} rows / "
+                           f"{SQL_QUERY_MAX_CHARS} characters). Use LIMIT, filters or aggregates.")
+        if key:
+            _query_results.set(key, result)
+        return result
+    except QueryRejected as e:
+        return e.to_tool_error()
     except Exception as e:
         return f"ERROR: Query failed. {str(e)}"
 
+def search_records_tool(keywords: str, kind: str = "transactions", order: str = "relevance") -> str:
+    """
+    Finds transactions or debts by keywords in their description (and, for
+    transactions, category) using the full-text index. Use this instead of
+    LIKE '%keyword%' in read_sql_query_tool to locate rows by what they were for.
+
+    Every keyword must match the start of a word, so "star cof" finds
+    "Starbucks coffee". At most SEARCH_MAX_RESULTS rows are returned.
+
+    Args:
+        keywords: Words to search for, e.g. "coffee" or "rent march".
+        kind: "transactions" or "debts".
+        order: "relevance" (best match first) or "recent" (newest first). Use
+               "recent" for "my latest / last ..." requests.
+    """
+    try:
+        rows = search_records(keywords, kind, SEARCH_MAX_RESULTS, order)
+    except Exception as e:
+        return f"ERROR: Search failed. {str(e)}"
+    return str(rows) if rows else "No results found."
+
 def execute_sql_update_tool(query: str, params: dict={}) -> dict:
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(query, params or {})
-    conn.commit()
-    rows_affected = cur.rowcount
-    conn.close()
+    with write_transaction() as conn:
+        # Writes through the transactions/debts views report no rowcount; their
+        # INSTEAD OF triggers count rows in view_write_counts instead.
+        view_writes = "SELECT IFNULL(SUM(n), 0) FROM view_write_counts"
+        before = conn.execute(view_writes).fetchone()[0]
+        cur = conn.cursor()
+        cur.execute(query, params or {})
+        rows_affected = max(cur.rowcount, 0) + conn.execute(view_writes).fetchone()[0] - before
     return {"rows_affected": rows_affected}
 
 def save_transaction_tool(description: str, amount: float, category: str, split_details: str = "None") -> str:
@@ -136,26 +940,30 @@ def save_transaction_tool(description: str, amount: float, category: str, split_
         return "ERROR: Category is missing. Please categorize before saving."
 
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        
-        # Check budget
-        c.execute("SELECT budget FROM categories WHERE name = ?", (category,))
-        row = c.fetchone()
-        budget_msg = ""
-        if row:
-            budget = row['budget']
-            c.execute("SELECT SUM(amount) FROM transactions WHERE category = ?", (category,))
-            result = c.fetchone()
-            spent = result[0] if result[0] else 0
-            if spent + float(amount) > budget:
-                budget_msg = f" WARNING: You have exceeded your {category} budget of ${budget}!"
-        
-        c.execute("INSERT INTO transactions (timestamp, description, amount, category, split_details) VALUES (?, ?, ?, ?, ?)",
-                  (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), description, float(amount), category, split_details))
-        trans_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        with write_transaction() as conn:
+            c = conn.cursor()
+
+            amount_minor = to_minor_units(amount)
+
+            # Budgets are monthly: check against this month's running total.
+            ts = now_epoch()
+            c.execute("""SELECT c.budget, IFNULL(t.total_minor, 0) AS spent_minor
+                         FROM categories c LEFT JOIN category_month_totals t
+                             ON t.category = c.name AND t.month = ?
+                         WHERE c.name = ?""", (_yyyymm(ts), category))
+            row = c.fetchone()
+            budget_msg = ""
+            if row:
+                budget = row['budget']
+                if row['spent_minor'] + amount_minor > to_minor_units(budget or 0):
+                    budget_msg = f" WARNING: You have exceeded your monthly {category} budget of ${budget}!"
+
+            c.execute("INSERT INTO transactions_store (ts, description, amount_minor, category, split_details) "
+                      "VALUES (?, ?, ?, ?, ?)",
+                      (ts, description, amount_minor, category, split_details))
+            trans_id = c.lastrowid
+            learn_merchant_category(c, description, category)
+        _journal_write("transactions", trans_id)
         return f"SUCCESS: Transaction #{trans_id} saved. {description} - ${amount} ({category}).{budget_msg}"
     except Exception as e:
             return f"ERROR: Failed to save transaction. {str(e)}"
@@ -176,21 +984,49 @@ def add_debt_tool(debtor: str, creditor: str, amount: float,
         return "ERROR: Amount must be positive."
 
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        c.execute(
-            "INSERT INTO debts (debtor, creditor, amount, description, status, timestamp) "
-            "VALUES (?, ?, ?, ?, ?, ?)",
-            (debtor.strip(), creditor.strip(), float(amount), description, status, now)
-        )
-        conn.commit()
-        conn.close()
+        with write_transaction() as conn:
+            debt_id = conn.execute(
+                "INSERT INTO debts_store (debtor, creditor, amount_minor, description, status, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (debtor.strip(), creditor.strip(), to_minor_units(amount), description, status, now_epoch())
+            ).lastrowid
+        _journal_write("debts", debt_id)
         return f"SUCCESS: Recorded that {debtor} owes {creditor} {amount} for {description} ({status})."
     except Exception as e:
         return f"ERROR: Failed to record debt. {str(e)}"
 
+def add_debts_batch(edges: List[Dict[str, Any]], split_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Records several debts atomically: one executemany in one write transaction.
+
+    Args:
+        edges: Dicts with debtor, creditor, amount, description and optional status.
+        split_id: Groups the edges of one shared expense; generated if omitted.
+
+    Returns:
+        {"split_id": ..., "ids": [debt ids in edge order]}
+    """
+    rows = []
+    now = now_epoch()
+    split_id = split_id or uuid.uuid4().hex
+    for edge in edges:
+        amount_minor = to_minor_units(edge["amount"])
+        if amount_minor <= 0:
+            raise ValueError("Amount must be positive.")
+        rows.append((edge["debtor"].strip(), edge["creditor"].strip(), amount_minor,
+                     edge["description"], edge.get("status") or "unsettled", now, split_id))
+    with write_transaction() as conn:
+        conn.executemany(
+            "INSERT INTO debts_store (debtor, creditor, amount_minor, description, status, ts, split_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        # One writer, one transaction: the new ids are the last len(rows) ones,
+        # whatever edges the split already had.
+        last_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM debts_store").fetchone()[0]
+        ids = list(range(last_id - len(rows) + 1, last_id + 1))
+    for debt_id in ids:
+        _journal_write("debts", debt_id)
+    return {"split_id": split_id, "ids": ids}
+
 def record_group_debts(
     creditors: str,
     debtors: str,
@@ -226,7 +1062,7 @@ def record_group_debts(
     Behavior:
         - Computes net = paid - fair_share for each participant.
         - Builds debts ONLY where ME_NAME is debtor or creditor.
-        - Uses add_debt_tool() to insert each edge.
+        - Inserts all edges at once with add_debts_batch(), under one split id.
     """
     ME_NAME = "Me"
     
@@ -296,7 +1132,7 @@ def record_group_debts(
     if abs(net_me) < 1e-6:
         return "INFO: Me is already settled; no debts recorded."
 
-    calls_made = 0
+    edges = []
 
     # Case A: Me is creditor (others owe Me)
     if net_me > 0:
@@ -311,14 +1147,8 @@ def record_group_debts(
                 # proportional share of what they owe to Me
                 share_to_me = net_me * (-net[p] / total_owing)
                 if share_to_me > 0.01:
-                    add_debt_tool(
-                        debtor=p,
-                        creditor=ME_NAME,
-                        amount=round(share_to_me, 2),
-                        description=description,
-                        status=status
-                    )
-                    calls_made += 1
+                    edges.append({"debtor": p, "creditor": ME_NAME, "amount": round(share_to_me, 2),
+                                  "description": description, "status": status})
 
     # Case B: Me is debtor (I owe others)
     else:
@@ -332,62 +1162,560 @@ def record_group_debts(
             if net[p] > 0:
                 share_from_me = (-net_me) * (net[p] / total_credit)
                 if share_from_me > 0.01:
-                    add_debt_tool(
-                        debtor=ME_NAME,
-                        creditor=p,
-                        amount=round(share_from_me, 2),
-                        description=description,
-                        status=status
-                    )
-                    calls_made += 1
+                    edges.append({"debtor": ME_NAME, "creditor": p, "amount": round(share_from_me, 2),
+                                  "description": description, "status": status})
+
+    if not edges:
+        return f"INFO: No debt above $0.01 to record for '{description}'."
+    try:
+        result = add_debts_batch(edges)
+    except Exception as e:
+        return f"ERROR: Failed to record debts; nothing was saved. {str(e)}"
+    ids = ", ".join(f"#{i}" for i in result["ids"])
+    return (f"SUCCESS: Recorded {len(result['ids'])} debt edges involving Me for '{description}' "
+            f"(split {result['split_id']}, debts {ids}).")
+
+# --- Settle-up planning ---
+
+# Net balance per person over all unsettled debts (positive = is owed money),
+# computed in one pass over debts_store.
+_NET_BALANCES_SQL = """
+    SELECT person, SUM(delta) AS net_minor, MAX(id) AS max_id FROM (
+        SELECT creditor AS person, amount_minor AS delta, id FROM debts_store WHERE status = 'unsettled'
+        UNION ALL
+        SELECT debtor AS person, -amount_minor AS delta, id FROM debts_store WHERE status = 'unsettled'
+    )
+    GROUP BY person
+"""
 
-    return f"SUCCESS: Recorded {calls_made} debt edges involving Me for '{description}'."
+def _net_balances(conn: sqlite3.Connection) -> Tuple[Dict[str, int], int]:
+    """Returns ({person: net minor units}, highest open debt id)."""
+    balances, max_id = {}, 0
+    for row in conn.execute(_NET_BALANCES_SQL):
+        max_id = max(max_id, row["max_id"])
+        if row["net_minor"]:
+            balances[row["person"]] = row["net_minor"]
+    return balances, max_id
+
+def plan_settlements(balances: Dict[str, int]) -> List[Dict[str, Any]]:
+    """
+    Transfers that clear `balances` (minor units, summing to zero) by
+    repeatedly paying the largest creditor from the largest debtor. Greedy, so
+    not always the true minimum (NP-hard), but never more than n - 1
+    transfers, in O(n log n) with two heaps.
+    """
+    creditors = [(-amount, person) for person, amount in balances.items() if amount > 0]
+    debtors = [(amount, person) for person, amount in balances.items() if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+    transfers = []
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debit, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debit)
+        transfers.append({"from": debtor, "to": creditor, "amount_minor": amount})
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+        if -debit > amount:
+            heapq.heappush(debtors, (debit + amount, debtor))
+    return transfers
+
+def _settle_plan_result(balances: Dict[str, int], settled_rows: int = 0) -> Dict[str, Any]:
+    return {
+        "balances": [{"person": person, "net": from_minor_units(amount)}
+                     for person, amount in sorted(balances.items(), key=lambda kv: -kv[1])],
+        "transfers": [{"from": t["from"], "to": t["to"], "amount": from_minor_units(t["amount_minor"])}
+                      for t in plan_settlements(balances)],
+        "settled_rows": settled_rows,
+    }
+
+@cached_read
+def get_settle_plan() -> Dict[str, Any]:
+    """Net balances and the settle-up transfers for all unsettled debts."""
+    with read_connection() as conn:
+        balances, _ = _net_balances(conn)
+    return _settle_plan_result(balances)
+
+def settle_all_debts() -> Dict[str, Any]:
+    """
+    Computes the settle-up plan and marks every debt it covers as settled, in
+    one write transaction so no debt recorded meanwhile is lost or double-counted.
+    """
+    with write_transaction() as conn:
+        balances, max_id = _net_balances(conn)
+        settled = conn.execute(
+            "UPDATE debts_store SET status = 'settled' WHERE status = 'unsettled' AND id <= ?",
+            (max_id,)).rowcount
+    return _settle_plan_result(balances, settled)
+
+def settle_up_tool(mark_settled: bool = False) -> dict:
+    """
+    Net "who owes whom" across ALL unsettled debts, plus the fewest transfers
+    needed to settle everyone up. Use this instead of summing debts rows in SQL.
+
+    Args:
+        mark_settled: True ONLY when the user explicitly says everyone has
+                      settled up / paid; marks all covered debts as settled.
+
+    Returns:
+        {"balances": [{"person", "net"}], "transfers": [{"from", "to", "amount"}],
+         "settled_rows": int}. A positive net means the person is owed money.
+    """
+    try:
+        return settle_all_debts() if mark_settled else get_settle_plan()
+    except Exception as e:
+        return {"error": f"Failed to build settle-up plan. {str(e)}"}
+
+def get_split_debts(split_id: str) -> List[Dict[str, Any]]:
+    """All debt edges recorded for one split."""
+    with read_connection() as conn:
+        rows = conn.execute("SELECT * FROM debts_store WHERE split_id = ? ORDER BY id", (split_id,)).fetchall()
+    return [Debt.from_row(row).model_dump() for row in rows]
+
+def settle_split(split_id: str) -> int:
+    """Marks every unsettled edge of a split settled; returns the number of rows changed."""
+    with write_transaction() as conn:
+        return conn.execute("UPDATE debts_store SET status = 'settled' "
+                            "WHERE split_id = ? AND status = 'unsettled'", (split_id,)).rowcount
+
+# --- Async tool variants ---
+# What the agents register, so tool calls never block the event loop.
+
+save_transaction_tool_async = async_tool(save_transaction_tool)
+read_sql_query_tool_async = async_tool(read_sql_query_tool)
+execute_sql_update_tool_async = async_tool(execute_sql_update_tool)
+record_group_debts_async = async_tool(record_group_debts)
+settle_up_tool_async = async_tool(settle_up_tool)
+search_records_tool_async = async_tool(search_records_tool)
 
 # --- Helper functions for API ---
 
 def get_all_transactions() -> List[Dict]:
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM transactions ORDER BY id DESC")
-    rows = c.fetchall()
-    conn.close()
+    with read_connection() as conn:
+        rows = conn.execute("SELECT * FROM transactions ORDER BY id DESC").fetchall()
     return [dict(row) for row in rows]
 
-def get_category_totals() -> List[Dict]:
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT category, SUM(amount) as total FROM transactions GROUP BY category")
-    rows = c.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+TRANSACTIONS_PAGE_SIZE = 50
+TRANSACTIONS_MAX_PAGE_SIZE = 200
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    """Inverse of encode_cursor(). Raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, value = raw.split(":", 1)
+        if prefix != "id":
+            raise ValueError
+        return int(value)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+def _day_start(value: str) -> int:
+    """Epoch seconds at the start of a 'YYYY-MM-DD' day."""
+    try:
+        return to_epoch(datetime.strptime(value, "%Y-%m-%d"))
+    except ValueError:
+        raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD.")
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+@cached_read
+def get_transactions(
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = TRANSACTIONS_PAGE_SIZE,
+    after_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    One page of transactions, newest first, filtered in SQL.
+
+    Args:
+        q: Keywords; every word must prefix a word of the description or category
+           (full-text index, see search_records()).
+        category: Exact category name.
+        date_from / date_to: Inclusive 'YYYY-MM-DD' bounds on the timestamp.
+        limit: Page size, capped at TRANSACTIONS_MAX_PAGE_SIZE.
+        after_id: Opaque cursor returned as `next_cursor` by the previous page.
+
+    Returns:
+        {"items": [...], "next_cursor": str or None}
+    """
+    limit = max(1, min(int(limit), TRANSACTIONS_MAX_PAGE_SIZE))
+    where, params = [], []
+    source, key = "transactions_store t", "t.id"
+
+    if q and q.strip():
+        match = fts_query(q)
+        if match is not None:
+            # Driven by the index in rowid order, so a page stops after
+            # `limit` matches however common the words are.
+            source = "transactions_fts CROSS JOIN transactions_store t ON t.id = transactions_fts.rowid"
+            key = "transactions_fts.rowid"
+            where.append("transactions_fts MATCH ?")
+            params.append(match)
+        else:
+            # Only punctuation or symbols, which the index does not hold.
+            pattern = f"%{_escape_like(q.strip())}%"
+            where.append("(t.description LIKE ? ESCAPE '\\' OR t.category LIKE ? ESCAPE '\\')")
+            params.extend([pattern, pattern])
+    if after_id:
+        where.append(f"{key} < ?")
+        params.append(decode_cursor(after_id))
+    if category:
+        where.append("t.category = ?")
+        params.append(category)
+    if date_from:
+        where.append("t.ts >= ?")
+        params.append(_day_start(date_from))
+    if date_to:
+        where.append("t.ts < ?")
+        params.append(_day_start(date_to) + 86400)
+
+    sql = f"SELECT t.id, t.ts, t.description, t.amount_minor, t.category, t.split_details FROM {source}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    # Fetch one extra row to learn whether another page exists.
+    sql += f" ORDER BY {key} DESC LIMIT ?"
+    params.append(limit + 1)
+
+    with read_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+
+    items = [Transaction.from_row(row).model_dump() for row in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]["id"]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+# --- Time windows over the monthly rollups ---
+
+STATS_PERIODS = ("month", "last_month", "year", "all")
+
+def _month_start(ts: int) -> int:
+    moment = datetime.fromtimestamp(ts, timezone.utc)
+    return to_epoch(datetime(moment.year, moment.month, 1))
+
+def _next_month_start(ts: int) -> int:
+    moment = datetime.fromtimestamp(ts, timezone.utc)
+    year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+    return to_epoch(datetime(year, month, 1))
+
+def _yyyymm(ts: int) -> int:
+    moment = datetime.fromtimestamp(ts, timezone.utc)
+    return moment.year * 100 + moment.month
+
+def resolve_window(period: Optional[str] = None, date_from: Optional[str] = None,
+                   date_to: Optional[str] = None) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Epoch range [start, end) for a named period or inclusive YYYY-MM-DD dates.
+    Explicit dates win over `period`; None bounds are open.
+    """
+    if date_from or date_to:
+        start = _day_start(date_from) if date_from else None
+        end = _day_start(date_to) + 86400 if date_to else None
+        if start is not None and end is not None and start >= end:
+            raise ValueError("'from' must be on or before 'to'.")
+        return start, end
+    period = period or "all"
+    if period not in STATS_PERIODS:
+        raise ValueError(f"period must be one of {', '.join(STATS_PERIODS)}.")
+    now = now_epoch()
+    if period == "month":
+        return _month_start(now), _next_month_start(now)
+    if period == "last_month":
+        this_month = _month_start(now)
+        return _month_start(this_month - 1), this_month
+    if period == "year":
+        year = datetime.fromtimestamp(now, timezone.utc).year
+        return to_epoch(datetime(year, 1, 1)), to_epoch(datetime(year + 1, 1, 1))
+    return None, None
+
+def _spend_between(conn: sqlite3.Connection, start: Optional[int], end: Optional[int]) -> Dict[str, List[int]]:
+    """
+    {category: [total_minor, txn_count]} over [start, end). Whole months come
+    from category_month_totals; only the partial months at either edge are
+    range-scanned in transactions_store.
+    """
+    totals: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+
+    def add(rows):
+        for row in rows:
+            totals[row[0]][0] += row[1] or 0
+            totals[row[0]][1] += row[2] or 0
+
+    def scan(lo: int, hi: int):
+        add(conn.execute("SELECT IFNULL(category, ''), SUM(amount_minor), COUNT(*) FROM transactions_store "
+                         "WHERE ts >= ? AND ts < ? GROUP BY 1", (lo, hi)))
+
+    if start is None and end is None:
+        add(conn.execute("SELECT category, total_minor, txn_count FROM category_totals"))
+        return totals
+
+    full_from = start if start is None or start == _month_start(start) else _next_month_start(start)
+    full_to = end if end is None or end == _month_start(end) else _month_start(end)
+    if full_from is not None and full_to is not None and full_from >= full_to:
+        scan(start, end)
+        return totals
+
+    where, params = [], []
+    if full_from is not None:
+        where.append("month >= ?")
+        params.append(_yyyymm(full_from))
+    if full_to is not None:
+        where.append("month < ?")
+        params.append(_yyyymm(full_to))
+    add(conn.execute("SELECT category, SUM(total_minor), SUM(txn_count) FROM category_month_totals "
+                     f"WHERE {' AND '.join(where)} GROUP BY category", params))
+    if start is not None and start < full_from:
+        scan(start, full_from)
+    if end is not None and full_to < end:
+        scan(full_to, end)
+    return totals
+
+def _first_spend_ts(conn: sqlite3.Connection) -> Optional[int]:
+    """Timestamp of the earliest transaction, or None when there are none."""
+    return conn.execute("SELECT MIN(ts) FROM transactions_store").fetchone()[0]
+
+def _months_spanned(conn: sqlite3.Connection, start: Optional[int], end: Optional[int]) -> int:
+    """
+    Calendar months touched by [start, end). An open start counts from the
+    first transaction's month and an open end up to the current month.
+    """
+    now = now_epoch()
+    if start is None:
+        start = _first_spend_ts(conn)
+        if start is None:
+            start = now
+    return max(1, _month_span(start, end if end is not None else _next_month_start(now)))
+
+def _month_span(start: int, end: int) -> int:
+    """Calendar months touched by [start, end)."""
+    first, last = _yyyymm(start), _yyyymm(end - 1)
+    return (last // 100 - first // 100) * 12 + last % 100 - first % 100 + 1
+
+def _window_label(start: Optional[int], end: Optional[int]) -> Dict[str, Optional[str]]:
+    return {"from": format_epoch(start)[:10] if start is not None else None,
+            "to": format_epoch(end - 1)[:10] if end is not None else None}
+
+def get_category_totals(period: Optional[str] = None, date_from: Optional[str] = None,
+                        date_to: Optional[str] = None) -> List[Dict]:
+    """Spend per category for a window (all-time by default)."""
+    # Resolve "month" etc. now so cached results are keyed by the actual range.
+    return _category_totals_between(*resolve_window(period, date_from, date_to))
+
+@cached_read
+def _category_totals_between(start: Optional[int], end: Optional[int]) -> List[Dict]:
+    with read_connection() as conn:
+        totals = _spend_between(conn, start, end)
+    return [{"category": category, "total": from_minor_units(total_minor)}
+            for category, (total_minor, count) in sorted(totals.items()) if count > 0]
+
+def get_dashboard_stats(period: Optional[str] = "month", date_from: Optional[str] = None,
+                        date_to: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Spend vs budget for a window (the current month by default). Budgets are
+    monthly, so a window's budget is scaled by the calendar months it touches.
+    """
+    start, end = resolve_window(period, date_from, date_to)
+    # An open-ended window's budget grows with the current month, so it keys the cache.
+    return _dashboard_stats_between(start, end, _yyyymm(now_epoch()))
+
+@cached_read
+def _dashboard_stats_between(start: Optional[int], end: Optional[int], this_month: int) -> Dict[str, Any]:
+    with read_connection() as conn:
+        c = conn.cursor()
+
+        # 1. Total Spent in the window, from the monthly rollups
+        totals = _spend_between(conn, start, end)
+        total_spent = from_minor_units(sum(total_minor for total_minor, _ in totals.values()))
+
+        # 2. Total Budget
+        c.execute("SELECT SUM(budget) FROM categories")
+        result = c.fetchone()
+        total_budget = (result[0] if result[0] else 0.0) * _months_spanned(conn, start, end)
+
+        # 3. Active Debts (Money owed TO Me)
+        # creditor = 'Me' AND status = 'unsettled'
+        c.execute("SELECT SUM(amount_minor) / 100.0 FROM debts_store WHERE creditor = 'Me' AND status = 'unsettled'")
+        result = c.fetchone()
+        active_debts = result[0] if result[0] else 0.0
 
-def get_dashboard_stats() -> Dict[str, float]:
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # 1. Total Spent (All time for now, ideally current month)
-    # For simplicity, let's just sum all transactions. 
-    # To do current month: WHERE strftime('%Y-%m', timestamp) = strftime('%Y-%m', 'now')
-    c.execute("SELECT SUM(amount) FROM transactions")
-    result = c.fetchone()
-    total_spent = result[0] if result[0] else 0.0
-    
-    # 2. Total Budget
-    c.execute("SELECT SUM(budget) FROM categories")
-    result = c.fetchone()
-    total_budget = result[0] if result[0] else 0.0
-    
-    # 3. Active Debts (Money owed TO Me)
-    # creditor = 'Me' AND status = 'unsettled'
-    c.execute("SELECT SUM(amount) FROM debts WHERE creditor = 'Me' AND status = 'unsettled'")
-    result = c.fetchone()
-    active_debts = result[0] if result[0] else 0.0
-    
-    conn.close()
-    
     return {
         "total_spent": total_spent,
         "budget": total_budget,
         "remaining": total_budget - total_spent,
-        "active_debts": active_debts
+        "active_debts": active_debts,
+        **_window_label(start, end),
+    }
+
+# --- Spend over time ---
+
+TIMESERIES_GRANULARITIES = {"day": 86400, "week": 7 * 86400, "month": None}
+TIMESERIES_DEFAULT_BUCKETS = {"day": 30, "week": 12, "month": 12}
+TIMESERIES_MAX_BUCKETS = 400
+
+def _timeseries_window(granularity: str, period: Optional[str], date_from: Optional[str],
+                       date_to: Optional[str]) -> Tuple[int, int]:
+    """
+    Bucket-aligned [start, end): the requested window, or the last N buckets
+    up to today. A window with an open start (period=all) begins at the first
+    transaction; one longer than TIMESERIES_MAX_BUCKETS is refused.
+    """
+    if period or date_from or date_to:
+        start, end = resolve_window(period, date_from, date_to)
+        if start is None:
+            with read_connection() as conn:
+                start = _first_spend_ts(conn)
+    else:
+        start, end = None, None
+    today = _day_start(format_epoch(now_epoch())[:10])
+    if end is None:
+        end = today + 86400
+    if granularity == "month":
+        end = end if end == _month_start(end) else _next_month_start(end)
+        if start is None:
+            start = end
+            for _ in range(TIMESERIES_DEFAULT_BUCKETS["month"]):
+                start = _month_start(start - 1)
+        start = _month_start(start)
+    else:
+        width = TIMESERIES_GRANULARITIES[granularity]
+        if start is None:
+            start = end - TIMESERIES_DEFAULT_BUCKETS[granularity] * width
+        start = _day_start(format_epoch(start)[:10])
+        if granularity == "week":
+            # Weeks start on Monday.
+            start -= datetime.fromtimestamp(start, timezone.utc).weekday() * 86400
+        end = start + -(-(end - start) // width) * width
+    if start < end and _buckets_between(granularity, start, end) > TIMESERIES_MAX_BUCKETS:
+        raise ValueError(f"Window too long: at most {TIMESERIES_MAX_BUCKETS} {granularity} buckets.")
+    return start, end
+
+def _buckets_between(granularity: str, start: int, end: int) -> int:
+    if granularity == "month":
+        return _month_span(start, end)
+    return (end - start) // TIMESERIES_GRANULARITIES[granularity]
+
+def _bucket_starts(granularity: str, start: int, end: int) -> List[int]:
+    starts = []
+    ts = start
+    while ts < end:
+        starts.append(ts)
+        ts = _next_month_start(ts) if granularity == "month" else ts + TIMESERIES_GRANULARITIES[granularity]
+        if len(starts) > TIMESERIES_MAX_BUCKETS:
+            raise ValueError(f"Window too long: at most {TIMESERIES_MAX_BUCKETS} {granularity} buckets.")
+    return starts
+
+def get_spend_timeseries(granularity: str = "day", by_category: bool = False, period: Optional[str] = None,
+                         date_from: Optional[str] = None, date_to: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Spend per day/week/month bucket, as columns: one timestamps array plus
+    one values array per series ("total", or one per category).
+    """
+    if granularity not in TIMESERIES_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(TIMESERIES_GRANULARITIES)}.")
+    start, end = _timeseries_window(granularity, period, date_from, date_to)
+    return _spend_timeseries(granularity, by_category, start, end)
+
+@cached_read
+def _spend_timeseries(granularity: str, by_category: bool, start: int, end: int) -> Dict[str, Any]:
+    starts = _bucket_starts(granularity, start, end)
+    with read_connection() as conn:
+        if granularity == "month":
+            # Windows are month-aligned here, so the rollup answers every bucket.
+            index = {_yyyymm(ts): i for i, ts in enumerate(starts)}
+            rows = conn.execute(
+                f"""SELECT month AS bucket, {"category" if by_category else "''"} AS series,
+                           SUM(total_minor) AS total_minor
+                    FROM category_month_totals WHERE month >= ? AND month < ?
+                    GROUP BY 1, 2""", (_yyyymm(start), _yyyymm(end))).fetchall()
+        else:
+            index = None
+            rows = conn.execute(
+                f"""SELECT (ts - ?) / ? AS bucket, {"IFNULL(category, '')" if by_category else "''"} AS series,
+                           SUM(amount_minor) AS total_minor
+                    FROM transactions_store WHERE ts >= ? AND ts < ?
+                    GROUP BY 1, 2""", (start, TIMESERIES_GRANULARITIES[granularity], start, end)).fetchall()
+
+    series: Dict[str, List[int]] = {} if by_category else {"total": [0] * len(starts)}
+    for row in rows:
+        name = (row["series"] or "Uncategorized") if by_category else "total"
+        position = index[row["bucket"]] if index is not None else row["bucket"]
+        series.setdefault(name, [0] * len(starts))[position] += row["total_minor"] or 0
+
+    return {
+        "granularity": granularity,
+        "timestamps": [format_epoch(ts)[:10] for ts in starts],
+        "series": {name: [from_minor_units(v) for v in values] for name, values in sorted(series.items())},
     }
+
+# --- Parameterised lookups for the chat fast path ---
+
+@cached_read
+def find_category(name: str) -> Optional[str]:
+    """Canonical spelling of a budget or spend category (case-insensitive), or None."""
+    if not name or not name.strip():
+        return None
+    with read_connection() as conn:
+        row = conn.execute(
+            """SELECT name FROM categories WHERE name = ? COLLATE NOCASE
+               UNION ALL
+               SELECT category FROM category_totals WHERE category = ? COLLATE NOCASE
+               LIMIT 1""", (name.strip(), name.strip())).fetchone()
+    return row[0] if row else None
+
+@cached_read
+def get_open_debts(direction: str, person: str = "Me") -> List[Dict]:
+    """
+    Unsettled debts involving `person`.
+
+    Args:
+        direction: "owed_to" (others owe `person`) or "owed_by" (`person` owes others).
+    """
+    if direction == "owed_to":
+        column, other = "creditor", "debtor"
+    elif direction == "owed_by":
+        column, other = "debtor", "creditor"
+    else:
+        raise ValueError("direction must be 'owed_to' or 'owed_by'.")
+    with read_connection() as conn:
+        rows = conn.execute(
+            f"""SELECT id, {other} AS counterparty, amount_minor, description, ts
+                FROM debts_store WHERE {column} = ? AND status = 'unsettled'
+                ORDER BY id""", (person,)).fetchall()
+    return [{"id": row["id"], "counterparty": row["counterparty"],
+             "amount": from_minor_units(row["amount_minor"]),
+             "description": row["description"], "timestamp": format_epoch(row["ts"])}
+            for row in rows]
+
+@cached_read
+def get_category_spend(category: str, month: Optional[int] = None) -> float:
+    """Total spent on `category`, all-time or for one YYYYMM month, from the rollups."""
+    with read_connection() as conn:
+        if month is None:
+            row = conn.execute("SELECT total_minor FROM category_totals WHERE category = ?",
+                               (category,)).fetchone()
+        else:
+            row = conn.execute("SELECT total_minor FROM category_month_totals "
+                               "WHERE category = ? AND month = ?", (category, month)).fetchone()
+    return from_minor_units(row[0] if row else 0)
+
+@cached_read
+def get_category_budget(category: str, month: int) -> Optional[Dict[str, Any]]:
+    """
+    Monthly budget, spend in one YYYYMM month and what is left of it for a
+    budget category, or None if it has no budget.
+    """
+    with read_connection() as conn:
+        row = conn.execute(
+            """SELECT c.name, c.budget, IFNULL(t.total_minor, 0) AS spent_minor
+               FROM categories c LEFT JOIN category_month_totals t ON t.category = c.name AND t.month = ?
+               WHERE c.name = ?""", (month, category)).fetchone()
+    if not row:
+        return None
+    budget = row["budget"] or 0.0
+    spent = from_minor_units(row["spent_minor"])
+    return {"category": row["name"], "budget": budget, "spent": spent, "remaining": budget - spent}
@@ -0,0 +1,407 @@
+import csv
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from cache import LRUCache
+from classifier import classify_descriptions
+from database import (
+    read_connection, write_transaction, to_minor_units, to_epoch,
+    lookup_merchant_category, normalize_merchant, learn_merchant_category
+)
+
+# --- Bulk statement import ---
+#
+# Parses CSV or OFX bank statements into expense rows, categorises them (an
+# explicit category column wins, then the merchant rules, then batched
+# classifier calls for the unknown merchants; rows none of them can place are
+# left uncategorised), and inserts them with executemany. The file is streamed: rows are parsed, categorised and committed
+# IMPORT_BATCH_ROWS at a time, so memory stays bounded and the writer is never
+# held across a classifier call. Imports run as background jobs whose progress
+# is polled by id.
+
+IMPORT_BATCH_ROWS = 1000
+MAX_IMPORT_ERRORS = 20
+# Distinct unknown merchants sent to the batch classifier per import.
+IMPORT_CLASSIFY_MAX_MERCHANTS = int(os.getenv("IMPORT_CLASSIFY_MAX_MERCHANTS", "1000"))
+
+DATE_FORMATS = (
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d", "%d/%m/%Y", "%m/%d/%Y",
+    "%d-%m-%Y", "%d.%m.%Y", "%d %b %Y", "%b %d, %Y", "%d/%m/%y", "%m/%d/%y",
+)
+
+# How the amount column of a CSV without debit/credit or type columns is
+# signed: bank exports show expenses as negative amounts, card exports as
+# positive ones. OFX amounts are always signed (negative for a debit).
+EXPENSE_SIGNS = ("negative", "positive")
+
+DEBIT_TYPES = ("D", "DR", "DEBIT")
+CREDIT_TYPES = ("C", "CR", "CREDIT")
+
+# Header names (lower-case) accepted for each field in a CSV statement.
+CSV_COLUMNS = {
+    "date": ("date", "transaction date", "posted date", "posting date", "value date", "txn date"),
+    "description": ("description", "narration", "details", "payee", "merchant", "memo", "name", "particulars"),
+    "amount": ("amount", "transaction amount", "amt"),
+    "debit": ("debit", "withdrawal", "withdrawals", "debit amount", "money out", "paid out"),
+    "credit": ("credit", "deposit", "deposits", "credit amount", "money in", "paid in"),
+    # Marks the amount as a debit or a credit (see DEBIT_TYPES / CREDIT_TYPES).
+    "type": ("type", "transaction type", "dr/cr", "debit/credit", "cr/dr"),
+    "category": ("category",),
+}
+
+class StatementRow(NamedTuple):
+    ts: int
+    description: str
+    # Signed: negative for money leaving the account.
+    amount_minor: int
+    category: Optional[str]
+    # Where the row starts in the file, for error messages.
+    line: int
+
+class ImportJob:
+    """Progress of one import, as reported by GET /transactions/import/{id}."""
+
+    def __init__(self, filename: str, fmt: str, expenses_are: str = "negative"):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.format = fmt
+        self.expenses_are = expenses_are
+        self.status = "queued"
+        self.rows_read = 0
+        self.rows_imported = 0
+        self.rows_skipped = 0
+        self.categorized = {"file": 0, "merchant_rules": 0, "model": 0, "uncategorized": 0}
+        self.errors: List[str] = []
+        self.errors_omitted = 0
+        self.transaction_ids: Optional[Dict[str, int]] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def error(self, line: int, message: str):
+        """A row that is skipped, with the reason."""
+        with self._lock:
+            self.rows_skipped += 1
+        self.note(f"line {line}: {message}")
+
+    def note(self, message: str):
+        with self._lock:
+            if len(self.errors) < MAX_IMPORT_ERRORS:
+                self.errors.append(message)
+            else:
+                self.errors_omitted += 1
+
+    def imported(self, first_id: int, last_id: int):
+        """Records a committed batch of transactions first_id..last_id."""
+        with self._lock:
+            self.rows_imported += last_id - first_id + 1
+            if self.transaction_ids is None:
+                self.transaction_ids = {"first": first_id, "last": last_id}
+            else:
+                self.transaction_ids["last"] = last_id
+
+    def count_category(self, source: str):
+        with self._lock:
+            self.categorized[source] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._to_dict()
+
+    def _to_dict(self) -> Dict[str, Any]:
+        finished = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "format": self.format,
+            "status": self.status,
+            "rows_read": self.rows_read,
+            "rows_imported": self.rows_imported,
+            "rows_skipped": self.rows_skipped,
+            "categorized": dict(self.categorized),
+            "transaction_ids": dict(self.transaction_ids) if self.transaction_ids else None,
+            "errors": list(self.errors),
+            "errors_omitted": self.errors_omitted,
+            "elapsed_seconds": round(finished - self.started_at, 3),
+        }
+
+# Jobs stay in _active until they finish, so polling never loses a running
+# import; only finished jobs are subject to LRU eviction.
+_active: Dict[str, ImportJob] = {}
+_finished = LRUCache(max_entries=100)
+_jobs_lock = threading.Lock()
+
+def create_job(filename: str, fmt: str, expenses_are: str = "negative") -> ImportJob:
+    job = ImportJob(filename, fmt, expenses_are)
+    with _jobs_lock:
+        _active[job.id] = job
+    return job
+
+def get_job(job_id: str) -> Optional[ImportJob]:
+    with _jobs_lock:
+        job = _active.get(job_id)
+    return job or _finished.get(job_id)
+
+def _finish_job(job: ImportJob):
+    with _jobs_lock:
+        _active.pop(job.id, None)
+        _finished.set(job.id, job)
+
+# --- Parsing ---
+
+def detect_format(filename: Optional[str], head: bytes) -> str:
+    """'csv' or 'ofx' from the file extension, falling back to the content."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in (".ofx", ".qfx"):
+        return "ofx"
+    if ext in (".csv", ".txt"):
+        return "csv"
+    sniff = head[:1024].upper()
+    if b"OFXHEADER" in sniff or b"<OFX>" in sniff:
+        return "ofx"
+    if b"," in sniff or b";" in sniff:
+        return "csv"
+    raise ValueError("Unsupported statement format; upload a CSV or OFX file.")
+
+def parse_date(text: str) -> int:
+    text = text.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return to_epoch(datetime.strptime(text, fmt))
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognised date {text!r}")
+
+_AMOUNT_JUNK = re.compile(r"[^\d.\-]")
+
+def parse_amount(text: str) -> int:
+    """Signed minor units from '1,234.50', '-$5', '(12.00)' or '12.00 DR'."""
+    raw = text.strip()
+    negative = raw.startswith("(") and raw.endswith(")") or raw.upper().endswith("DR")
+    cleaned = _AMOUNT_JUNK.sub("", raw)
+    try:
+        value = Decimal(cleaned)
+    except InvalidOperation:
+        raise ValueError(f"unrecognised amount {text!r}")
+    minor = to_minor_units(abs(value))
+    return -minor if negative or value < 0 else minor
+
+def _find_column(header: List[str], field: str) -> Optional[int]:
+    names = [h.strip().lower() for h in header]
+    for alias in CSV_COLUMNS[field]:
+        if alias in names:
+            return names.index(alias)
+    return None
+
+def parse_csv(lines: Iterable[str], job: ImportJob) -> Iterator[StatementRow]:
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header:
+        raise ValueError("The CSV file is empty.")
+    cols = {field: _find_column(header, field) for field in CSV_COLUMNS}
+    if cols["date"] is None or cols["description"] is None:
+        raise ValueError("CSV needs a date and a description column.")
+    if cols["amount"] is None and cols["debit"] is None:
+        raise ValueError("CSV needs an amount column, or debit/credit columns.")
+
+    def cell(record: List[str], field: str) -> str:
+        index = cols[field]
+        return record[index].strip() if index is not None and index < len(record) else ""
+
+    # Rows are yielded signed negative for money out whatever the file's convention.
+    flip = job.expenses_are == "positive"
+    for line_no, record in enumerate(reader, start=2):
+        if not any(field.strip() for field in record):
+            continue
+        job.rows_read += 1
+        try:
+            if cols["amount"] is None:
+                if cell(record, "debit"):
+                    amount_minor = -abs(parse_amount(cell(record, "debit")))
+                else:
+                    amount_minor = abs(parse_amount(cell(record, "credit") or "0"))
+            elif cell(record, "type").upper() in DEBIT_TYPES + CREDIT_TYPES:
+                amount_minor = abs(parse_amount(cell(record, "amount")))
+                if cell(record, "type").upper() in DEBIT_TYPES:
+                    amount_minor = -amount_minor
+            else:
+                amount_minor = parse_amount(cell(record, "amount"))
+                if flip:
+                    amount_minor = -amount_minor
+            yield StatementRow(parse_date(cell(record, "date")), cell(record, "description"),
+                               amount_minor, cell(record, "category") or None, line_no)
+        except ValueError as e:
+            job.error(line_no, str(e))
+
+_OFX_TAG = re.compile(r"<(/?)(\w+)>([^<]*)")
+
+def parse_ofx(lines: Iterable[str], job: ImportJob) -> Iterator[StatementRow]:
+    """Reads <STMTTRN> blocks from SGML (OFX 1.x) or XML (OFX 2.x) statements."""
+    fields: Optional[Dict[str, str]] = None
+    start_line = 0
+    for line_no, line in enumerate(lines, start=1):
+        for closing, tag, value in _OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN" and not closing:
+                fields, start_line = {}, line_no
+            elif tag == "STMTTRN" and fields is not None:
+                job.rows_read += 1
+                try:
+                    posted = fields.get("DTPOSTED", "")[:8]
+                    description = fields.get("NAME") or fields.get("MEMO") or fields.get("PAYEE") or ""
+                    yield StatementRow(to_epoch(datetime.strptime(posted, "%Y%m%d")), description,
+                                       parse_amount(fields.get("TRNAMT", "")), None, start_line)
+                except ValueError as e:
+                    job.error(start_line, str(e))
+                fields = None
+            elif fields is not None and not closing and value.strip():
+                fields[tag] = value.strip()
+
+# --- Running an import ---
+
+def _batches(rows: Iterable[StatementRow], size: int) -> Iterator[List[StatementRow]]:
+    batch: List[StatementRow] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _expenses(batches: Iterator[List[StatementRow]], job: ImportJob) -> Iterator[List[StatementRow]]:
+    """
+    Money leaving the account, batch by batch, as positive amounts. Credits
+    (refunds, payments in) and zero amounts are skipped, each with an error.
+    """
+    for batch in batches:
+        rows = []
+        for row in batch:
+            if row.amount_minor < 0:
+                rows.append(row._replace(amount_minor=-row.amount_minor))
+            else:
+                reason = f"credit of {row.amount_minor / 100:.2f}" if row.amount_minor else "zero amount"
+                job.error(row.line, f"{reason} skipped; only expenses are imported")
+        if rows:
+            yield rows
+
+class _Categorizer:
+    """
+    Fills in categories batch by batch, remembering merchants across batches
+    so each distinct unknown merchant reaches the classifier at most once.
+    """
+
+    def __init__(self, job: ImportJob):
+        self.job = job
+        with read_connection() as conn:
+            self.known = {r["name"].lower(): r["name"] for r in conn.execute("SELECT name FROM categories")}
+        self.by_merchant: Dict[str, Optional[str]] = {}
+        self.model_keys = set()
+        self.classified = 0
+
+    def categorize(self, rows: List[StatementRow]) -> Tuple[List[StatementRow], Dict[str, Tuple[str, str]]]:
+        """
+        Rows with their category filled in (left None where nothing placed
+        them), plus description -> (category, source) pairs worth learning as
+        merchant rules.
+        """
+        learn: Dict[str, Tuple[str, str]] = {}
+        for row in rows:
+            category = self.known.get((row.category or "").lower())
+            if category:
+                learn[row.description] = (category, "history")
+                self.by_merchant[normalize_merchant(row.description)] = category
+
+        # Merchant rules first, then one batched model call for the merchants
+        # that are still unknown, up to IMPORT_CLASSIFY_MAX_MERCHANTS per import.
+        unknown: Dict[str, str] = {}
+        for row in rows:
+            key = normalize_merchant(row.description)
+            if key not in self.by_merchant:
+                match = lookup_merchant_category(row.description) if key else None
+                self.by_merchant[key] = match["category"] if match else None
+                if not match and key:
+                    unknown.setdefault(key, row.description)
+        keys = list(unknown)[:max(0, IMPORT_CLASSIFY_MAX_MERCHANTS - self.classified)]
+        if keys:
+            self.classified += len(keys)
+            try:
+                categories = classify_descriptions([unknown[k] for k in keys], use_cache=False)
+            except Exception as e:
+                categories = []
+                self.job.note(f"classification unavailable, rows left uncategorised: {e}")
+            for key, category in zip(keys, categories):
+                if category:
+                    category = self.known.get(category.lower(), category)
+                    self.by_merchant[key] = category
+                    learn[unknown[key]] = (category, "classifier")
+                    self.model_keys.add(key)
+
+        result = []
+        for row in rows:
+            category = self.known.get((row.category or "").lower())
+            if category:
+                self.job.count_category("file")
+            else:
+                key = normalize_merchant(row.description)
+                category = self.by_merchant.get(key)
+                if category:
+                    self.job.count_category("model" if key in self.model_keys else "merchant_rules")
+                else:
+                    self.job.count_category("uncategorized")
+            result.append(row._replace(category=category))
+        return result, learn
+
+def _insert(rows: List[StatementRow], learn: Dict[str, Tuple[str, str]], job: ImportJob):
+    """Commits one batch; the job only counts it once the commit succeeded."""
+    with write_transaction() as conn:
+        conn.executemany(
+            "INSERT INTO transactions_store (ts, description, amount_minor, category, split_details) "
+            "VALUES (?, ?, ?, ?, 'None')",
+            [(row.ts, row.description, row.amount_minor, row.category) for row in rows])
+        # Categories from the statement or the classifier teach the merchant rules.
+        c = conn.cursor()
+        for description, (category, source) in learn.items():
+            learn_merchant_category(c, description, category, source=source)
+        # One writer, one transaction: the new ids are the last len(rows) ones.
+        last_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM transactions_store").fetchone()[0]
+    job.imported(last_id - len(rows) + 1, last_id)
+
+def run_import(job: ImportJob, lines: Iterable[str]):
+    """
+    Parses, categorises and inserts a statement IMPORT_BATCH_ROWS at a time,
+    updating `job` as it goes. Batches are committed separately: a failure
+    part-way keeps the batches already reported in rows_imported.
+    """
+    try:
+        # The status names the step the current batch is in.
+        job.status = "parsing"
+        parse = parse_ofx if job.format == "ofx" else parse_csv
+        categorizer = _Categorizer(job)
+        for rows in _expenses(_batches(parse(lines, job), IMPORT_BATCH_ROWS), job):
+            job.status = "categorizing"
+            rows, learn = categorizer.categorize(rows)
+            job.status = "inserting"
+            _insert(rows, learn, job)
+            job.status = "parsing"
+        job.status = "done"
+    except Exception as e:
+        job.status = "failed"
+        job.note(str(e))
+    finally:
+        job.finished_at = time.time()
+        _finish_job(job)
+
+def run_import_file(job: ImportJob, path: str):
+    """run_import over a spooled upload, deleting the file afterwards."""
+    try:
+        with open(path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+            run_import(job, f)
+    finally:
+        os.remove(path)
@@ -1,67 +1,349 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, File, HTTPException, Query, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
-from database import init_db, get_all_transactions, get_category_totals
-from agents import process_chat
+from typing import List, Dict, Any, Optional
+from database import (
+    init_db, close_pool, get_transactions, get_category_totals, get_dashboard_stats, get_spend_timeseries, TRANSACTIONS_PAGE_SIZE,
+    query_cache_stats, merchant_cache_stats, get_settle_plan, settle_all_debts,
+    get_split_debts, settle_split, data_version, format_epoch, now_epoch
+)
+from importer import EXPENSE_SIGNS, create_job, get_job, detect_format, run_import_file
+from sessions import store as chat_sessions
+from telemetry import render_metrics
+import asyncio
+import json
+import logging
 import os
+import tempfile
+import threading
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="FrugalAgent API")
 
+# --- Conditional GETs ---
+# Read endpoints are tagged with the data version. A client that sends back a
+# matching If-None-Match gets a 304 before any query runs; "no-cache" makes
+# browsers revalidate instead of trusting a stale copy.
+CONDITIONAL_GET_PREFIXES = ("/transactions", "/insights", "/stats", "/timeseries", "/debts/")
+CONDITIONAL_GET_EXCLUDED = ("/transactions/import",)
+# Their default windows (and any `period=`) are resolved against today, so the
+# answer can change at midnight without a write.
+TIME_RELATIVE_PREFIXES = ("/stats", "/timeseries")
+
+def _etag(request: Request) -> str:
+    version = data_version()
+    if request.url.path.startswith(TIME_RELATIVE_PREFIXES) or "period" in request.query_params:
+        version += "-" + format_epoch(now_epoch())[:10]
+    return f'"{version}"'
+
+def _etag_matches(header: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+@app.middleware("http")
+async def conditional_get_middleware(request: Request, call_next):
+    path = request.url.path
+    if (request.method != "GET" or not path.startswith(CONDITIONAL_GET_PREFIXES)
+            or path.startswith(CONDITIONAL_GET_EXCLUDED)):
+        return await call_next(request)
+
+    # Taken before the handler runs: a write landing mid-request leaves the
+    # response tagged older than its data, which only costs a refetch.
+    etag = _etag(request)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
+
+# Added after the conditional-GET middleware so it wraps it: the last added
+# middleware is outermost, and early 304s still get CORS headers.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], # In production, replace with specific origin
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# --- Agent runtime ---
+# agents imports google.adk and google.genai and builds the agent graph, which
+# takes seconds and a few hundred MB. None of the data endpoints need it, so it
+# is loaded on the first request that does, or in a background thread right
+# after startup unless AGENTS_WARMUP=0. /health answers either way.
+AGENTS_WARMUP = os.getenv("AGENTS_WARMUP", "1") != "0"
+
+startup_report: Dict[str, Any] = {
+    "import_seconds": None,     # importing this module
+    "startup_seconds": None,    # import + startup hooks, i.e. until requests are served
+    "agents": "cold",           # cold | loading | ready | failed
+    "agents_seconds": None,
+    "agents_error": None,
+    "max_rss_mb": {},
+}
+_agents = None
+_agents_lock = threading.Lock()
+
+def _max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return round(rss / (1024 * 1024 if rss > 1 << 32 else 1024), 1)
+
+def _load_agents():
+    global _agents
+    with _agents_lock:
+        if _agents is None:
+            startup_report["agents"] = "loading"
+            started = time.perf_counter()
+            try:
+                import agents
+            except Exception as e:
+                startup_report.update(agents="failed", agents_error=str(e))
+                raise
+            startup_report.update(agents="ready", agents_error=None,
+                                  agents_seconds=round(time.perf_counter() - started, 3))
+            startup_report["max_rss_mb"]["agents_ready"] = _max_rss_mb()
+            _agents = agents
+    return _agents
+
+async def get_agents():
+    """The agents module; the first call imports it off the event loop."""
+    if _agents is not None:
+        return _agents
+    try:
+        return await asyncio.to_thread(_load_agents)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Chat is unavailable: {e}")
+
+def _warm_agents():
+    try:
+        _load_agents()
+    except Exception:
+        pass  # Recorded in startup_report; the next chat request retries.
+
+startup_report["import_seconds"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
+
 # Initialize DB on startup
 @app.on_event("startup")
 def startup_event():
     init_db()
+    startup_report["startup_seconds"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
+    startup_report["max_rss_mb"]["startup"] = _max_rss_mb()
+    logger.info("Serving after %ss, %s MB; agents load %s.", startup_report["startup_seconds"],
+                startup_report["max_rss_mb"]["startup"], "in the background" if AGENTS_WARMUP else "on first chat")
+    if AGENTS_WARMUP:
+        threading.Thread(target=_warm_agents, name="agents-warmup", daemon=True).start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    close_pool()
 
 class ChatRequest(BaseModel):
     message: str
+    # Omit to start a new conversation; its id comes back in the response.
+    session_id: Optional[str] = None
+    # Return the turn's spans (agents, model calls, tools, SQL) with the reply.
+    trace: bool = False
 
 class ChatResponse(BaseModel):
     response: str
+    # Send back as ChatRequest.session_id to continue the conversation.
+    session_id: Optional[str] = None
+    trace: Optional[List[Dict[str, Any]]] = None
 
 @app.get("/")
 def read_root():
     return {"message": "FrugalAgent API is running"}
 
+@app.get("/health")
+def health_endpoint():
+    """Liveness; ready before the agents are. `agents` says whether chat is warm."""
+    return {"status": "ok", "agents": startup_report["agents"], "startup": startup_report}
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
+    agents = await get_agents()
     try:
-        response_text = await process_chat(request.message)
-        return {"response": response_text}
+        final = await agents.process_chat(request.message, request.session_id, request.trace)
+        return {"response": final["text"], "session_id": final.get("session_id"), "trace": final.get("trace")}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Same turn as /chat, delivered as server-sent events (see stream_chat)."""
+    agents = await get_agents()
+
+    async def events():
+        try:
+            async for event in agents.stream_chat(request.message, request.session_id, request.trace):
+                yield _sse(event)
+        except Exception as e:
+            yield _sse({"type": "error", "detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics_endpoint():
+    """Span latency histograms and token counters in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/router/stats")
+async def get_router_stats_endpoint():
+    return (await get_agents()).get_router_stats()
+
+@app.get("/cache/stats")
+def get_cache_stats_endpoint():
+    return {
+        "query_results": query_cache_stats(),
+        "merchant_lookups": merchant_cache_stats(),
+        "chat_sessions": chat_sessions.stats(),
+    }
+
 @app.get("/transactions")
-def get_transactions_endpoint():
+def get_transactions_endpoint(
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: int = Query(TRANSACTIONS_PAGE_SIZE, ge=1),
+    after_id: Optional[str] = None,
+):
+    try:
+        return get_transactions(q=q, category=category, date_from=date_from,
+                                date_to=date_to, limit=limit, after_id=after_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+IMPORT_CHUNK_BYTES = 1024 * 1024
+
+@app.post("/transactions/import", status_code=202)
+async def import_transactions_endpoint(background_tasks: BackgroundTasks, file: UploadFile = File(...),
+                                      expenses_are: str = "negative"):
+    """
+    Starts a CSV/OFX statement import; poll /transactions/import/{job_id} for progress.
+    `expenses_are` says how a CSV amount column is signed: "negative" for bank
+    exports, "positive" for card exports that list charges as positive amounts.
+    """
+    head = await file.read(1024)
+    try:
+        fmt = detect_format(file.filename, head)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if expenses_are not in EXPENSE_SIGNS:
+        raise HTTPException(status_code=400, detail=f"expenses_are must be one of {', '.join(EXPENSE_SIGNS)}.")
+
+    # Spool to disk: the upload is closed once this handler returns.
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{fmt}") as spool:
+        spool.write(head)
+        while chunk := await file.read(IMPORT_CHUNK_BYTES):
+            spool.write(chunk)
+
+    job = create_job(file.filename or "statement", fmt, expenses_are)
+    background_tasks.add_task(run_import_file, job, spool.name)
+    return job.to_dict()
+
+@app.get("/transactions/import/{job_id}")
+def get_import_job_endpoint(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown import job")
+    return job.to_dict()
+
+@app.get("/debts/settle-plan")
+def get_settle_plan_endpoint():
     try:
-        return get_all_transactions()
+        return get_settle_plan()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/debts/settle-plan")
+def settle_debts_endpoint(mark_settled: bool = False):
+    """Returns the plan; with mark_settled=true also marks the covered debts settled."""
+    try:
+        return settle_all_debts() if mark_settled else get_settle_plan()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/debts/splits/{split_id}")
+def get_split_endpoint(split_id: str):
+    debts = get_split_debts(split_id)
+    if not debts:
+        raise HTTPException(status_code=404, detail="Unknown split")
+    return debts
+
+@app.post("/debts/splits/{split_id}/settle")
+def settle_split_endpoint(split_id: str):
+    try:
+        return {"split_id": split_id, "settled_rows": settle_split(split_id)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/insights")
-def get_insights_endpoint():
+def get_insights_endpoint(
+    period: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+):
     try:
-        return get_category_totals()
+        return get_category_totals(period=period, date_from=date_from, date_to=date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/stats")
-def get_stats_endpoint():
+def get_stats_endpoint(
+    period: Optional[str] = "month",
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+):
     try:
-        from database import get_dashboard_stats
-        return get_dashboard_stats()
+        return get_dashboard_stats(period=period, date_from=date_from, date_to=date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/timeseries")
+def get_timeseries_endpoint(
+    granularity: str = "day",
+    by_category: bool = False,
+    period: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+):
+    try:
+        return get_spend_timeseries(granularity=granularity, by_category=by_category, period=period,
+                                    date_from=date_from, date_to=date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
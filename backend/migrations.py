@@ -0,0 +1,433 @@
+"""
+Versioned schema migrations for the expense database.
+
+The applied version is stored in `PRAGMA user_version`. `run_migrations()` is
+called by `database.init_db()` on startup and applies every newer migration,
+in order, inside the caller's write transaction - so a failed migration leaves
+the database untouched.
+
+Migrations are append-only: never edit one that has shipped, add a new one.
+"""
+import sqlite3
+from typing import Callable, List, Optional, Tuple
+
+Migration = Tuple[int, str, Callable[[sqlite3.Cursor], None]]
+
+MIGRATIONS: List[Migration] = []
+
+def migration(version: int, description: str):
+    """Registers the decorated function as migration `version`."""
+    def register(func: Callable[[sqlite3.Cursor], None]):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} registered out of order.")
+        MIGRATIONS.append((version, description, func))
+        return func
+    return register
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations(conn: sqlite3.Connection, target: Optional[int] = None) -> List[int]:
+    """
+    Applies all pending migrations on `conn`, which must already be inside a
+    transaction. Runs ANALYZE afterwards so the planner sees the new indexes.
+    `target` stops at that version instead of the latest, e.g. to bulk-load
+    rows before an index that a later migration builds in one pass.
+
+    Returns:
+        The versions that were applied (empty if the schema was up to date).
+    """
+    current = current_version(conn)
+    if current > latest_version():
+        raise RuntimeError(
+            f"Database schema version {current} is newer than this code "
+            f"(latest known migration is {latest_version()})."
+        )
+
+    applied = []
+    c = conn.cursor()
+    for version, _description, func in MIGRATIONS:
+        if version <= current:
+            continue
+        if target is not None and version > target:
+            break
+        func(c)
+        c.execute(f"PRAGMA user_version = {int(version)}")
+        applied.append(version)
+
+    if applied:
+        c.execute("ANALYZE")
+    return applied
+
+def _columns(c: sqlite3.Cursor, table: str) -> List[str]:
+    return [row[1] for row in c.execute(f"PRAGMA table_info({table})").fetchall()]
+
+# --- Migrations ---
+
+@migration(1, "Base tables and default categories")
+def _base_tables(c: sqlite3.Cursor):
+    c.execute('''CREATE TABLE IF NOT EXISTS transactions
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  timestamp TEXT,
+                  description TEXT,
+                  amount REAL,
+                  category TEXT,
+                  split_details TEXT)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS categories
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT UNIQUE,
+                  budget REAL)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS debts
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  debtor TEXT,
+                  creditor TEXT,
+                  amount REAL,
+                  description TEXT,
+                  timestamp TEXT,
+                  status TEXT)''')
+
+    # Databases created before debts had a status column (formerly migrate_db.py).
+    if "status" not in _columns(c, "debts"):
+        c.execute("ALTER TABLE debts ADD COLUMN status TEXT DEFAULT 'unsettled'")
+
+    c.execute("SELECT count(*) FROM categories")
+    if c.fetchone()[0] == 0:
+        defaults = [('Dining', 200), ('Groceries', 300), ('Transport', 100),
+                    ('Entertainment', 150), ('Shopping', 200), ('Bills', 500), ('Others', 100)]
+        c.executemany("INSERT INTO categories (name, budget) VALUES (?, ?)", defaults)
+
+@migration(2, "Spend rollups per category and per (category, month)")
+def _spend_rollups(c: sqlite3.Cursor):
+    month_of = "IFNULL(strftime('%Y-%m', {0}.timestamp), '')"
+
+    def delta(row: str, sign: str) -> str:
+        return f"""
+            INSERT INTO category_totals (category, total, txn_count)
+            VALUES (IFNULL({row}.category, ''), {sign}IFNULL({row}.amount, 0), {sign}1)
+            ON CONFLICT (category) DO UPDATE SET
+                total = total + excluded.total,
+                txn_count = txn_count + excluded.txn_count;
+            INSERT INTO category_month_totals (category, month, total, txn_count)
+            VALUES (IFNULL({row}.category, ''), {month_of.format(row)}, {sign}IFNULL({row}.amount, 0), {sign}1)
+            ON CONFLICT (category, month) DO UPDATE SET
+                total = total + excluded.total,
+                txn_count = txn_count + excluded.txn_count;"""
+
+    c.execute("""CREATE TABLE IF NOT EXISTS category_totals
+                 (category TEXT PRIMARY KEY,
+                  total REAL NOT NULL DEFAULT 0,
+                  txn_count INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID""")
+    c.execute("""CREATE TABLE IF NOT EXISTS category_month_totals
+                 (category TEXT NOT NULL,
+                  month TEXT NOT NULL,
+                  total REAL NOT NULL DEFAULT 0,
+                  txn_count INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (category, month)) WITHOUT ROWID""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS transactions_rollup_insert
+                  AFTER INSERT ON transactions BEGIN {delta("NEW", "")} END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS transactions_rollup_delete
+                  AFTER DELETE ON transactions BEGIN {delta("OLD", "-")} END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS transactions_rollup_update
+                  AFTER UPDATE OF amount, category, timestamp ON transactions
+                  BEGIN {delta("OLD", "-")} {delta("NEW", "")} END""")
+
+    # Backfill from existing rows.
+    c.execute("DELETE FROM category_totals")
+    c.execute("DELETE FROM category_month_totals")
+    c.execute("""INSERT INTO category_totals (category, total, txn_count)
+                 SELECT IFNULL(category, ''), IFNULL(SUM(amount), 0), COUNT(*)
+                 FROM transactions GROUP BY 1""")
+    c.execute(f"""INSERT INTO category_month_totals (category, month, total, txn_count)
+                  SELECT IFNULL(category, ''), {month_of.format('transactions')},
+                         IFNULL(SUM(amount), 0), COUNT(*)
+                  FROM transactions GROUP BY 1, 2""")
+
+@migration(3, "Indexes for category, date-range and open-debt filters")
+def _performance_indexes(c: sqlite3.Cursor):
+    # Covering index: budget/spend queries filter on category (and often a
+    # date range) and only read amount.
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_transactions_category_ts_amount
+                 ON transactions (category, timestamp, amount)""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_transactions_timestamp
+                 ON transactions (timestamp)""")
+    # "Who owes me" / "whom do I owe": creditor|debtor = 'Me' AND status = ...
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_debts_creditor_status
+                 ON debts (creditor, status, amount)""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_debts_debtor_status
+                 ON debts (debtor, status, amount)""")
+
+@migration(4, "Integer minor-unit amounts and epoch timestamps behind compatibility views")
+def _compact_storage(c: sqlite3.Cursor):
+    # Physical tables: amounts in minor units (cents), timestamps as epoch
+    # seconds of the local wall-clock time, plus a generated YYYYMM bucket.
+    c.execute("""CREATE TABLE transactions_store
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  ts INTEGER NOT NULL,
+                  description TEXT,
+                  amount_minor INTEGER NOT NULL,
+                  category TEXT,
+                  split_details TEXT,
+                  month INTEGER GENERATED ALWAYS AS
+                      (CAST(strftime('%Y%m', ts, 'unixepoch') AS INTEGER)) VIRTUAL)""")
+    c.execute("""CREATE TABLE debts_store
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  debtor TEXT,
+                  creditor TEXT,
+                  amount_minor INTEGER NOT NULL,
+                  description TEXT,
+                  ts INTEGER NOT NULL,
+                  status TEXT DEFAULT 'unsettled',
+                  month INTEGER GENERATED ALWAYS AS
+                      (CAST(strftime('%Y%m', ts, 'unixepoch') AS INTEGER)) VIRTUAL)""")
+
+    to_epoch = "CAST(IFNULL(strftime('%s', {0}), strftime('%s', 'now', 'localtime')) AS INTEGER)"
+    to_minor = "CAST(round(IFNULL({0}, 0) * 100) AS INTEGER)"
+
+    c.execute(f"""INSERT INTO transactions_store (id, ts, description, amount_minor, category, split_details)
+                  SELECT id, {to_epoch.format('timestamp')}, description, {to_minor.format('amount')},
+                         category, split_details
+                  FROM transactions""")
+    c.execute(f"""INSERT INTO debts_store (id, debtor, creditor, amount_minor, description, ts, status)
+                  SELECT id, debtor, creditor, {to_minor.format('amount')}, description,
+                         {to_epoch.format('timestamp')}, status
+                  FROM debts""")
+
+    # Keep AUTOINCREMENT from reusing ids of rows deleted before the move.
+    for old, new in (("transactions", "transactions_store"), ("debts", "debts_store")):
+        c.execute("""INSERT INTO sqlite_sequence (name, seq)
+                     SELECT ?, seq FROM sqlite_sequence WHERE name = ?
+                     AND NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)""", (new, old, new))
+        c.execute("""UPDATE sqlite_sequence
+                     SET seq = max(seq, IFNULL((SELECT seq FROM sqlite_sequence WHERE name = ?), 0))
+                     WHERE name = ?""", (old, new))
+
+    # Dropping the old tables also drops their indexes and rollup triggers.
+    c.execute("DROP TABLE transactions")
+    c.execute("DROP TABLE debts")
+
+    # Agent-facing views with the original column names and human-readable values.
+    c.execute("""CREATE VIEW transactions AS
+                 SELECT id,
+                        strftime('%Y-%m-%d %H:%M:%S', ts, 'unixepoch') AS timestamp,
+                        description,
+                        amount_minor / 100.0 AS amount,
+                        category,
+                        split_details
+                 FROM transactions_store""")
+    c.execute("""CREATE VIEW debts AS
+                 SELECT id, debtor, creditor,
+                        amount_minor / 100.0 AS amount,
+                        description,
+                        strftime('%Y-%m-%d %H:%M:%S', ts, 'unixepoch') AS timestamp,
+                        status
+                 FROM debts_store""")
+
+    # Writes through the views (UpdateManager SQL) are translated to the store.
+    # UPDATE/DELETE on a view report no changes to sqlite3, so each trigger
+    # also bumps view_write_counts for execute_sql_update_tool to read back.
+    c.execute("""CREATE TABLE view_write_counts
+                 (view_name TEXT PRIMARY KEY, n INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID""")
+    c.execute("INSERT INTO view_write_counts (view_name, n) VALUES ('transactions', 0), ('debts', 0)")
+    count = "UPDATE view_write_counts SET n = n + 1 WHERE view_name = '{0}';"
+
+    c.execute(f"""CREATE TRIGGER transactions_view_insert INSTEAD OF INSERT ON transactions BEGIN
+                    INSERT INTO transactions_store (id, ts, description, amount_minor, category, split_details)
+                    VALUES (NEW.id, {to_epoch.format('NEW.timestamp')}, NEW.description,
+                            {to_minor.format('NEW.amount')}, NEW.category, NEW.split_details);
+                    {count.format('transactions')}
+                  END""")
+    c.execute(f"""CREATE TRIGGER transactions_view_update INSTEAD OF UPDATE ON transactions BEGIN
+                    UPDATE transactions_store SET
+                        ts = {to_epoch.format('NEW.timestamp')},
+                        description = NEW.description,
+                        amount_minor = {to_minor.format('NEW.amount')},
+                        category = NEW.category,
+                        split_details = NEW.split_details
+                    WHERE id = OLD.id;
+                    {count.format('transactions')}
+                  END""")
+    c.execute(f"""CREATE TRIGGER transactions_view_delete INSTEAD OF DELETE ON transactions BEGIN
+                    DELETE FROM transactions_store WHERE id = OLD.id;
+                    {count.format('transactions')}
+                  END""")
+    c.execute(f"""CREATE TRIGGER debts_view_insert INSTEAD OF INSERT ON debts BEGIN
+                    INSERT INTO debts_store (id, debtor, creditor, amount_minor, description, ts, status)
+                    VALUES (NEW.id, NEW.debtor, NEW.creditor, {to_minor.format('NEW.amount')},
+                            NEW.description, {to_epoch.format('NEW.timestamp')},
+                            IFNULL(NEW.status, 'unsettled'));
+                    {count.format('debts')}
+                  END""")
+    c.execute(f"""CREATE TRIGGER debts_view_update INSTEAD OF UPDATE ON debts BEGIN
+                    UPDATE debts_store SET
+                        debtor = NEW.debtor,
+                        creditor = NEW.creditor,
+                        amount_minor = {to_minor.format('NEW.amount')},
+                        description = NEW.description,
+                        ts = {to_epoch.format('NEW.timestamp')},
+                        status = NEW.status
+                    WHERE id = OLD.id;
+                    {count.format('debts')}
+                  END""")
+    c.execute(f"""CREATE TRIGGER debts_view_delete INSTEAD OF DELETE ON debts BEGIN
+                    DELETE FROM debts_store WHERE id = OLD.id;
+                    {count.format('debts')}
+                  END""")
+
+    # Rollups move to integer minor units and integer YYYYMM months.
+    c.execute("DROP TABLE category_totals")
+    c.execute("DROP TABLE category_month_totals")
+    c.execute("""CREATE TABLE category_totals
+                 (category TEXT PRIMARY KEY,
+                  total_minor INTEGER NOT NULL DEFAULT 0,
+                  txn_count INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID""")
+    c.execute("""CREATE TABLE category_month_totals
+                 (category TEXT NOT NULL,
+                  month INTEGER NOT NULL,
+                  total_minor INTEGER NOT NULL DEFAULT 0,
+                  txn_count INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (category, month)) WITHOUT ROWID""")
+
+    def delta(row: str, sign: str) -> str:
+        return f"""
+            INSERT INTO category_totals (category, total_minor, txn_count)
+            VALUES (IFNULL({row}.category, ''), {sign}{row}.amount_minor, {sign}1)
+            ON CONFLICT (category) DO UPDATE SET
+                total_minor = total_minor + excluded.total_minor,
+                txn_count = txn_count + excluded.txn_count;
+            INSERT INTO category_month_totals (category, month, total_minor, txn_count)
+            VALUES (IFNULL({row}.category, ''), {row}.month, {sign}{row}.amount_minor, {sign}1)
+            ON CONFLICT (category, month) DO UPDATE SET
+                total_minor = total_minor + excluded.total_minor,
+                txn_count = txn_count + excluded.txn_count;"""
+
+    c.execute(f"""CREATE TRIGGER transactions_rollup_insert
+                  AFTER INSERT ON transactions_store BEGIN {delta("NEW", "")} END""")
+    c.execute(f"""CREATE TRIGGER transactions_rollup_delete
+                  AFTER DELETE ON transactions_store BEGIN {delta("OLD", "-")} END""")
+    c.execute(f"""CREATE TRIGGER transactions_rollup_update
+                  AFTER UPDATE OF amount_minor, category, ts ON transactions_store
+                  BEGIN {delta("OLD", "-")} {delta("NEW", "")} END""")
+
+    c.execute("""INSERT INTO category_totals (category, total_minor, txn_count)
+                 SELECT IFNULL(category, ''), SUM(amount_minor), COUNT(*)
+                 FROM transactions_store GROUP BY 1""")
+    c.execute("""INSERT INTO category_month_totals (category, month, total_minor, txn_count)
+                 SELECT IFNULL(category, ''), month, SUM(amount_minor), COUNT(*)
+                 FROM transactions_store GROUP BY 1, 2""")
+
+    # Integer range scans for our own queries; the expression index lets the
+    # planner use an index when agent SQL filters the view's text timestamp.
+    c.execute("""CREATE INDEX idx_transactions_store_category_ts_amount
+                 ON transactions_store (category, ts, amount_minor)""")
+    c.execute("CREATE INDEX idx_transactions_store_ts ON transactions_store (ts)")
+    c.execute("""CREATE INDEX idx_transactions_store_timestamp_text
+                 ON transactions_store (strftime('%Y-%m-%d %H:%M:%S', ts, 'unixepoch'))""")
+    c.execute("""CREATE INDEX idx_debts_store_creditor_status
+                 ON debts_store (creditor, status, amount_minor)""")
+    c.execute("""CREATE INDEX idx_debts_store_debtor_status
+                 ON debts_store (debtor, status, amount_minor)""")
+
+@migration(5, "Persistent merchant -> category cache")
+def _merchant_categories(c: sqlite3.Cursor):
+    # Filled by database.seed_merchant_categories() and kept current by
+    # save_transaction_tool and user category corrections.
+    c.execute("""CREATE TABLE merchant_categories
+                 (merchant TEXT PRIMARY KEY,
+                  category TEXT NOT NULL,
+                  source TEXT NOT NULL DEFAULT 'classifier',
+                  hits INTEGER NOT NULL DEFAULT 0,
+                  updated_ts INTEGER NOT NULL) WITHOUT ROWID""")
+
+@migration(6, "Split ids on debts so the edges of one group expense stay together")
+def _debt_split_ids(c: sqlite3.Cursor):
+    c.execute("ALTER TABLE debts_store ADD COLUMN split_id TEXT")
+    c.execute("CREATE INDEX idx_debts_store_split_id ON debts_store (split_id) WHERE split_id IS NOT NULL")
+
+    # Expose split_id through the debts view. Dropping the view drops its
+    # INSTEAD OF triggers, so they are recreated with the new column.
+    to_epoch = "CAST(IFNULL(strftime('%s', {0}), strftime('%s', 'now', 'localtime')) AS INTEGER)"
+    to_minor = "CAST(round(IFNULL({0}, 0) * 100) AS INTEGER)"
+    count = "UPDATE view_write_counts SET n = n + 1 WHERE view_name = 'debts';"
+
+    c.execute("DROP VIEW debts")
+    c.execute("""CREATE VIEW debts AS
+                 SELECT id, debtor, creditor,
+                        amount_minor / 100.0 AS amount,
+                        description,
+                        strftime('%Y-%m-%d %H:%M:%S', ts, 'unixepoch') AS timestamp,
+                        status,
+                        split_id
+                 FROM debts_store""")
+    c.execute(f"""CREATE TRIGGER debts_view_insert INSTEAD OF INSERT ON debts BEGIN
+                    INSERT INTO debts_store (id, debtor, creditor, amount_minor, description, ts, status, split_id)
+                    VALUES (NEW.id, NEW.debtor, NEW.creditor, {to_minor.format('NEW.amount')},
+                            NEW.description, {to_epoch.format('NEW.timestamp')},
+                            IFNULL(NEW.status, 'unsettled'), NEW.split_id);
+                    {count}
+                  END""")
+    c.execute(f"""CREATE TRIGGER debts_view_update INSTEAD OF UPDATE ON debts BEGIN
+                    UPDATE debts_store SET
+                        debtor = NEW.debtor,
+                        creditor = NEW.creditor,
+                        amount_minor = {to_minor.format('NEW.amount')},
+                        description = NEW.description,
+                        ts = {to_epoch.format('NEW.timestamp')},
+                        status = NEW.status,
+                        split_id = NEW.split_id
+                    WHERE id = OLD.id;
+                    {count}
+                  END""")
+    c.execute(f"""CREATE TRIGGER debts_view_delete INSTEAD OF DELETE ON debts BEGIN
+                    DELETE FROM debts_store WHERE id = OLD.id;
+                    {count}
+                  END""")
+
+@migration(7, "Full-text index over transaction and debt descriptions")
+def _full_text_search(c: sqlite3.Cursor):
+    # External-content FTS5 tables: the text stays in the store tables and the
+    # index holds only tokens, keyed by the store row id. Diacritics are folded
+    # ("cafe" finds "Café") and 2- and 3-character prefixes are indexed so
+    # search-as-you-type prefix queries stay index lookups.
+    options = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+    c.execute(f"""CREATE VIRTUAL TABLE transactions_fts USING fts5
+                  (description, category, content = 'transactions_store', content_rowid = 'id', {options})""")
+    c.execute(f"""CREATE VIRTUAL TABLE debts_fts USING fts5
+                  (description, content = 'debts_store', content_rowid = 'id', {options})""")
+
+    # An external-content index is updated by replaying the old row as a
+    # 'delete' command and inserting the new one.
+    for table, columns in (("transactions", ("description", "category")), ("debts", ("description",))):
+        fts, store = f"{table}_fts", f"{table}_store"
+        names = ", ".join(columns)
+        new = ", ".join(f"NEW.{column}" for column in columns)
+        old = ", ".join(f"OLD.{column}" for column in columns)
+        insert = f"INSERT INTO {fts} (rowid, {names}) VALUES (NEW.id, {new});"
+        delete = f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', OLD.id, {old});"
+        c.execute(f"CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {store} BEGIN {insert} END")
+        c.execute(f"CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {store} BEGIN {delete} END")
+        c.execute(f"CREATE TRIGGER {table}_fts_update AFTER UPDATE OF {names} ON {store} "
+                  f"BEGIN {delete} {insert} END")
+        c.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+@migration(8, "Re-key merchant_categories by leading words")
+def _merchant_prefix_keys(c: sqlite3.Cursor):
+    # Entries used to be keyed by the whole normalized description, which a
+    # new description for the same merchant rarely repeats. Learned entries are
+    # dropped and reseeded from history under the new keys on startup
+    # (database._seed_merchant_categories); user corrections are kept.
+    c.execute("DELETE FROM merchant_categories WHERE source != 'user'")
+
+@migration(9, "Track how consistently a one-word merchant key generalises")
+def _merchant_prefix_stats(c: sqlite3.Cursor):
+    # variants counts the distinct two-word keys learned under a one-word key
+    # and mixed is set once they disagree on the category. A multi-word
+    # description only falls back to its one-word key when enough variants
+    # agreed. Learned entries are reseeded with the new columns on startup.
+    c.execute("ALTER TABLE merchant_categories ADD COLUMN variants INTEGER NOT NULL DEFAULT 0")
+    c.execute("ALTER TABLE merchant_categories ADD COLUMN mixed INTEGER NOT NULL DEFAULT 0")
+    c.execute("DELETE FROM merchant_categories WHERE source != 'user'")
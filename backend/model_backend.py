@@ -0,0 +1,417 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Callable, Deque, Dict, List, Optional, Tuple
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.google_llm import Gemini
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from telemetry import current_trace, model_tokens, record_span, span
+
+# --- Model backends ---
+#
+# Every model call (the ADK agents and the batch classifier) goes through one
+# of these, picked with MODEL_BACKEND:
+#
+#   live      Gemini, as in production (default).
+#   record    Gemini, and every request/response pair is appended to
+#             MODEL_CASSETTE (JSON lines).
+#   replay    Answers from MODEL_CASSETTE without touching the network.
+#   scripted  A rule-based stand-in that drives each agent through its tools;
+#             needs neither a cassette nor an API key.
+#
+# Replay and scripted calls sleep MODEL_LATENCY_MS first, so benchmarks can
+# model a slow provider; "recorded" replays the latency measured when recording.
+# Replay matches a request by its content first. Tool results that differ
+# between runs (new row ids, timestamps) change that key, so a miss falls back
+# to the next unused recording for the same agent, in recording order. Set
+# MODEL_REPLAY_STRICT=1 to fail on such misses instead.
+
+MODEL_BACKENDS = ("live", "record", "replay", "scripted")
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "live").strip().lower()
+MODEL_CASSETTE = os.getenv("MODEL_CASSETTE", os.path.join(os.path.dirname(__file__), "model_cassette.jsonl"))
+MODEL_LATENCY_MS = os.getenv("MODEL_LATENCY_MS", "0")
+MODEL_REPLAY_STRICT = os.getenv("MODEL_REPLAY_STRICT", "0") == "1"
+
+if MODEL_BACKEND not in MODEL_BACKENDS:
+    raise ValueError(f"MODEL_BACKEND must be one of {', '.join(MODEL_BACKENDS)}, not {MODEL_BACKEND!r}.")
+
+model_backend_stats: Dict[str, int] = {
+    "calls": 0, "recorded": 0, "replayed": 0, "replayed_in_order": 0, "misses": 0, "scripted": 0,
+}
+
+class ReplayMissError(LookupError):
+    """No recording answers this request."""
+
+def needs_api_key() -> bool:
+    return MODEL_BACKEND in ("live", "record")
+
+def get_model_backend_stats() -> Dict[str, Any]:
+    return {"mode": MODEL_BACKEND, **model_backend_stats}
+
+# --- Cassette ---
+
+_cassette_lock = threading.Lock()
+_recordings: Optional[List[Dict[str, Any]]] = None
+_by_key: Dict[Tuple[str, str], Deque[int]] = {}
+_by_label: Dict[str, Deque[int]] = {}
+_used: set = set()
+
+def request_key(material: Any) -> str:
+    """Stable fingerprint of a request: sha256 of its canonical JSON."""
+    text = json.dumps(material, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+def _record(label: str, key: str, latency: float, payload: Dict[str, Any]):
+    entry = {"label": label, "key": key, "latency_ms": round(latency * 1000, 1), **payload}
+    line = json.dumps(entry, ensure_ascii=False)
+    with _cassette_lock:
+        with open(MODEL_CASSETTE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    model_backend_stats["recorded"] += 1
+
+def _load_cassette():
+    global _recordings
+    if _recordings is not None:
+        return
+    if not os.path.exists(MODEL_CASSETTE):
+        raise FileNotFoundError(f"MODEL_BACKEND=replay but cassette {MODEL_CASSETTE} does not exist; "
+                                "record one with MODEL_BACKEND=record first.")
+    recordings = []
+    with open(MODEL_CASSETTE, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                recordings.append(json.loads(line))
+    for index, entry in enumerate(recordings):
+        _by_key.setdefault((entry["label"], entry["key"]), deque()).append(index)
+        _by_label.setdefault(entry["label"], deque()).append(index)
+    _recordings = recordings
+
+def _take(queue: Optional[Deque[int]]) -> Optional[int]:
+    while queue:
+        index = queue.popleft()
+        if index not in _used:
+            _used.add(index)
+            return index
+    return None
+
+def _lookup(label: str, key: str) -> Dict[str, Any]:
+    with _cassette_lock:
+        _load_cassette()
+        index = _take(_by_key.get((label, key)))
+        if index is not None:
+            model_backend_stats["replayed"] += 1
+            return _recordings[index]
+        if not MODEL_REPLAY_STRICT:
+            index = _take(_by_label.get(label))
+            if index is not None:
+                model_backend_stats["replayed_in_order"] += 1
+                return _recordings[index]
+    model_backend_stats["misses"] += 1
+    raise ReplayMissError(f"No recording left for {label} request {key} in {MODEL_CASSETTE}.")
+
+def _latency(recorded_ms: Optional[float] = None) -> float:
+    """Seconds to wait before a replayed or scripted answer."""
+    if MODEL_LATENCY_MS == "recorded":
+        return (recorded_ms or 0) / 1000
+    return float(MODEL_LATENCY_MS) / 1000
+
+# --- Plain completions (batch classifier) ---
+
+def complete(label: str, material: Any, live: Callable[[], str], script: Callable[[], str]) -> str:
+    """
+    Text of one model completion made outside ADK, through the configured backend.
+
+    Args:
+        label: Who is asking, e.g. "BatchClassifier"; recordings are matched per label.
+        material: Everything that determines the answer (model, prompt, schema), for the replay key.
+        live: Makes the real call and returns the response text.
+        script: Returns the scripted answer.
+    """
+    model_backend_stats["calls"] += 1
+    with span("model", label):
+        return _complete(label, material, live, script)
+
+def _complete(label: str, material: Any, live: Callable[[], str], script: Callable[[], str]) -> str:
+    if MODEL_BACKEND == "live":
+        return live()
+    key = request_key(material)
+    if MODEL_BACKEND == "record":
+        started = time.perf_counter()
+        text = live()
+        _record(label, key, time.perf_counter() - started, {"text": text})
+        return text
+    if MODEL_BACKEND == "replay":
+        entry = _lookup(label, key)
+        time.sleep(_latency(entry.get("latency_ms")))
+        return entry["text"]
+    model_backend_stats["scripted"] += 1
+    time.sleep(_latency())
+    return script()
+
+# --- ADK models ---
+
+def _part_material(part: types.Part) -> Dict[str, Any]:
+    # Function call ids are random per run, so only names and payloads count.
+    if part.function_call:
+        return {"call": part.function_call.name, "args": part.function_call.args}
+    if part.function_response:
+        return {"response": part.function_response.name, "result": part.function_response.response}
+    return {"text": part.text or ""}
+
+def llm_request_key(llm_request: LlmRequest) -> str:
+    config = llm_request.config
+    system = config.system_instruction if config else None
+    if isinstance(system, types.Content):
+        system = " ".join(part.text or "" for part in system.parts or [])
+    return request_key({
+        "model": llm_request.model,
+        "system": system,
+        "tools": sorted(llm_request.tools_dict),
+        "contents": [{"role": content.role, "parts": [_part_material(part) for part in content.parts or []]}
+                     for content in llm_request.contents],
+    })
+
+def _dump_response(response: LlmResponse) -> Dict[str, Any]:
+    return json.loads(response.model_dump_json(exclude_none=True))
+
+def _load_response(data: Dict[str, Any]) -> LlmResponse:
+    return LlmResponse.model_validate_json(json.dumps(data))
+
+class _TracedModel:
+    """Times each call as a "model" span named after the agent, with its token counts."""
+
+    async def generate_content_async(self, llm_request: LlmRequest,
+                                     stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        model_backend_stats["calls"] += 1
+        # ADK runs the tools a response asks for before asking for the next
+        # response, so only time spent inside the model's generator counts.
+        started, trace, busy = time.perf_counter(), current_trace(), 0.0
+        attrs: Dict[str, Any] = {"model": self.model}
+        usage = None
+        responses = self._respond(llm_request, stream)
+        try:
+            while True:
+                resumed = time.perf_counter()
+                try:
+                    response = await responses.__anext__()
+                except StopAsyncIteration:
+                    busy += time.perf_counter() - resumed
+                    break
+                busy += time.perf_counter() - resumed
+                usage = response.usage_metadata or usage
+                if response.grounding_metadata:
+                    # google_search ran inside this call; its time is part of the span.
+                    attrs["grounded"] = True
+                yield response
+        except GeneratorExit:
+            await responses.aclose()
+            raise
+        except Exception as e:
+            record_span("model", self.label, started, trace, e, attrs, elapsed=busy)
+            raise
+        if usage:
+            attrs["prompt_tokens"] = usage.prompt_token_count or 0
+            attrs["output_tokens"] = usage.candidates_token_count or 0
+            model_tokens.inc(attrs["prompt_tokens"], agent=self.label, direction="prompt")
+            model_tokens.inc(attrs["output_tokens"], agent=self.label, direction="output")
+        record_span("model", self.label, started, trace, None, attrs, elapsed=busy)
+
+class LiveGemini(_TracedModel, Gemini):
+    label: str = ""
+
+    def _respond(self, llm_request: LlmRequest, stream: bool) -> AsyncGenerator[LlmResponse, None]:
+        return Gemini.generate_content_async(self, llm_request, stream)
+
+class RecordingGemini(LiveGemini):
+    """Gemini that appends each request key and its responses to the cassette."""
+
+    async def _respond(self, llm_request: LlmRequest, stream: bool) -> AsyncGenerator[LlmResponse, None]:
+        # Keyed before Gemini adds its own defaults, the same way replay sees it.
+        key = llm_request_key(llm_request)
+        started = time.perf_counter()
+        responses = []
+        async for response in super()._respond(llm_request, stream):
+            responses.append(_dump_response(response))
+            yield response
+        _record(self.label, key, time.perf_counter() - started, {"stream": stream, "responses": responses})
+
+class ReplayLlm(_TracedModel, BaseLlm):
+    """Serves recorded responses; never touches the network."""
+
+    label: str = ""
+
+    async def _respond(self, llm_request: LlmRequest, stream: bool) -> AsyncGenerator[LlmResponse, None]:
+        entry = _lookup(self.label, llm_request_key(llm_request))
+        await asyncio.sleep(_latency(entry.get("latency_ms")))
+        for data in entry["responses"]:
+            response = _load_response(data)
+            # Streamed recordings replayed to a non-streaming caller: only the complete answer.
+            if response.partial and not stream:
+                continue
+            yield response
+
+class ScriptedLlm(_TracedModel, BaseLlm):
+    """Rule-based stand-in: see SCRIPTS."""
+
+    label: str = ""
+
+    async def _respond(self, llm_request: LlmRequest, stream: bool) -> AsyncGenerator[LlmResponse, None]:
+        model_backend_stats["scripted"] += 1
+        await asyncio.sleep(_latency())
+        part = _scripted_part(self.label, llm_request)
+        content = types.Content(role="model", parts=[part])
+        prompt_tokens = sum(len(json.dumps(_part_material(p), default=str))
+                            for c in llm_request.contents for p in c.parts or []) // 4
+        output_tokens = len(json.dumps(_part_material(part), default=str)) // 4
+        usage = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens, candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens)
+        if stream and part.text:
+            yield LlmResponse(content=content, partial=True)
+        yield LlmResponse(content=content, usage_metadata=usage, finish_reason=types.FinishReason.STOP)
+
+def make_model(label: str, model: str = "gemini-2.5-flash-lite", **gemini_options) -> BaseLlm:
+    """
+    The model for one agent under the configured MODEL_BACKEND.
+
+    Args:
+        label: The agent's name; recordings and scripts are looked up by it.
+        model: Gemini model id. Kept by the stand-ins too, since built-in
+            tools such as google_search check it.
+        gemini_options: Passed to Gemini in live and record modes.
+    """
+    if MODEL_BACKEND == "live":
+        return LiveGemini(model=model, label=label, **gemini_options)
+    if MODEL_BACKEND == "record":
+        return RecordingGemini(model=model, label=label, **gemini_options)
+    if MODEL_BACKEND == "replay":
+        return ReplayLlm(model=model, label=label)
+    return ScriptedLlm(model=model, label=label)
+
+# --- Scripts ---
+#
+# Deterministic stand-ins for each agent: enough to push a chat turn through
+# the same agent hops, tool calls and database writes as the real model would.
+# Once a tool has answered, the agent replies with that result.
+
+SCRIPTED_CATEGORY_KEYWORDS = {
+    "Dining": ("coffee", "starbucks", "lunch", "dinner", "breakfast", "pizza", "restaurant", "cafe", "subway"),
+    "Groceries": ("grocery", "groceries", "walmart", "whole foods", "costco", "market", "milk"),
+    "Transport": ("uber", "lyft", "taxi", "cab", "fuel", "gas", "metro", "bus", "train", "parking"),
+    "Bills": ("rent", "electricity", "water", "internet", "phone", "bill"),
+    "Shopping": ("amazon", "target", "clothes", "shoes", "ikea"),
+    "Entertainment": ("netflix", "spotify", "movie", "cinema", "concert", "game"),
+    "Health": ("pharmacy", "doctor", "dentist", "gym", "medicine"),
+    "Investment": ("stock", "mutual fund", "crypto", "shares"),
+}
+_SCRIPT_AMOUNT = re.compile(r"(\d+(?:\.\d{1,2})?)")
+_SCRIPT_NAMES = re.compile(r"\bwith\s+([A-Z][a-z]+(?:(?:\s*,\s*|\s+and\s+)[A-Z][a-z]+)*)")
+_SCRIPT_UPDATE_STOPWORDS = {"change", "update", "rename", "fix", "mark", "my", "the", "latest", "last",
+                            "to", "from", "as", "of", "a", "an", "amount", "transaction", "expense"}
+
+def guess_category(text: str) -> str:
+    lowered = (text or "").lower()
+    for category, keywords in SCRIPTED_CATEGORY_KEYWORDS.items():
+        if any(keyword in lowered for keyword in keywords):
+            return category
+    return "Others"
+
+def _amount(text: str) -> float:
+    match = _SCRIPT_AMOUNT.search(text or "")
+    return float(match.group(1)) if match else 0.0
+
+def _description(text: str) -> str:
+    words = re.sub(r"[\d$.,/-]+", " ", text or "").split()
+    return " ".join(words[:6]) or "Expense"
+
+def _user_text(llm_request: LlmRequest) -> str:
+    """The request this agent was given: the first user text, minus any chat history preamble."""
+    for content in llm_request.contents:
+        if content.role == "user":
+            text = " ".join(part.text for part in content.parts or [] if part.text)
+            if text:
+                return text.rsplit("Current message:", 1)[-1].strip()
+    return ""
+
+def _all_text(llm_request: LlmRequest) -> str:
+    return "\n".join(part.text for content in llm_request.contents for part in content.parts or [] if part.text)
+
+def _script_orchestrator(llm_request: LlmRequest) -> Tuple[str, Dict[str, Any]]:
+    text = _user_text(llm_request)
+    lowered = text.lower()
+    if "settle" in lowered:
+        return "settle_up_tool", {}
+    if re.search(r"\b(split|owes?|shared?)\b|\bwith [A-Z]", text):
+        return "SplitwiseManager", {"request": text}
+    if re.search(r"\b(change|update|rename|fix|mark)\b", lowered):
+        return "UpdateManager", {"request": text}
+    if "?" in text or re.match(r"(how|what|show|list|which)\b", lowered) or not _SCRIPT_AMOUNT.search(text):
+        return "read_sql_query_tool", {"query": "SELECT category, SUM(amount) AS spent FROM transactions "
+                                                "GROUP BY category ORDER BY spent DESC"}
+    return "LogExpensePipeline", {"request": text}
+
+def _script_classifier(llm_request: LlmRequest) -> str:
+    text = _user_text(llm_request)
+    return json.dumps({"category": guess_category(text), "description": _description(text)})
+
+def _script_saver(llm_request: LlmRequest) -> Tuple[str, Dict[str, Any]]:
+    text = _user_text(llm_request)
+    category = guess_category(text)
+    match = re.search(r'\{[^{}]*"category"[^{}]*\}', _all_text(llm_request))
+    if match:
+        try:
+            category = json.loads(match.group(0)).get("category") or category
+        except json.JSONDecodeError:
+            pass
+    return "save_transaction_tool", {"description": _description(text), "amount": _amount(text),
+                                     "category": category}
+
+def _script_splitwise(llm_request: LlmRequest) -> Tuple[str, Dict[str, Any]]:
+    text = _user_text(llm_request)
+    match = _SCRIPT_NAMES.search(text)
+    names = re.split(r"\s*,\s*|\s+and\s+", match.group(1)) if match else ["Friend"]
+    return "record_group_debts", {"creditors": "Me", "debtors": ", ".join(["Me", *names]),
+                                  "total_amount": _amount(text), "description": _description(text)}
+
+def _script_update(llm_request: LlmRequest) -> Tuple[str, Dict[str, Any]]:
+    words = [word for word in re.findall(r"[A-Za-z]+", _user_text(llm_request))
+             if word.lower() not in _SCRIPT_UPDATE_STOPWORDS]
+    if words:
+        return "search_records_tool", {"keywords": " ".join(words[:3]), "kind": "transactions",
+                                       "order": "recent"}
+    return "read_sql_query_tool", {"query": "SELECT id, timestamp, description, amount, category "
+                                            "FROM transactions ORDER BY id DESC LIMIT 5"}
+
+SCRIPTS: Dict[str, Callable[[LlmRequest], Any]] = {
+    "ExpenseOrchestrator": _script_orchestrator,
+    "CategoryClassifier": _script_classifier,
+    "TransactionSaver": _script_saver,
+    "SplitwiseManager": _script_splitwise,
+    "UpdateManager": _script_update,
+}
+
+def _scripted_part(label: str, llm_request: LlmRequest) -> types.Part:
+    last = llm_request.contents[-1] if llm_request.contents else None
+    results = [part.function_response for part in (last.parts or [])
+               if part.function_response] if last else []
+    if results:
+        text = "\n".join(str((result.response or {}).get("result", result.response)) for result in results)
+        return types.Part(text=text)
+
+    script = SCRIPTS.get(label)
+    answer = script(llm_request) if script else _user_text(llm_request)
+    if isinstance(answer, tuple):
+        name, args = answer
+        if name in llm_request.tools_dict:
+            return types.Part(function_call=types.FunctionCall(name=name, args=args))
+        answer = _user_text(llm_request)
+    return types.Part(text=answer)
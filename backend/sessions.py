@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from cache import LRUCache
+
+# --- Limits ---
+MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "500"))
+SESSION_IDLE_TTL = float(os.getenv("CHAT_SESSION_IDLE_TTL", str(60 * 60)))
+SESSION_MEMORY_BUDGET = int(os.getenv("CHAT_SESSION_MEMORY_BUDGET", str(16 * 1024 * 1024)))
+MAX_TURNS_PER_SESSION = int(os.getenv("CHAT_MAX_TURNS_PER_SESSION", "20"))
+PROMPT_TURN_MAX_CHARS = 600
+_TURN_OVERHEAD_BYTES = 64
+
+# --- Compaction ---
+# Verbatim turns are kept while they fit this many (estimated) tokens; older
+# ones are folded into a one-line summary each, plus the ids they saved.
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "800"))
+MIN_VERBATIM_TURNS = 2
+SUMMARY_MAX_LINES = 12
+SUMMARY_LINE_CHARS = 80
+FACT_IDS_KEPT = 25
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return (len(text) + 3) // 4
+
+def _clip(text: str, limit: int = PROMPT_TURN_MAX_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+class Turn(NamedTuple):
+    user: str
+    assistant: str
+    # Rows this turn saved, e.g. {"transactions": [12], "debts": [4, 5]}.
+    saved: Dict[str, List[int]]
+
+    def render(self) -> str:
+        return f"User: {_clip(self.user)}\nAssistant: {_clip(self.assistant)}"
+
+    def summarize(self) -> str:
+        line = f"{_clip(self.user, SUMMARY_LINE_CHARS)} -> {_clip(self.assistant, SUMMARY_LINE_CHARS)}"
+        ids = _format_ids(self.saved)
+        return f"{line} [{ids}]" if ids else line
+
+def _format_ids(saved: Dict[str, List[int]]) -> str:
+    return "; ".join(
+        f"{kind} " + ", ".join(f"#{i}" for i in ids) for kind, ids in saved.items() if ids
+    )
+
+class ChatSession:
+    """
+    History for one chat session: recent turns verbatim, older turns as a
+    bounded summary plus the ids of the rows they saved.
+    """
+
+    def __init__(self, session_id: str, token_budget: int = HISTORY_TOKEN_BUDGET):
+        self.session_id = session_id
+        self.token_budget = token_budget
+        self.turns: List[Turn] = []
+        self.summary: List[str] = []
+        self.saved: Dict[str, List[int]] = {}
+        self.compacted_turns = 0
+        # Tokens the uncompacted history would have cost, for instrumentation.
+        self.full_history_tokens = 0
+        self.created_at = time.time()
+        self.last_active = self.created_at
+
+    def add_turn(self, user_text: str, assistant_text: str, saved: Optional[Dict[str, List[int]]] = None):
+        turn = Turn(user_text, assistant_text, {k: list(v) for k, v in (saved or {}).items() if v})
+        self.turns.append(turn)
+        self.full_history_tokens += estimate_tokens(turn.render())
+        self.last_active = time.time()
+        self.compact()
+
+    def history_tokens(self) -> int:
+        return sum(estimate_tokens(turn.render()) for turn in self.turns)
+
+    def compact(self) -> int:
+        """Folds the oldest turns into the summary until the rest fit the budget."""
+        folded = 0
+        while len(self.turns) > MIN_VERBATIM_TURNS and (
+            len(self.turns) > MAX_TURNS_PER_SESSION or self.history_tokens() > self.token_budget
+        ):
+            turn = self.turns.pop(0)
+            self.summary.append(turn.summarize())
+            for kind, ids in turn.saved.items():
+                self.saved[kind] = (self.saved.get(kind, []) + ids)[-FACT_IDS_KEPT:]
+            folded += 1
+        del self.summary[:-SUMMARY_MAX_LINES]
+        self.compacted_turns += folded
+        return folded
+
+    def size_bytes(self) -> int:
+        turns = sum(len(t.user) + len(t.assistant) + _TURN_OVERHEAD_BYTES for t in self.turns)
+        return turns + sum(len(line) for line in self.summary) + _TURN_OVERHEAD_BYTES
+
+    def build_prompt(self, message: str) -> str:
+        """
+        Prepends the compacted history to the new message so each model call
+        sees a roughly constant amount of context, never the full history.
+        """
+        lines = []
+        if self.summary:
+            lines.append("Earlier in this conversation (summary, oldest first):")
+            lines.extend(f"- {line}" for line in self.summary)
+        saved = _format_ids(self.saved)
+        if saved:
+            lines.append(f"Records saved earlier in this conversation: {saved}.")
+        if self.turns:
+            lines.append("Recent conversation (oldest first):")
+            lines.extend(turn.render() for turn in self.turns)
+        if not lines:
+            return message
+        lines.append("")
+        lines.append(f"Current message: {message}")
+        return "\n".join(lines)
+
+class SessionStore:
+    """
+    Bounded map of session id -> ChatSession.
+
+    Sessions are evicted least-recently-used beyond `max_sessions`, after
+    `idle_ttl` seconds without a turn, and whenever their combined size
+    exceeds `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        idle_ttl: float = SESSION_IDLE_TTL,
+        max_bytes: int = SESSION_MEMORY_BUDGET,
+    ):
+        self._sessions = LRUCache(
+            max_entries=max_sessions, ttl=idle_ttl, max_bytes=max_bytes,
+            sizeof=lambda session: session.size_bytes(),
+        )
+        self._lock = threading.Lock()
+        self.prompts_built = 0
+        self.prompt_tokens = 0
+        self.tokens_saved = 0
+
+    def get(self, session_id: Optional[str]) -> ChatSession:
+        """
+        The session for `session_id`, created if unknown. Without an id a new
+        session with a fresh id is started, never a shared one; the caller
+        returns that id so the client can continue the conversation.
+        """
+        session_id = session_id or uuid.uuid4().hex
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChatSession(session_id)
+                self._sessions.set(session_id, session)
+            return session
+
+    def build_prompt(self, session: ChatSession, message: str) -> str:
+        prompt = session.build_prompt(message)
+        tokens = estimate_tokens(prompt)
+        with self._lock:
+            self.prompts_built += 1
+            self.prompt_tokens += tokens
+            self.tokens_saved += max(0, session.full_history_tokens + estimate_tokens(message) - tokens)
+        return prompt
+
+    def record_turn(self, session: ChatSession, user_text: str, assistant_text: str,
+                    saved: Optional[Dict[str, List[int]]] = None):
+        session.add_turn(user_text, assistant_text, saved)
+        # Re-set so the cache re-measures the session and restarts its idle clock.
+        self._sessions.set(session.session_id, session)
+
+    def drop(self, session_id: str):
+        self._sessions.pop(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._sessions.stats(),
+            "prompts_built": self.prompts_built,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.prompts_built, 1) if self.prompts_built else 0.0,
+            "tokens_saved": self.tokens_saved,
+        }
+
+store = SessionStore()
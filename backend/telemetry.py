@@ -0,0 +1,250 @@
+import bisect
+import contextvars
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# --- Tracing ---
+#
+# A span times one unit of work: a chat turn, an agent run, a model call, a
+# tool call or a SQL statement. Every span feeds the frugal_span_seconds
+# histogram served on /metrics; while collect_trace() is active (a chat
+# request with trace=true) spans are also kept, in start order, for the reply.
+#
+# Spans are flat: each records when it started relative to the trace, so
+# nesting is read from the intervals rather than tracked with parent ids.
+
+SPAN_KINDS = ("chat", "agent", "model", "tool", "sql")
+# Seconds. SQL statements land in the low buckets, model calls in the high ones.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TRACE_MAX_SPANS = 500
+
+# --- Metrics ---
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str]):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text format."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [count per bucket (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        self.observe_key(value, tuple(labels[label] for label in self.labels))
+
+    def observe_key(self, value: float, key: Tuple[str, ...]):
+        """observe() with the label values already in `labels` order."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, float("inf")), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _number(bound)
+                    lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+def _number(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(round(value, 6))
+
+span_seconds = Histogram("frugal_span_seconds", "Duration of traced work by kind and name.", ["kind", "name"])
+span_errors = Counter("frugal_span_errors_total", "Spans that ended with an exception.", ["kind", "name"])
+model_tokens = Counter("frugal_model_tokens_total", "Model tokens by agent and direction.",
+                       ["agent", "direction"])
+
+_metrics: List[Any] = [span_seconds, span_errors, model_tokens]
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --- Spans and traces ---
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.dropped = 0
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return sorted(self.spans, key=lambda span: span["start_ms"])
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+class Span:
+    """A started span; call end() exactly once, or use span() instead."""
+
+    __slots__ = ("kind", "name", "attrs", "started", "trace")
+
+    def __init__(self, kind: str, name: str, **attrs: Any):
+        self.kind, self.name, self.attrs = kind, name, attrs
+        self.trace = _trace.get()
+        self.started = time.perf_counter()
+
+    def end(self, error: Optional[BaseException] = None):
+        record_span(self.kind, self.name, self.started, self.trace, error, self.attrs)
+
+def record_span(kind: str, name: str, started: float, trace: Optional[Trace],
+                error: Optional[BaseException] = None, attrs: Optional[Dict[str, Any]] = None,
+                elapsed: Optional[float] = None):
+    """
+    Ends a span that began at `started` (perf_counter) without a Span object.
+    `elapsed` overrides the duration for work that was paused in between.
+    """
+    if elapsed is None:
+        elapsed = time.perf_counter() - started
+    span_seconds.observe_key(elapsed, (kind, name))
+    if error is not None:
+        span_errors.inc(kind=kind, name=name)
+        attrs = {**(attrs or {}), "error": type(error).__name__}
+    if trace is None:
+        return
+    if len(trace.spans) >= TRACE_MAX_SPANS:
+        trace.dropped += 1
+        return
+    trace.spans.append({
+        "kind": kind, "name": name,
+        "start_ms": round((started - trace.started) * 1000, 3),
+        "duration_ms": round(elapsed * 1000, 3),
+        **(attrs or {}),
+    })
+
+@contextmanager
+def span(kind: str, name: str, **attrs: Any):
+    """Times the block; yields the attrs dict so the block can add to it (e.g. token counts)."""
+    current = Span(kind, name, **attrs)
+    try:
+        yield current.attrs
+    except GeneratorExit:
+        # A consumer that stops reading early (e.g. a generator closed after
+        # its final item) is not a failure.
+        current.end()
+        raise
+    except BaseException as e:
+        current.end(e)
+        raise
+    current.end()
+
+@contextmanager
+def collect_trace():
+    """
+    Keeps every span that ends inside the block (in this context and in work it
+    hands to threads via contextvars) on the yielded Trace.
+    """
+    trace = Trace()
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _trace.reset(token)
+        except ValueError:
+            # Reset from another context (an async generator closed elsewhere).
+            _trace.set(None)
+
+# --- SQLite ---
+#
+# Pooled connections use these factories, so every statement run through
+# execute/executemany is a "sql" span named after its verb and main table,
+# e.g. "SELECT transactions_store". Rows fetched after execute() returns are
+# not included; the agent's read_sql_query_tool is timed whole as a tool span.
+
+_VERB = re.compile(r"^\s*([a-z]+)", re.IGNORECASE)
+_TABLE = re.compile(r"\b(?:from|into|update)\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+_DDL_VERBS = {"CREATE", "DROP", "ALTER"}
+_labels_cache: Dict[str, str] = {}
+
+def statement_label(sql: str) -> str:
+    label = _labels_cache.get(sql)
+    if label is None:
+        verb = _VERB.match(sql)
+        verb = verb.group(1).upper() if verb else "SQL"
+        # Schema changes run once per migration; their object names would only add series.
+        table = None if verb in _DDL_VERBS else _TABLE.search(sql)
+        label = f"{verb} {table.group(1)}" if table else verb
+        if len(_labels_cache) < 4096:
+            _labels_cache[sql] = label
+    return label
+
+class TracedCursor(sqlite3.Cursor):
+    # Inlined rather than `with span(...)`: these run for every statement.
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        except Exception as e:
+            record_span("sql", statement_label(sql), started, _trace.get(), e)
+            raise
+        record_span("sql", statement_label(sql), started, _trace.get())
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+        except Exception as e:
+            record_span("sql", statement_label(sql), started, _trace.get(), e)
+            raise
+        record_span("sql", statement_label(sql), started, _trace.get())
+        return result
+
+class TracedConnection(sqlite3.Connection):
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -2,6 +2,8 @@
 
 import React, { useEffect, useState, useMemo } from 'react';
 import axios from 'axios';
+import { DateRange } from 'react-day-picker';
+import { windowParams } from './date-range-picker';
 import { PieChart, Pie, Cell, Label } from 'recharts';
 import { Card, CardContent, CardHeader, CardTitle, CardDescription, CardFooter } from "@/components/ui/card"
 import {
@@ -29,13 +31,13 @@ const CHART_COLORS = [
     "hsl(var(--chart-1))", // Repeat if necessary or add more
 ];
 
-export function Dashboard({ refreshTrigger }: { refreshTrigger: number }) {
+export function Dashboard({ refreshTrigger, date }: { refreshTrigger: number; date?: DateRange }) {
     const [data, setData] = useState<CategoryTotal[]>([]);
 
     useEffect(() => {
         const fetchData = async () => {
             try {
-                const res = await axios.get('http://localhost:8000/insights');
+                const res = await axios.get('http://localhost:8000/insights', { params: windowParams(date) });
                 // Assign colors to data
                 const processedData = res.data.map((item: any, index: number) => ({
                     ...item,
@@ -47,7 +49,7 @@ export function Dashboard({ refreshTrigger }: { refreshTrigger: number }) {
             }
         };
         fetchData();
-    }, [refreshTrigger]);
+    }, [refreshTrigger, date]);
 
     const totalSpent = useMemo(() => {
         return data.reduce((acc, curr) => acc + curr.total, 0);
@@ -73,7 +75,7 @@ export function Dashboard({ refreshTrigger }: { refreshTrigger: number }) {
         <Card className="flex flex-col h-full shadow-md border-0 bg-card/50">
             <CardHeader className="items-center pb-0">
                 <CardTitle>Spending by Category</CardTitle>
-                <CardDescription>Current Month</CardDescription>
+                <CardDescription>{date?.from ? windowParams(date).from + ' to ' + windowParams(date).to : 'Current Month'}</CardDescription>
             </CardHeader>
             <CardContent className="flex-1 pb-0">
                 {data.length === 0 ? (
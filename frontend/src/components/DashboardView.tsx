@@ -2,15 +2,20 @@ import React, { useEffect, useState } from 'react';
 import axios from 'axios';
 import { Dashboard } from './Dashboard';
 import { TransactionList } from './TransactionList';
+import { SpendingTrend } from './SpendingTrend';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs"
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card"
 import { DollarSign, CreditCard, Activity, Wallet } from 'lucide-react';
+import { DateRange } from 'react-day-picker';
+import { DatePickerWithRange, windowParams } from './date-range-picker';
 
 interface DashboardStats {
     total_spent: number;
     budget: number;
     remaining: number;
     active_debts: number;
+    from?: string | null;
+    to?: string | null;
 }
 
 export function DashboardView({ refreshTrigger }: { refreshTrigger: number }) {
@@ -20,18 +25,19 @@ export function DashboardView({ refreshTrigger }: { refreshTrigger: number }) {
         remaining: 0,
         active_debts: 0
     });
+    const [date, setDate] = useState<DateRange | undefined>(undefined);
 
     useEffect(() => {
         const fetchStats = async () => {
             try {
-                const res = await axios.get('http://localhost:8000/stats');
+                const res = await axios.get('http://localhost:8000/stats', { params: windowParams(date) });
                 setStats(res.data);
             } catch (error) {
                 console.error("Error fetching stats:", error);
             }
         };
         fetchStats();
-    }, [refreshTrigger]);
+    }, [refreshTrigger, date]);
 
     const formatCurrency = (amount: number) => {
         return new Intl.NumberFormat('en-US', {
@@ -45,7 +51,7 @@ export function DashboardView({ refreshTrigger }: { refreshTrigger: number }) {
             <div className="flex items-center justify-between space-y-2">
                 <h2 className="text-3xl font-bold tracking-tight">Dashboard</h2>
                 <div className="flex items-center space-x-2">
-                    {/* Date Range Picker could go here */}
+                    <DatePickerWithRange date={date} setDate={setDate} />
                 </div>
             </div>
             <Tabs defaultValue="overview" className="space-y-4">
@@ -63,7 +69,9 @@ export function DashboardView({ refreshTrigger }: { refreshTrigger: number }) {
                             </CardHeader>
                             <CardContent>
                                 <div className="text-2xl font-bold">{formatCurrency(stats.total_spent)}</div>
-                                <p className="text-xs text-muted-foreground">Total expenses</p>
+                                <p className="text-xs text-muted-foreground">
+                                    {stats.from ? `${stats.from} to ${stats.to ?? 'now'}` : 'All time'}
+                                </p>
                             </CardContent>
                         </Card>
                         <Card>
@@ -103,7 +111,7 @@ export function DashboardView({ refreshTrigger }: { refreshTrigger: number }) {
                     </div>
                     <div className="grid gap-4 md:grid-cols-2 lg:grid-cols-7">
                         <div className="col-span-4">
-                            <Dashboard refreshTrigger={refreshTrigger} />
+                            <Dashboard refreshTrigger={refreshTrigger} date={date} />
                         </div>
                         <div className="col-span-3">
                             <TransactionList refreshTrigger={refreshTrigger} />
@@ -113,9 +121,7 @@ export function DashboardView({ refreshTrigger }: { refreshTrigger: number }) {
                 <TabsContent value="analytics" className="space-y-4">
                     <div className="grid gap-4 md:grid-cols-2 lg:grid-cols-7">
                         <div className="col-span-7">
-                            <Card className="h-[400px] flex items-center justify-center text-muted-foreground">
-                                Analytics View Placeholder
-                            </Card>
+                            <SpendingTrend refreshTrigger={refreshTrigger} date={date} />
                         </div>
                     </div>
                 </TabsContent>
@@ -0,0 +1,117 @@
+"use client"
+
+import React, { useEffect, useMemo, useState } from 'react';
+import axios from 'axios';
+import { Bar, BarChart, CartesianGrid, XAxis, YAxis } from 'recharts';
+import { DateRange } from 'react-day-picker';
+import { windowParams } from './date-range-picker';
+import { Card, CardContent, CardHeader, CardTitle, CardDescription } from "@/components/ui/card"
+import { Button } from "@/components/ui/button"
+import {
+    ChartContainer,
+    ChartTooltip,
+    ChartTooltipContent,
+    ChartLegend,
+    ChartLegendContent,
+    type ChartConfig,
+} from "@/components/ui/chart"
+
+type Granularity = "day" | "week" | "month";
+
+// Columnar shape returned by /timeseries.
+interface TimeSeries {
+    granularity: Granularity;
+    timestamps: string[];
+    series: Record<string, number[]>;
+}
+
+const CHART_COLORS = [
+    "hsl(var(--chart-1))",
+    "hsl(var(--chart-2))",
+    "hsl(var(--chart-3))",
+    "hsl(var(--chart-4))",
+    "hsl(var(--chart-5))",
+];
+
+export function SpendingTrend({ refreshTrigger, date }: { refreshTrigger: number; date?: DateRange }) {
+    const [granularity, setGranularity] = useState<Granularity>("day");
+    const [data, setData] = useState<TimeSeries | null>(null);
+
+    useEffect(() => {
+        const fetchData = async () => {
+            try {
+                // Without a picked range the backend returns the last few buckets.
+                const params = { granularity, by_category: true, ...(date?.from ? windowParams(date) : {}) };
+                const res = await axios.get('http://localhost:8000/timeseries', { params });
+                setData(res.data);
+            } catch (error) {
+                console.error("Error fetching time series:", error);
+            }
+        };
+        fetchData();
+    }, [refreshTrigger, date, granularity]);
+
+    // Recharts wants rows; pivot the columns once per response.
+    const rows = useMemo(() => {
+        if (!data) return [];
+        return data.timestamps.map((timestamp, i) => {
+            const row: Record<string, string | number> = { timestamp };
+            for (const [name, values] of Object.entries(data.series)) {
+                row[name] = values[i];
+            }
+            return row;
+        });
+    }, [data]);
+
+    const chartConfig = useMemo(() => {
+        const config: ChartConfig = {};
+        Object.keys(data?.series ?? {}).forEach((name, index) => {
+            config[name] = { label: name, color: CHART_COLORS[index % CHART_COLORS.length] };
+        });
+        return config;
+    }, [data]);
+
+    return (
+        <Card className="shadow-md border-0 bg-card/50">
+            <CardHeader className="flex flex-row items-center justify-between">
+                <div>
+                    <CardTitle>Spending Over Time</CardTitle>
+                    <CardDescription>Per {granularity}, split by category</CardDescription>
+                </div>
+                <div className="flex gap-1">
+                    {(["day", "week", "month"] as Granularity[]).map((g) => (
+                        <Button
+                            key={g}
+                            size="sm"
+                            variant={g === granularity ? "default" : "outline"}
+                            onClick={() => setGranularity(g)}
+                            className="h-7 text-xs capitalize"
+                        >
+                            {g}
+                        </Button>
+                    ))}
+                </div>
+            </CardHeader>
+            <CardContent>
+                {rows.length === 0 ? (
+                    <div className="h-[300px] flex items-center justify-center text-muted-foreground">
+                        No data available
+                    </div>
+                ) : (
+                    <ChartContainer config={chartConfig} className="h-[300px] w-full">
+                        <BarChart data={rows}>
+                            <CartesianGrid vertical={false} />
+                            <XAxis dataKey="timestamp" tickLine={false} axisLine={false} minTickGap={24} />
+                            <YAxis tickLine={false} axisLine={false} width={48} />
+                            <ChartTooltip content={<ChartTooltipContent />} />
+                            <ChartLegend content={<ChartLegendContent />} />
+                            {Object.keys(data?.series ?? {}).map((name) => (
+                                <Bar key={name} dataKey={name} stackId="spend" fill={chartConfig[name]?.color} />
+                            ))}
+                        </BarChart>
+                    </ChartContainer>
+                )}
+            </CardContent>
+        </Card>
+    );
+}
@@ -6,6 +6,7 @@ import { ScrollArea } from "@/components/ui/scroll-area"
 import { Input } from "@/components/ui/input"
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select"
 import { Avatar, AvatarFallback } from "@/components/ui/avatar"
+import { Button } from "@/components/ui/button"
 
 
 interface Transaction {
@@ -17,48 +18,71 @@ interface Transaction {
     split_details?: string;
 }
 
+interface TransactionPage {
+    items: Transaction[];
+    next_cursor: string | null;
+}
+
+const PAGE_SIZE = 50;
+
 export function TransactionList({ refreshTrigger }: { refreshTrigger: number }) {
     const [transactions, setTransactions] = useState<Transaction[]>([]);
-    const [filteredTransactions, setFilteredTransactions] = useState<Transaction[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [searchQuery, setSearchQuery] = useState("");
+    const [debouncedQuery, setDebouncedQuery] = useState("");
     const [categoryFilter, setCategoryFilter] = useState("all");
     const [categories, setCategories] = useState<string[]>([]);
 
+    // Wait for the user to stop typing before hitting the server.
+    useEffect(() => {
+        const timer = setTimeout(() => setDebouncedQuery(searchQuery.trim()), 300);
+        return () => clearTimeout(timer);
+    }, [searchQuery]);
+
+    const fetchPage = async (cursor: string | null): Promise<TransactionPage> => {
+        const params: Record<string, string | number> = { limit: PAGE_SIZE };
+        if (debouncedQuery) params.q = debouncedQuery;
+        if (categoryFilter && categoryFilter !== "all") params.category = categoryFilter;
+        if (cursor) params.after_id = cursor;
+        const res = await axios.get('http://localhost:8000/transactions', { params });
+        return res.data;
+    };
+
     useEffect(() => {
         const fetchData = async () => {
             try {
-                const res = await axios.get('http://localhost:8000/transactions');
-                const data: Transaction[] = res.data;
-                setTransactions(data);
-                setFilteredTransactions(data);
-
-                // Extract unique categories
-                const uniqueCategories = Array.from(new Set(data.map(t => t.category)));
-                setCategories(uniqueCategories);
+                const page = await fetchPage(null);
+                setTransactions(page.items);
+                setNextCursor(page.next_cursor);
             } catch (error) {
                 console.error("Error fetching transactions:", error);
             }
         };
         fetchData();
-    }, [refreshTrigger]);
+    }, [refreshTrigger, debouncedQuery, categoryFilter]);
 
     useEffect(() => {
-        let result = transactions;
-
-        if (searchQuery) {
-            const query = searchQuery.toLowerCase();
-            result = result.filter(t =>
-                t.description.toLowerCase().includes(query) ||
-                t.category.toLowerCase().includes(query)
-            );
-        }
+        const fetchCategories = async () => {
+            try {
+                const res = await axios.get('http://localhost:8000/insights');
+                setCategories(res.data.map((c: { category: string }) => c.category));
+            } catch (error) {
+                console.error("Error fetching categories:", error);
+            }
+        };
+        fetchCategories();
+    }, [refreshTrigger]);
 
-        if (categoryFilter && categoryFilter !== "all") {
-            result = result.filter(t => t.category === categoryFilter);
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        try {
+            const page = await fetchPage(nextCursor);
+            setTransactions(prev => [...prev, ...page.items]);
+            setNextCursor(page.next_cursor);
+        } catch (error) {
+            console.error("Error fetching transactions:", error);
         }
-
-        setFilteredTransactions(result);
-    }, [searchQuery, categoryFilter, transactions]);
+    };
 
     const getInitials = (name: string) => {
         return name.substring(0, 2).toUpperCase();
@@ -69,7 +93,7 @@ export function TransactionList({ refreshTrigger }: { refreshTrigger: number })
             <CardHeader>
                 <CardTitle>Recent Transactions</CardTitle>
                 <CardDescription>
-                    You made {filteredTransactions.length} transactions this month.
+                    Showing {transactions.length}{nextCursor ? "+" : ""} transactions.
                 </CardDescription>
                 <div className="flex gap-2 mt-2">
                     <div className="relative flex-1">
@@ -100,13 +124,13 @@ export function TransactionList({ refreshTrigger }: { refreshTrigger: number })
             <CardContent className="flex-1 overflow-hidden p-0">
                 <ScrollArea className="h-[400px] px-6">
                     <div className="space-y-8 pb-6">
-                        {filteredTransactions.length === 0 ? (
+                        {transactions.length === 0 ? (
                             <div className="flex flex-col items-center justify-center py-8 text-muted-foreground space-y-2">
                                 <Search className="h-8 w-8 opacity-20" />
                                 <p>No transactions found.</p>
                             </div>
                         ) : (
-                            filteredTransactions.map((t) => (
+                            transactions.map((t) => (
                                 <div key={t.id} className="flex items-center">
                                     <Avatar className="h-9 w-9">
                                         <AvatarFallback className="bg-primary/10 text-primary font-medium text-xs">
@@ -125,6 +149,11 @@ export function TransactionList({ refreshTrigger }: { refreshTrigger: number })
                                 </div>
                             ))
                         )}
+                        {nextCursor && (
+                            <Button variant="ghost" className="w-full" onClick={loadMore}>
+                                Load more
+                            </Button>
+                        )}
                     </div>
                 </ScrollArea>
             </CardContent>
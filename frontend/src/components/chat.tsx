@@ -15,6 +15,7 @@ import { Avatar, AvatarFallback, AvatarImage } from "@/components/ui/avatar"
 interface Message {
     role: "user" | "assistant"
     content: string
+    status?: string
 }
 
 interface ChatProps {
@@ -28,6 +29,20 @@ export function Chat({ onTransactionComplete }: ChatProps) {
     const [input, setInput] = React.useState("")
     const [isLoading, setIsLoading] = React.useState(false)
     const scrollAreaRef = React.useRef<HTMLDivElement>(null)
+    // Stable per-browser id so the backend keeps this user's history separate.
+    const sessionIdRef = React.useRef<string | null>(null)
+
+    const getSessionId = () => {
+        if (!sessionIdRef.current) {
+            let id = window.localStorage.getItem("frugal-chat-session")
+            if (!id) {
+                id = crypto.randomUUID()
+                window.localStorage.setItem("frugal-chat-session", id)
+            }
+            sessionIdRef.current = id
+        }
+        return sessionIdRef.current
+    }
 
     const scrollToBottom = () => {
         if (scrollAreaRef.current) {
@@ -50,25 +65,72 @@ export function Chat({ onTransactionComplete }: ChatProps) {
         setInput("")
         setIsLoading(true)
 
+        // Placeholder assistant message that the stream fills in as events arrive.
+        setMessages(prev => [...prev, { role: "assistant", content: "" }])
+        const updateReply = (patch: (msg: Message) => Message) => {
+            setMessages(prev => {
+                const next = [...prev]
+                next[next.length - 1] = patch(next[next.length - 1])
+                return next
+            })
+        }
+
         try {
-            const response = await fetch("http://127.0.0.1:8000/chat", {
+            const response = await fetch("http://127.0.0.1:8000/chat/stream", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ message: userMessage.content }),
+                body: JSON.stringify({ message: userMessage.content, session_id: getSessionId() }),
             })
 
-            if (!response.ok) throw new Error("Failed to fetch response")
+            if (!response.ok || !response.body) throw new Error("Failed to fetch response")
+
+            const reader = response.body.getReader()
+            const decoder = new TextDecoder()
+            let buffer = ""
+            let streamed = ""
+
+            while (true) {
+                const { done, value } = await reader.read()
+                if (done) break
+                buffer += decoder.decode(value, { stream: true })
 
-            const data = await response.json()
-            const botMessage: Message = { role: "assistant", content: data.response }
-            setMessages(prev => [...prev, botMessage])
+                // SSE frames are separated by a blank line; keep any trailing partial frame.
+                const frames = buffer.split("\n\n")
+                buffer = frames.pop() ?? ""
+                for (const frame of frames) {
+                    const data = frame.split("\n").find(line => line.startsWith("data: "))
+                    if (!data) continue
+                    const event = JSON.parse(data.slice(6))
+
+                    switch (event.type) {
+                        case "text":
+                            streamed += event.text
+                            updateReply(msg => ({ ...msg, content: streamed }))
+                            break
+                        case "tool_call":
+                            updateReply(msg => ({ ...msg, status: `Running ${event.name}...` }))
+                            break
+                        case "tool_result":
+                            // Text streamed before a tool call was intermediate; the next
+                            // model turn starts over.
+                            streamed = ""
+                            updateReply(msg => ({ ...msg, status: `Finished ${event.name}` }))
+                            break
+                        case "final":
+                            updateReply(msg => ({ ...msg, content: event.text, status: undefined }))
+                            break
+                        case "error":
+                            throw new Error(event.detail)
+                    }
+                }
+            }
 
             if (onTransactionComplete) {
                 onTransactionComplete();
             }
         } catch (error) {
             console.error(error)
-            setMessages(prev => [...prev, { role: "assistant", content: "Sorry, I encountered an error. Please try again." }])
+            updateReply(() => ({ role: "assistant", content: "Sorry, I encountered an error. Please try again." }))
         } finally {
             setIsLoading(false)
         }
@@ -105,7 +167,7 @@ export function Chat({ onTransactionComplete }: ChatProps) {
             <div className="flex-1 relative min-h-0">
                 <ScrollArea className="h-full absolute inset-0 p-4" ref={scrollAreaRef}>
                     <div className="flex flex-col gap-6 pb-4">
-                        {messages.map((msg, index) => (
+                        {messages.map((msg, index) => (msg.content || msg.status) && (
                             <div
                                 key={index}
                                 className={cn(
@@ -144,11 +206,14 @@ export function Chat({ onTransactionComplete }: ChatProps) {
                                         >
                                             {msg.content}
                                         </ReactMarkdown>
+                                        {msg.status && (
+                                            <p className="text-xs text-muted-foreground italic mt-1">{msg.status}</p>
+                                        )}
                                     </div>
                                 </div>
                             </div>
                         ))}
-                        {isLoading && (
+                        {isLoading && !messages[messages.length - 1]?.status && !messages[messages.length - 1]?.content && (
                             <div className="flex gap-3 mr-auto max-w-[80%]">
                                 <Avatar className="w-8 h-8 border shadow-sm mt-1">
                                     <AvatarFallback className="bg-primary/10 text-primary"><Bot className="w-4 h-4" /></AvatarFallback>
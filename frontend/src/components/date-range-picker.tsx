@@ -14,6 +14,15 @@ import {
     PopoverTrigger,
 } from "@/components/ui/popover"
 
+// Query params for the /stats and /insights window: the picked range, or the current month.
+export function windowParams(date: DateRange | undefined): Record<string, string> {
+    if (!date?.from) return { period: "month" }
+    return {
+        from: format(date.from, "yyyy-MM-dd"),
+        to: format(date.to ?? date.from, "yyyy-MM-dd"),
+    }
+}
+
 interface DatePickerWithRangeProps {
     className?: string
     date: DateRange | undefined
@@ -1,36 +1,28 @@
-import sqlite3
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import database
+from migrations import MIGRATIONS, current_version
 
 DB_FILE = "expense.db"
 
-def migrate():
-    print(f"Checking {DB_FILE} schema...")
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # Check if debts table exists
-    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='debts'")
-    if not c.fetchone():
-        print("Debts table does not exist. It will be created by init_db.")
-        conn.close()
-        return
+def migrate(db_file: str = DB_FILE):
+    print(f"Checking {db_file} schema...")
+    database.DB_FILE = db_file
+    with database.read_connection() as conn:
+        before = current_version(conn)
+    print(f"Current schema version: {before}")
+
+    applied = database.init_db()
+    descriptions = {version: description for version, description, _ in MIGRATIONS}
+    for version in applied:
+        print(f"Applied migration {version}: {descriptions[version]}")
+    if not applied:
+        print("Schema is already up to date.")
 
-    # Check columns in debts table
-    c.execute("PRAGMA table_info(debts)")
-    columns = [row[1] for row in c.fetchall()]
-    print(f"Current columns in debts: {columns}")
-    
-    if "status" not in columns:
-        print("Adding 'status' column to debts table...")
-        try:
-            c.execute("ALTER TABLE debts ADD COLUMN status TEXT DEFAULT 'unsettled'")
-            conn.commit()
-            print("Column added successfully.")
-        except Exception as e:
-            print(f"Error adding column: {e}")
-    else:
-        print("'status' column already exists.")
-        
-    conn.close()
+    database.close_pool()
 
 if __name__ == "__main__":
-    migrate()
+    migrate(sys.argv[1] if len(sys.argv) > 1 else DB_FILE)